@@ -1,149 +1,192 @@
-from flask import Flask, request, jsonify
-from groq import Groq
-import requests
-import json
-import time
+from flask import Flask, jsonify
 from flask_cors import CORS
-import asyncio
 from dotenv import load_dotenv
-import os
+from functools import wraps
 from flask_bcrypt import Bcrypt
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from pymongo import MongoClient
-from bson import ObjectId
-from datetime import timedelta, datetime
-import warnings
-import jwt as pyjwt
-import logging
-import time
-import pandas as pd
-from uuid import uuid4
-from langchain_huggingface import HuggingFaceEmbeddings
-from pinecone import Pinecone, ServerlessSpec
-import random
-from scrape_web import scrape
-from auth import register, login
+from scrape_web import start_scraper, stop_scraper
+from scrape_cache import scrape_cache
+from result_cache import result_cache
+from llm_cache import llm_cache
+from compact_catalog import start_schedule, COMPACTION_INTERVAL_HOURS
+import host_policy
+import atexit
+from services import Services
+from auth import register, login, configure_jwt
 from favourites import add_fav, get_fav, remove_fav
 from recommendations import recommend_from_db, getrecommendations, recommend_from_web, gethistory
-from recommendations import remove_conversation
+from recommendations import remove_conversation, recommend_from_db_stream, recommend_from_web_stream
 
 load_dotenv()
 
 
-# Initialize the Groq client
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-PINECONE_API_KEY=os.getenv("PINECONE_API_KEY")
-client = Groq(api_key=GROQ_API_KEY)
-
-# Initialize the Flask app
-app = Flask(__name__)
-CORS(app)
-bcrypt = Bcrypt(app)
-
-# Configure the JWT
-app.config['JWT_SECRET_KEY'] = 'ProductRecommendationSystemProjectKMIT'
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
-jwt = JWTManager(app)
-
-
-mongo_client = MongoClient('mongodb://localhost:27017/')
-db = mongo_client['product-recommendation-system']
-users_collection = db['users']
-tags_collection = db['tags']
-history_collection = db['conversation_history']
-
-pc = Pinecone(api_key=PINECONE_API_KEY)
-# Define and initialize the Pinecone index
-index_name = "products"
-if not pc.has_index(index_name):
-    pc.create_index(
-        name=index_name,
-        dimension=768,
-        metric="cosine",
-        spec=ServerlessSpec(
-            cloud='aws', 
-            region='us-east-1'
-        ) 
-    )
-while not pc.describe_index(index_name).status['ready']:
-    time.sleep(1)
-
-vector_store = pc.Index(index_name)
-embeddings = HuggingFaceEmbeddings()
-SIMILARITY_THRESHOLD = 0.2
-
-
-
-@app.route('/userregister', methods=['POST'])
-def user_register():
-    return register(users_collection)
-
-@app.route('/userlogin', methods=['POST'])
-def user_login():
-    return login(users_collection)
-
-
-
-
-@app.route('/add_favourite', methods=['POST'])
-def add_favo():
-    """
-    Add a favorited product to the user's document in the tags_collection.
-    """
-    return add_fav(tags_collection)
-
-@app.route('/get_favourites', methods=['POST'])
-def get_favo():
+def create_app(start=True):
     """
-    Retrieve the list of favorited products for a user.
+    Builds the Flask app. With start, it also warms up its dependencies in
+    the background and starts the scraper and the compaction schedule, so
+    serve it through the factory, e.g. `gunicorn "app:create_app()"`.
+    Importing this module starts nothing.
     """
-    return get_fav(tags_collection)
+    # Initialize the Flask app
+    app = Flask(__name__)
+    CORS(app)
+    Bcrypt(app)
+
+    # Configure the JWT
+    configure_jwt(app)
+
+    services = Services()
+    app.extensions['services'] = services
+    if start:
+        services.start()
+        # Every worker starts it, only the one holding the schedule lock runs passes
+        if COMPACTION_INTERVAL_HOURS > 0:
+            start_schedule(lambda: services.vector_store)
+        # Start the pooled scraper session once per process and close it on shutdown
+        start_scraper()
+        atexit.register(stop_scraper)
+
+    def requires(*names):
+        """
+        Answers 503 until the dependencies a route needs are warm.
+        """
+        def decorator(route):
+            @wraps(route)
+            def wrapper(*args, **kwargs):
+                if not services.is_ready(*names):
+                    return jsonify({"message": "Service is starting up, please retry shortly"}), 503
+                return route(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @app.route('/healthz', methods=['GET'])
+    def healthz():
+        """
+        Liveness: the process is up and serving requests.
+        """
+        return jsonify({"status": "ok"}), 200
+
+    @app.route('/readyz', methods=['GET'])
+    def readyz():
+        """
+        Readiness: every dependency is warm.
+        """
+        body = {"ready": services.is_ready(), "dependencies": services.ready, "errors": services.errors}
+        return jsonify(body), 200 if body["ready"] else 503
+
+    @app.route('/userregister', methods=['POST'])
+    @requires("mongo")
+    def user_register():
+        return register(services.users_collection)
+
+    @app.route('/userlogin', methods=['POST'])
+    @requires("mongo")
+    def user_login():
+        return login(services.users_collection)
+
+    @app.route('/add_favourite', methods=['POST'])
+    @requires("mongo")
+    def add_favo():
+        """
+        Add a favorited product to the user's document in the tags_collection.
+        """
+        return add_fav(services.tags_collection)
+
+    @app.route('/get_favourites', methods=['POST'])
+    @requires("mongo")
+    def get_favo():
+        """
+        Retrieve the list of favorited products for a user.
+        """
+        return get_fav(services.tags_collection)
+
+    @app.route('/remove_favourite', methods=['POST'])
+    @requires("mongo")
+    def remove_favo():
+        """
+        Remove a favorited product from the user's list.
+        """
+        return remove_fav(services.tags_collection)
+
+    @app.route('/clear_chat_history', methods=['POST'])
+    @requires("mongo")
+    def clear_chat_history():
+        """
+        Clear the conversation history for a user.
+        """
+        return remove_conversation(services.history_collection)
+
+    @app.route('/recommend_from_db', methods=['POST'])
+    @requires()
+    def recommendfromdb():
+        """
+        Handles the /recommend route. Accepts a query from the user,
+        generates product recommendations using Groq, and fetches
+        details for each product tag.
+        """
+        # Get the user query from the request
+        return recommend_from_db(services.tags_collection, services.history_collection,
+                                 services.embeddings, services.vector_store, services.client)
+
+    @app.route('/get_recommendations', methods=['POST'])
+    @requires("mongo", "vector_store", "embeddings")
+    def get_recommendations():
+        return getrecommendations(services.users_collection, services.tags_collection,
+                                  services.embeddings, services.vector_store)
+
+    @app.route('/recommend', methods=['POST'])
+    @requires()
+    def recommend():
+        """
+        Handles the /recommend route. Accepts a query from the user,
+        generates product recommendations using Groq, and fetches
+        details for each product tag.
+        """
+        return recommend_from_web(services.tags_collection, services.history_collection,
+                                  services.embeddings, services.vector_store, services.client)
+
+    @app.route('/recommend_from_db_stream', methods=['POST'])
+    @requires()
+    def recommendfromdb_stream():
+        """
+        Like /recommend_from_db, streamed as Server-Sent Events.
+        """
+        return recommend_from_db_stream(services.tags_collection, services.history_collection,
+                                        services.embeddings, services.vector_store, services.client)
+
+    @app.route('/recommend_stream', methods=['POST'])
+    @requires()
+    def recommend_stream():
+        """
+        Like /recommend, streamed as Server-Sent Events.
+        """
+        return recommend_from_web_stream(services.tags_collection, services.history_collection,
+                                         services.embeddings, services.vector_store, services.client)
+
+    @app.route('/get_history', methods=['POST'])
+    @requires("mongo")
+    def get_history():
+        """
+        Retrieves the conversation history for a user.
+        """
+        return gethistory(services.history_collection)
+
+    @app.route('/stats', methods=['GET'])
+    def stats():
+        """
+        Returns hit, miss and staleness counters for the server caches
+        and the circuit breaker state of each retailer.
+        """
+        return jsonify({
+            "scrape_cache": scrape_cache.stats(),
+            "embedding_cache": services.embeddings.stats() if services.embeddings else None,
+            "result_cache": result_cache.stats(),
+            "llm_cache": llm_cache.stats(),
+            "llm": services.client.stats() if services.client else None,
+            "retailers": host_policy.stats()
+        }), 200
+
+    return app
 
-@app.route('/remove_favourite', methods=['POST'])
-def remove_favo():
-    """
-    Remove a favorited product from the user's list.
-    """
-    return remove_fav(tags_collection)
-
-@app.route('/clear_chat_history', methods=['POST'])
-def clear_chat_history():
-    """
-    Clear the conversation history for a user.
-    """
-    return remove_conversation(history_collection)
-
-
-@app.route('/recommend_from_db', methods=['POST'])
-def recommendfromdb():
-    """
-    Handles the /recommend route. Accepts a query from the user,
-    generates product recommendations using Groq, and fetches
-    details for each product tag.
-    """
-    # Get the user query from the request
-    return recommend_from_db(tags_collection, history_collection, embeddings, vector_store ,client)
-
-@app.route('/get_recommendations', methods=['POST'])
-def get_recommendations():
-    return getrecommendations(users_collection, tags_collection ,embeddings, vector_store)
-
-
-@app.route('/recommend', methods=['POST'])
-def recommend():
-    """
-    Handles the /recommend route. Accepts a query from the user,
-    generates product recommendations using Groq, and fetches
-    details for each product tag.
-    """
-    return recommend_from_web(tags_collection, history_collection, embeddings, vector_store, client)
-
-@app.route('/get_history', methods=['POST'])
-def get_history():
-    """
-    Retrieves the conversation history for a user.
-    """
-    return gethistory(history_collection)
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
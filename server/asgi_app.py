@@ -0,0 +1,175 @@
+"""
+The API as an ASGI app, served with e.g. `hypercorn asgi_app:app`.
+
+Same routes and responses as app.py. Mongo (Motor), the LLM gateway
+(AsyncGroq) and scraping are awaited on one event loop, so slow Groq
+streams and SSE clients don't each hold a worker thread.
+"""
+from quart import Quart, jsonify
+from quart_cors import cors
+from functools import wraps
+from scrape_web import scraper
+from scrape_cache import scrape_cache
+from result_cache import result_cache
+from llm_cache import llm_cache
+from compact_catalog import start_schedule, COMPACTION_INTERVAL_HOURS
+import host_policy
+from services import Services, MONGO_URI, MONGO_TIMEOUT_MS
+from app import create_app
+from async_handlers import register, login, add_fav, get_fav, remove_fav, remove_conversation, gethistory
+from async_handlers import recommend_from_db, getrecommendations, recommend_from_web
+from async_handlers import recommend_from_db_stream, recommend_from_web_stream
+
+
+class AsyncServices(Services):
+    """
+    Services with the async LLM gateway and Motor collections.
+    """
+
+    def _init_llm(self):
+        from llm_gateway import create_async_gateway
+        self.client = create_async_gateway()
+
+    def _init_mongo(self):
+        from motor.motor_asyncio import AsyncIOMotorClient
+        self.mongo_client = AsyncIOMotorClient(MONGO_URI, serverSelectionTimeoutMS=MONGO_TIMEOUT_MS)
+        # Warm-up runs off the event loop, ping through the synchronous client Motor wraps
+        self.mongo_client.delegate.admin.command('ping')
+        db = self.mongo_client['product-recommendation-system']
+        self.users_collection = db['users']
+        self.tags_collection = db['tags']
+        self.history_collection = db['conversation_history']
+
+
+def create_asgi_app(start=True):
+    """
+    Builds the Quart app. With start, serving it also warms up its
+    dependencies in the background and starts the compaction schedule;
+    building or importing it starts nothing.
+    """
+    app = cors(Quart(__name__))
+
+    services = AsyncServices()
+    app.extensions['services'] = services
+    # Tokens are signed in the Flask app's context, with its JWT settings
+    jwt_app = create_app(start=False)
+
+    @app.before_serving
+    async def start_services():
+        if start:
+            services.start()
+            # Every worker starts it, only the one holding the schedule lock runs passes
+            if COMPACTION_INTERVAL_HOURS > 0:
+                start_schedule(lambda: services.vector_store)
+        # The pooled scraper session lives on the serving loop
+        await scraper.attach()
+
+    @app.after_serving
+    async def close_scraper():
+        await scraper.detach()
+
+    def requires(*names):
+        """
+        Answers 503 until the dependencies a route needs are warm.
+        """
+        def decorator(route):
+            @wraps(route)
+            async def wrapper(*args, **kwargs):
+                if not services.is_ready(*names):
+                    return jsonify({"message": "Service is starting up, please retry shortly"}), 503
+                return await route(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @app.route('/healthz', methods=['GET'])
+    async def healthz():
+        return jsonify({"status": "ok"}), 200
+
+    @app.route('/readyz', methods=['GET'])
+    async def readyz():
+        body = {"ready": services.is_ready(), "dependencies": services.ready, "errors": services.errors}
+        return jsonify(body), 200 if body["ready"] else 503
+
+    @app.route('/userregister', methods=['POST'])
+    @requires("mongo")
+    async def user_register():
+        return await register(services.users_collection, jwt_app)
+
+    @app.route('/userlogin', methods=['POST'])
+    @requires("mongo")
+    async def user_login():
+        return await login(services.users_collection, jwt_app)
+
+    @app.route('/add_favourite', methods=['POST'])
+    @requires("mongo")
+    async def add_favo():
+        return await add_fav(services.tags_collection)
+
+    @app.route('/get_favourites', methods=['POST'])
+    @requires("mongo")
+    async def get_favo():
+        return await get_fav(services.tags_collection)
+
+    @app.route('/remove_favourite', methods=['POST'])
+    @requires("mongo")
+    async def remove_favo():
+        return await remove_fav(services.tags_collection)
+
+    @app.route('/clear_chat_history', methods=['POST'])
+    @requires("mongo")
+    async def clear_chat_history():
+        return await remove_conversation(services.history_collection)
+
+    @app.route('/recommend_from_db', methods=['POST'])
+    @requires()
+    async def recommendfromdb():
+        return await recommend_from_db(services.tags_collection, services.history_collection,
+                                       services.embeddings, services.vector_store, services.client)
+
+    @app.route('/get_recommendations', methods=['POST'])
+    @requires("mongo", "vector_store", "embeddings")
+    async def get_recommendations():
+        return await getrecommendations(services.users_collection, services.tags_collection,
+                                        services.embeddings, services.vector_store)
+
+    @app.route('/recommend', methods=['POST'])
+    @requires()
+    async def recommend():
+        return await recommend_from_web(services.tags_collection, services.history_collection,
+                                        services.embeddings, services.vector_store, services.client)
+
+    @app.route('/recommend_from_db_stream', methods=['POST'])
+    @requires()
+    async def recommendfromdb_stream():
+        return await recommend_from_db_stream(services.tags_collection, services.history_collection,
+                                              services.embeddings, services.vector_store, services.client)
+
+    @app.route('/recommend_stream', methods=['POST'])
+    @requires()
+    async def recommend_stream():
+        return await recommend_from_web_stream(services.tags_collection, services.history_collection,
+                                               services.embeddings, services.vector_store, services.client)
+
+    @app.route('/get_history', methods=['POST'])
+    @requires("mongo")
+    async def get_history():
+        return await gethistory(services.history_collection)
+
+    @app.route('/stats', methods=['GET'])
+    async def stats():
+        return jsonify({
+            "scrape_cache": scrape_cache.stats(),
+            "embedding_cache": services.embeddings.stats() if services.embeddings else None,
+            "result_cache": result_cache.stats(),
+            "llm_cache": llm_cache.stats(),
+            "llm": services.client.stats() if services.client else None,
+            "retailers": host_policy.stats()
+        }), 200
+
+    return app
+
+
+app = create_asgi_app()
+
+if __name__ == '__main__':
+    app.run()
@@ -0,0 +1,428 @@
+"""
+Route handlers for the ASGI app (asgi_app.py).
+
+They take the same requests and give the same responses as the handlers
+in auth.py, favourites.py and recommendations.py, but with Motor
+collections and an AsyncLLMGateway. Only the I/O is theirs: request
+checks come from validation.py, and the Mongo updates, response bodies
+and the handling of the reply's events from the Flask handlers' modules.
+Mongo, the Groq stream and scraping are awaited on the event loop, so a
+request waiting on any of them costs no thread. The embedding model, the
+vector index and password hashing still block, so they run on thread pools.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from quart import request, jsonify, Response
+from validation import read_registration, read_credentials, read_email, read_favourite, read_removal
+from validation import read_query, read_recommendation_request
+from auth import bcrypt, issue_token, hash_password, user_document, registered, logged_in
+from favourites import FAVOURITES, add_favourite, remove_favourite
+from llm_cache import llm_cache
+from llm_gateway import LLMTimeout
+from history_manager import aconversation_history, schedule_async_summary
+from scrape_web import iter_scrape_many
+from recommendations import (
+    QUERY_DEADLINE, RECOMMENDATION_TAGS, query_pool, ingest_pool, findItems, find_items_many, ingest_results,
+    RecommendationRun, StreamedReply, conversation_update, tags_update, tags_trim, unique_items, select_unique,
+    db_search_results, web_search_results, db_messages, web_messages, web_result, stream_completion, sse
+)
+
+# Threads for the embedding model outside of vector lookups, e.g. the LLM cache's query embedding
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", 4))
+
+embedding_pool = ThreadPoolExecutor(max_workers=EMBEDDING_WORKERS, thread_name_prefix="embedding")
+
+
+def offload(pool, fn, *args):
+    return asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+
+async def cache_lookup(kind, user_query, history_messages, embeddings):
+    """
+    llm_cache.lookup, answered on the loop when the reply is cached locally
+    for the exact query; only Redis and the query's embedding need a thread.
+    """
+    found = llm_cache.exact(kind, user_query, history_messages)
+    if found is not None:
+        return found
+    return await offload(embedding_pool, llm_cache.lookup, kind, user_query, history_messages, embeddings)
+
+
+async def register(users_collection, jwt_app):
+    """
+    jwt_app is the Flask app whose JWT settings sign the token.
+    """
+    data = await request.get_json()
+    fields, error = read_registration(data)
+    if error:
+        return jsonify(error), 400
+    name, email, password = fields
+
+    if await users_collection.find_one({"email": email}):
+        return jsonify({"message": "User Already Exists"}), 400
+
+    # bcrypt is slow on purpose, keep it off the loop
+    new_user = user_document(name, email, await asyncio.to_thread(hash_password, password))
+    await users_collection.insert_one(new_user)
+    access_token = issue_token(jwt_app, {"email": email})
+    return jsonify(registered(new_user, access_token)), 201
+
+
+async def login(users_collection, jwt_app):
+    data = await request.get_json()
+    fields, error = read_credentials(data)
+    if error:
+        return jsonify(error), 400
+    email, password = fields
+
+    user = await users_collection.find_one({"email": email})
+    if not user:
+        return jsonify({"message": "User Not Registered"}), 400
+
+    if not await asyncio.to_thread(bcrypt.check_password_hash, user['password'], password):
+        return jsonify({"message": "Invalid Credentials"}), 400
+
+    access_token = issue_token(jwt_app, {"email": email})
+    return jsonify(logged_in(user, access_token)), 200
+
+
+async def add_fav(tags_collection):
+    data = await request.get_json()
+    fields, error = read_favourite(data)
+    if error:
+        return jsonify(error), 400
+    email, product = fields
+
+    await tags_collection.update_one({"email": email}, add_favourite(product))
+    updated_user = await tags_collection.find_one({"email": email}, FAVOURITES)
+    if updated_user:
+        return jsonify({
+            "message": "Product favorited successfully!",
+            "fav_products": updated_user.get("fav_products", [])
+        }), 200
+    return jsonify({"message": "Error updating favorites"}), 500
+
+
+async def get_fav(tags_collection):
+    data = await request.get_json()
+    email, error = read_email(data)
+    if error:
+        return jsonify(error), 400
+
+    user_data = await tags_collection.find_one({"email": email}, FAVOURITES)
+    if not user_data:
+        return jsonify({"message": "No data found for the provided email"}), 404
+
+    return jsonify({
+        "message": "Favorited products retrieved successfully!",
+        "fav_products": user_data.get("fav_products", [])
+    }), 200
+
+
+async def remove_fav(tags_collection):
+    data = await request.get_json()
+    fields, error = read_removal(data)
+    if error:
+        return jsonify(error), 400
+    email, product_url = fields
+
+    result = await tags_collection.update_one({"email": email}, remove_favourite(product_url))
+    if result.modified_count > 0:
+        updated_user = await tags_collection.find_one({"email": email}, FAVOURITES)
+        return jsonify({
+            "message": "Product removed successfully!",
+            "fav_products": updated_user.get("fav_products", [])
+        }), 200
+    return jsonify({"message": "Product not found or already removed"}), 404
+
+
+async def save_conversation(email, query, bot_response, tags, search_results, history_collection):
+    await history_collection.update_one(*conversation_update(email, query, bot_response, tags, search_results),
+                                        upsert=True)
+
+
+async def remove_conversation(history_collection):
+    data = await request.get_json()
+    await history_collection.delete_one({"email": data.get('email', '')})
+    return jsonify({"message": "Conversation history deleted successfully"}), 200
+
+
+async def gethistory(history_collection):
+    email, error = read_email(await request.get_json())
+    if error:
+        return jsonify(error), 400
+
+    history_entries = await history_collection.find({"email": email}, {"_id": 0}).to_list(length=None)
+    return jsonify({"history": history_entries}), 200
+
+
+async def add_tags(email, tags, tags_collection):
+    await tags_collection.update_one({"email": email}, tags_update(tags))
+    trim = tags_trim(await tags_collection.find_one({"email": email}, {"tags": 1}))
+    if trim is not None:
+        await tags_collection.update_one({"email": email}, trim)
+    print("Tags updated successfully")
+
+
+async def getrecommendations(users_collection, tags_collection, embeddings, vector_store):
+    fields, error = read_recommendation_request(await request.get_json())
+    if error:
+        return jsonify(error), 400
+    email, filters = fields
+
+    if not await users_collection.find_one({"email": email}):
+        return jsonify({"message": "Oops something went wrong!"}), 400
+
+    existing_user = await tags_collection.find_one({"email": email})
+    if not existing_user:
+        await tags_collection.insert_one({"email": email, "tags": []})
+        return jsonify({"result": []}), 200
+
+    user_tags = existing_user.get('tags', [])[:RECOMMENDATION_TAGS]
+    if not user_tags:
+        return jsonify({"result": []}), 200
+
+    # find_items_many waits on query_pool itself, so it can't run there
+    items_by_tag = await asyncio.to_thread(find_items_many, user_tags, 3, embeddings, vector_store, QUERY_DEADLINE,
+                                           filters)
+    return jsonify({"result": unique_items(user_tags, items_by_tag)}), 200
+
+
+async def replay(text):
+    yield text
+
+
+async def recommendation_events(client, messages, submit, deadline=None, cached=None):
+    """
+    recommendations.recommendation_events on the event loop: submit returns
+    an awaitable, and lookups still running when the deadline passes are
+    reported with None.
+    """
+    run = RecommendationRun(submit, cached, start=asyncio.ensure_future)
+    text = run.cached_text()
+    texts = replay(text) if text is not None else stream_completion(client, messages)
+    try:
+        async for text in texts:
+            for event in run.feed(text):
+                yield event
+        reply, tags = run.finish()
+        entry = run.to_store(reply, tags)
+        if entry is not None:
+            # May write to Redis
+            await offload(None, cached.store, *entry)
+        yield "reply", reply
+
+        tasks = {run.started[tag]: tag for tag in tags}
+        pending = set(tasks)
+        ends_at = None if deadline is None else time.monotonic() + deadline
+        while pending:
+            timeout = None if ends_at is None else max(ends_at - time.monotonic(), 0)
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                try:
+                    value = task.result()
+                except Exception as e:
+                    print(f"Error retrieving '{tasks[task]}': {e}")
+                    value = None
+                yield "search_result", (tasks[task], value)
+        for task in pending:
+            print(f"Lookup for '{tasks[task]}' missed the {deadline}s deadline")
+            yield "search_result", (tasks[task], None)
+    finally:
+        run.cancel()
+
+
+async def collect_recommendation(client, messages, submit, deadline=None, cached=None):
+    reply = {}
+    values = {}
+    async for kind, value in recommendation_events(client, messages, submit, deadline, cached):
+        if kind == "reply":
+            reply = value
+        elif kind == "search_result":
+            values[value[0]] = value[1]
+    return reply, values
+
+
+def lookup_items(embeddings, vector_store, filters=None):
+    def submit(tag):
+        # The embedding model and the index block, findItems runs both on a query thread
+        return offload(query_pool, findItems, tag, 3, embeddings, vector_store, filters)
+    return submit
+
+
+# Scrapes and ingestions in flight, they outlive the request when its deadline passes
+search_tasks = set()
+
+
+def keep(task):
+    search_tasks.add(task)
+    task.add_done_callback(search_tasks.discard)
+    return task
+
+
+class AsyncProductSearch:
+    """
+    recommendations.ProductSearch on the event loop the scraper is attached
+    to: the tags are scraped by a single iter_scrape_many on that loop, and
+    only their ingestion runs on the shared ingest_pool, so a request
+    waiting on the retailers costs no thread.
+    """
+
+    def __init__(self, embeddings, vector_store, filters=None):
+        self.embeddings = embeddings
+        self.vector_store = vector_store
+        self.filters = filters
+        self.futures = {}
+        self.queue = asyncio.Queue()
+        self.task = None
+        self.closed = False
+
+    def __call__(self, tag):
+        future = asyncio.get_running_loop().create_future()
+        self.futures[tag] = future
+        if self.task is None:
+            self.task = keep(asyncio.ensure_future(self._scrape()))
+        self.queue.put_nowait(tag)
+        return future
+
+    def close(self):
+        """
+        Ends the scrape once the submitted tags are done, they are still ingested.
+        """
+        if self.task is not None and not self.closed:
+            self.closed = True
+            self.queue.put_nowait(None)
+
+    async def _scrape(self):
+        try:
+            async for tag, products in iter_scrape_many(self.queue):
+                keep(asyncio.ensure_future(self._ingest(tag, products)))
+        except Exception as e:
+            print(f"Error fetching the products!: {e}")
+            for future in list(self.futures.values()):
+                self._resolve(future, {"error": str(e)})
+
+    async def _ingest(self, tag, products):
+        try:
+            value = await offload(ingest_pool, ingest_results, products, self.embeddings, self.vector_store,
+                                  self.filters)
+        except Exception as e:
+            print(f"Error adding the products!: {e}")
+            value = {"error": str(e)}
+        self._resolve(self.futures[tag], value)
+
+    def _resolve(self, future, value):
+        # Cancelled by recommendation_events, or already resolved
+        if not future.done():
+            future.set_result(value)
+
+
+def lookup_products(embeddings, vector_store, filters=None):
+    return AsyncProductSearch(embeddings, vector_store, filters)
+
+
+async def recommend_from_db(tags_collection, history_collection, embeddings, vector_store, client):
+    fields, error = read_query(await request.get_json())
+    if error:
+        return jsonify(error), 400
+    user_query, email, filters = fields
+    try:
+        history_messages = await aconversation_history(email, history_collection)
+        cached = await cache_lookup("db", user_query, history_messages, embeddings)
+        response_data, results_by_tag = await collect_recommendation(
+            client, db_messages(user_query, history_messages), lookup_items(embeddings, vector_store, filters),
+            QUERY_DEADLINE, cached
+        )
+        product_tags = response_data.get('product_tags', [])
+        await add_tags(email, product_tags, tags_collection)
+        search_results = db_search_results(product_tags, results_by_tag)
+        response_data['search_results'] = search_results
+        await save_conversation(email, user_query, response_data.get('message', ''), product_tags, search_results,
+                                history_collection)
+        schedule_async_summary(email, history_collection, client)
+        return jsonify(response_data)
+    except LLMTimeout as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+async def recommend_from_web(tags_collection, history_collection, embeddings, vector_store, client):
+    fields, error = read_query(await request.get_json())
+    if error:
+        return jsonify(error), 400
+    user_query, email, filters = fields
+    try:
+        cached = await cache_lookup("web", user_query, None, embeddings)
+        response_data, results_by_tag = await collect_recommendation(
+            client, web_messages(user_query), lookup_products(embeddings, vector_store, filters), cached=cached
+        )
+        product_tags = response_data.get('product_tags', [])
+        await add_tags(email, product_tags, tags_collection)
+        search_results = web_search_results(product_tags, results_by_tag)
+        response_data['search_results'] = search_results
+        await save_conversation(email, user_query, response_data.get('message', ''), product_tags, search_results,
+                                history_collection)
+        schedule_async_summary(email, history_collection, client)
+        return jsonify(response_data)
+    except LLMTimeout as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def stream_recommendation(email, user_query, messages, submit, select, tags_collection, history_collection,
+                          client, deadline=None, cached=None):
+    """
+    recommendations.stream_recommendation for the ASGI app, with the same events.
+    """
+    async def events():
+        streamed = StreamedReply(select)
+        try:
+            async for kind, value in recommendation_events(client, messages, submit, deadline, cached):
+                event = streamed.event(kind, value)
+                if event is not None:
+                    yield event
+                if kind == "reply":
+                    await add_tags(email, streamed.product_tags, tags_collection)
+            reply = streamed.done()
+            await save_conversation(email, user_query, reply.get('message', ''), streamed.product_tags,
+                                    reply['search_results'], history_collection)
+            schedule_async_summary(email, history_collection, client)
+            yield sse("done", reply)
+        except Exception as e:
+            print(f"Error streaming the recommendation: {e}")
+            yield sse("error", {"error": str(e)})
+
+    response = Response(events(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # Streams outlive Quart's default response timeout when the LLM is slow
+    response.timeout = None
+    return response
+
+
+async def recommend_from_db_stream(tags_collection, history_collection, embeddings, vector_store, client):
+    fields, error = read_query(await request.get_json())
+    if error:
+        return jsonify(error), 400
+    user_query, email, filters = fields
+    history_messages = await aconversation_history(email, history_collection)
+    cached = await cache_lookup("db", user_query, history_messages, embeddings)
+    return stream_recommendation(email, user_query, db_messages(user_query, history_messages),
+                                 lookup_items(embeddings, vector_store, filters), select_unique(set()),
+                                 tags_collection, history_collection, client, QUERY_DEADLINE, cached)
+
+
+async def recommend_from_web_stream(tags_collection, history_collection, embeddings, vector_store, client):
+    fields, error = read_query(await request.get_json())
+    if error:
+        return jsonify(error), 400
+    user_query, email, filters = fields
+    cached = await cache_lookup("web", user_query, None, embeddings)
+    return stream_recommendation(email, user_query, web_messages(user_query),
+                                 lookup_products(embeddings, vector_store, filters), web_result,
+                                 tags_collection, history_collection, client, cached=cached)
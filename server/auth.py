@@ -1,65 +1,94 @@
+from datetime import timedelta
 from flask import request, jsonify
 from flask_bcrypt import Bcrypt
-from flask_jwt_extended import create_access_token
+from flask_jwt_extended import JWTManager, create_access_token
+from validation import read_registration, read_credentials
+
+JWT_SECRET_KEY = 'ProductRecommendationSystemProjectKMIT'
+JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
 
 bcrypt = Bcrypt()
 
-def register(users_collection):
-    data = request.get_json()
-    user = data.get('user')
 
-    if not user:
-        return jsonify({"message": "No user data provided"}), 400
+def configure_jwt(app):
+    app.config['JWT_SECRET_KEY'] = JWT_SECRET_KEY
+    app.config['JWT_ACCESS_TOKEN_EXPIRES'] = JWT_ACCESS_TOKEN_EXPIRES
+    JWTManager(app)
 
-    name = user.get('name')
-    email = user.get('email')
-    password = user.get('password')
 
-    if not (name and email and password):
-        return jsonify({"message": "All fields are required"}), 400
+def issue_token(app, identity):
+    """
+    create_access_token outside of a Flask request, e.g. for the ASGI app, with app's JWT settings.
+    """
+    with app.app_context():
+        return create_access_token(identity=identity)
+
+
+def hash_password(password):
+    return bcrypt.generate_password_hash(password).decode('utf-8')
 
-    existing_user = users_collection.find_one({"email": email})
-    
-    if existing_user:
-        return jsonify({"message": "User Already Exists"}), 400
 
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
-    
-    new_user = {
+def user_document(name, email, hashed_password):
+    return {
         "name": name,
         "email": email,
         "password": hashed_password
     }
 
+
+def registered(new_user, access_token):
+    """
+    The /userregister body for a user document once it is inserted.
+    """
+    new_user = {**new_user, "_id": str(new_user["_id"])}
+    return {"message": "Registered Successfully", "user": new_user, "access_token": access_token,
+            "name": new_user["name"], "email": new_user["email"]}
+
+
+def logged_in(user, access_token):
+    return {
+        "message": "Login Successful",
+        "access_token": access_token,
+        "name": user['name'],
+        "email": user['email']
+    }
+
+
+def register(users_collection):
+    data = request.get_json()
+    fields, error = read_registration(data)
+    if error:
+        return jsonify(error), 400
+    name, email, password = fields
+
+    existing_user = users_collection.find_one({"email": email})
+
+    if existing_user:
+        return jsonify({"message": "User Already Exists"}), 400
+
+    new_user = user_document(name, email, hash_password(password))
+
     users_collection.insert_one(new_user)
-    
+
     access_token = create_access_token(identity={"email": email})
-    new_user["_id"] = str(new_user["_id"]) 
 
-    return jsonify({"message": "Registered Successfully", "user": new_user, "access_token": access_token, "name":name, "email":email}), 201
+    return jsonify(registered(new_user, access_token)), 201
 
 
 def login(users_collection):
     data = request.get_json()
-    email = data.get('email')
-    password = data.get('password')
-
-    if not (email and password):
-        return jsonify({"message": "Email and password are required"}), 400
+    fields, error = read_credentials(data)
+    if error:
+        return jsonify(error), 400
+    email, password = fields
 
     user = users_collection.find_one({"email": email})
     if not user:
         return jsonify({"message": "User Not Registered"}), 400
 
-   
     if not bcrypt.check_password_hash(user['password'], password):
         return jsonify({"message": "Invalid Credentials"}), 400
 
     access_token = create_access_token(identity={"email": email})
 
-    return jsonify({
-        "message": "Login Successful",
-        "access_token": access_token,
-        "name": user['name'],
-        "email": user['email']
-    }), 200
\ No newline at end of file
+    return jsonify(logged_in(user, access_token)), 200
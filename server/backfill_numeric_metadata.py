@@ -0,0 +1,60 @@
+"""
+Adds price_value, rating_value and review_count_value to vectors ingested
+before they were parsed at ingest time.
+
+Walks the vector store page by page, parses the stored price, rating and
+review strings and rewrites the vectors whose numeric fields are missing
+or stale. The BM25 index only keeps titles, so it is left alone. Running
+it again reports nothing left to backfill.
+
+Usage:
+    python backfill_numeric_metadata.py            # report what would change
+    python backfill_numeric_metadata.py --apply    # rewrite the metadata
+"""
+import argparse
+from dotenv import load_dotenv
+from product_values import numeric_fields
+
+load_dotenv()
+
+from vector_store import create_vector_store
+from result_cache import result_cache
+
+NUMERIC_FIELDS = ("price_value", "rating_value", "review_count_value")
+
+
+def backfill(vector_store, apply=False, page_size=100):
+    report = {"scanned": 0, "updated": 0, "unparsed": 0}
+
+    for ids in vector_store.list_ids(page_size):
+        upserts = []
+        for vector_id, vector in vector_store.fetch(ids).items():
+            report["scanned"] += 1
+            metadata = vector["metadata"]
+            numbers = numeric_fields(metadata.get("price"), metadata.get("rating"), metadata.get("review_count"))
+            if not numbers:
+                report["unparsed"] += 1
+            current = {name: metadata[name] for name in NUMERIC_FIELDS if name in metadata}
+            if current == numbers:
+                continue
+            # Fields that no longer parse are dropped rather than left stale
+            metadata = {name: value for name, value in metadata.items() if name not in NUMERIC_FIELDS}
+            upserts.append({"id": vector_id, "values": vector["values"], "metadata": {**metadata, **numbers}})
+            report["updated"] += 1
+
+        if apply and upserts:
+            vector_store.upsert(upserts)
+        print(f"Scanned {report['scanned']} vectors, {report['updated']} to update")
+
+    if apply and report["updated"]:
+        result_cache.bump()
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Parse numeric price, rating and review metadata for stored vectors.")
+    parser.add_argument("--apply", action="store_true", help="write the changes instead of only reporting them")
+    args = parser.parse_args()
+
+    report = backfill(create_vector_store(), apply=args.apply)
+    print(report if args.apply else f"Dry run, nothing written: {report}")
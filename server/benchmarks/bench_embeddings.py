@@ -0,0 +1,163 @@
+"""
+Compares the PyTorch (HuggingFaceEmbeddings) and ONNX Runtime embedding backends.
+
+    python benchmarks/bench_embeddings.py [--corpus titles.txt] [--threads 4] [--no-quantize]
+
+Each backend runs in its own interpreter so peak RSS is measured cleanly.
+The corpus defaults to the product titles in benchmarks/fixtures, a file
+with one text per line can be passed instead. For each backend it reports
+documents/sec for batch embedding, single-query latency and peak RSS. The
+ONNX vectors are then compared with the PyTorch ones: per-vector cosine
+and recall@k of the nearest corpus neighbours of each query, PyTorch being
+the ground truth.
+
+Exits with status 1 if any ONNX vector is further than
+onnx_embeddings.COSINE_TOLERANCE from its PyTorch counterpart.
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+sys.path.insert(0, SERVER_DIR)
+
+# Tags of the kind the LLM produces in product_tags
+QUERIES = [
+    "orthopedic memory foam dog bed", "washable dog bed cover", "large plush pet cushion",
+    "wireless bluetooth earphones", "earphones with fast charging", "deep bass in-ear headphones",
+    "noise cancelling earbuds", "dog bed for small breeds", "waterproof pet mattress",
+    "earphones with long battery life"
+]
+
+
+def load_corpus(path):
+    if path:
+        with open(path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    texts = []
+    for fixture in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.json"))):
+        with open(fixture, encoding="utf-8") as f:
+            texts.extend(product["title"] for product in json.load(f))
+    return texts
+
+
+def high_water_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return 0
+
+
+def make_backend(backend, threads, quantize):
+    if backend == "onnx":
+        from onnx_embeddings import OnnxEmbeddings
+        return OnnxEmbeddings(threads=threads, quantize=quantize)
+    import torch
+    from langchain_huggingface import HuggingFaceEmbeddings
+    torch.set_num_threads(threads)
+    return HuggingFaceEmbeddings()
+
+
+def run_backend(backend, corpus_path, threads, quantize, output):
+    """
+    Runs in the child interpreter: embeds corpus and queries and saves the vectors.
+    """
+    corpus = load_corpus(corpus_path)
+    start = time.perf_counter()
+    model = make_backend(backend, threads, quantize)
+    load_seconds = time.perf_counter() - start
+
+    model.embed_documents(corpus[:8])  # warm up
+    start = time.perf_counter()
+    documents = np.array(model.embed_documents(corpus), dtype=np.float32)
+    batch_seconds = time.perf_counter() - start
+
+    latencies = []
+    queries = []
+    for query in QUERIES * 5:
+        start = time.perf_counter()
+        queries.append(model.embed_query(query))
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+
+    np.savez(output, documents=documents, queries=np.array(queries[:len(QUERIES)], dtype=np.float32))
+    print(json.dumps({
+        "load_s": load_seconds,
+        "docs_per_s": len(corpus) / batch_seconds,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "peak_rss_mb": high_water_kb() / 1024
+    }))
+
+
+def normalize(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def recall_at_k(expected, got, documents_expected, documents_got, k):
+    truth = np.argsort(-(normalize(expected) @ normalize(documents_expected).T), axis=1)[:, :k]
+    found = np.argsort(-(normalize(got) @ normalize(documents_got).T), axis=1)[:, :k]
+    return np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="file with one text per line")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--no-quantize", action="store_true")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--run", nargs=2, metavar=("BACKEND", "OUTPUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    quantize = not args.no_quantize
+
+    if args.run:
+        run_backend(args.run[0], args.corpus, args.threads, quantize, args.run[1])
+        return 0
+
+    from onnx_embeddings import COSINE_TOLERANCE
+
+    results = {}
+    vectors = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in ("torch", "onnx"):
+            output = os.path.join(tmp, f"{backend}.npz")
+            command = [sys.executable, os.path.abspath(__file__), "--run", backend, output,
+                       "--threads", str(args.threads)]
+            if args.corpus:
+                command += ["--corpus", args.corpus]
+            if not quantize:
+                command.append("--no-quantize")
+            stdout = subprocess.check_output(command, cwd=SERVER_DIR, text=True)
+            results[backend] = json.loads(stdout.strip().splitlines()[-1])
+            with np.load(output) as saved:
+                vectors[backend] = {name: saved[name] for name in saved.files}
+
+    label = "onnx-int8" if quantize else "onnx"
+    print(f"{len(vectors['torch']['documents'])} documents, {args.threads} threads")
+    print(f"{'backend':<10}{'load s':>8}{'docs/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'peak MB':>9}")
+    for backend, name in (("torch", "torch"), ("onnx", label)):
+        r = results[backend]
+        print(f"{name:<10}{r['load_s']:>8.1f}{r['docs_per_s']:>10.1f}{r['p50_ms']:>9.1f}"
+              f"{r['p95_ms']:>9.1f}{r['peak_rss_mb']:>9.0f}")
+
+    torch_vectors, onnx_vectors = vectors["torch"], vectors["onnx"]
+    cosines = np.sum(normalize(torch_vectors["documents"]) * normalize(onnx_vectors["documents"]), axis=1)
+    k = min(args.k, len(cosines))
+    recall = recall_at_k(torch_vectors["queries"], onnx_vectors["queries"],
+                         torch_vectors["documents"], onnx_vectors["documents"], k)
+    print(f"\ncosine to torch: min {cosines.min():.4f}, mean {cosines.mean():.4f} "
+          f"(tolerance {1 - COSINE_TOLERANCE:.2f})")
+    print(f"recall@{k} against torch neighbours: {recall:.3f}")
+    return 0 if cosines.min() >= 1 - COSINE_TOLERANCE else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Offline load test of the LLM gateway against the stub provider.
+
+    python benchmarks/bench_llm_gateway.py [--requests 300] [--clients 6] [--max-concurrency 8]
+
+The stub answers the recommendation prompt after --first-token-ms, except
+for a seeded --slow-fraction of calls that stall for --slow-ms first, like
+a provider's latency tail. --clients threads send --requests completions
+through one gateway, once without and once with hedging, and the script
+reports latency percentiles, rejected calls and how often the hedge won.
+Hedges only use free slots, so with more clients than --max-concurrency
+the run measures the concurrency bound instead. Nothing leaves the machine.
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from llm_gateway import LLMGateway, StubProvider, LLMTimeout
+from recommendations import web_messages, LLM_MODEL
+
+
+class TailProvider(StubProvider):
+    def __init__(self, slow_fraction, slow_seconds, **kwargs):
+        super().__init__(**kwargs)
+        self.slow_fraction = slow_fraction
+        self.slow_seconds = slow_seconds
+        self.random = random.Random(0)
+        self.lock = threading.Lock()
+
+    def stream(self, model, messages, timeout, **kwargs):
+        with self.lock:
+            slow = self.random.random() < self.slow_fraction
+        if slow:
+            time.sleep(self.slow_seconds)
+        yield from super().stream(model, messages, timeout, **kwargs)
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))] if samples else float("nan")
+
+
+def run(gateway, requests, clients, deadline):
+    latencies = []
+    rejected = 0
+
+    def call(number):
+        started = time.perf_counter()
+        try:
+            gateway.complete(web_messages(f"gift idea {number % 20}"), model=LLM_MODEL, deadline=deadline)
+            return time.perf_counter() - started
+        except LLMTimeout:
+            return None
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for latency in pool.map(call, range(requests)):
+            if latency is None:
+                rejected += 1
+            else:
+                latencies.append(latency)
+    return latencies, rejected
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test the LLM gateway offline.")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--clients", type=int, default=6)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--deadline", type=float, default=10)
+    parser.add_argument("--first-token-ms", type=float, default=100)
+    parser.add_argument("--token-ms", type=float, default=2)
+    parser.add_argument("--slow-fraction", type=float, default=0.05)
+    parser.add_argument("--slow-ms", type=float, default=2000)
+    args = parser.parse_args()
+
+    for hedge in (False, True):
+        provider = TailProvider(args.slow_fraction, args.slow_ms / 1000,
+                                first_token_ms=args.first_token_ms, token_ms=args.token_ms)
+        gateway = LLMGateway(provider, max_concurrency=args.max_concurrency, deadline=args.deadline, hedge=hedge)
+        started = time.perf_counter()
+        latencies, rejected = run(gateway, args.requests, args.clients, args.deadline)
+        elapsed = time.perf_counter() - started
+        stats = gateway.stats()
+        print(f"hedging {'on ' if hedge else 'off'}: p50 {percentile(latencies, 50):.2f}s, "
+              f"p95 {percentile(latencies, 95):.2f}s, p99 {percentile(latencies, 99):.2f}s, "
+              f"{len(latencies) / elapsed:.1f} calls/s, {rejected} rejected, "
+              f"{stats['hedges']} hedges ({stats['hedge_wins']} won)")
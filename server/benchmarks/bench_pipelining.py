@@ -0,0 +1,90 @@
+"""
+Measures what speculative retrieval saves on a recommendation request.
+
+    python benchmarks/bench_pipelining.py [--token-ms 15] [--lookup-ms 800]
+
+A simulated LLM provider writes a typical reply at --token-ms per token,
+and every tag lookup takes --lookup-ms. The old flow waits for the whole
+reply and then looks every tag up concurrently, the new one runs
+recommendation_events, which starts each lookup as the tag's string
+closes. Both are timed with the tags after the message, the old prompt's
+order, and before it, the order the prompts now ask for. Only the latter
+gets close to max(generation, retrieval) rather than their sum, since a
+tag closing at the end of the reply can't overlap anything.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from recommendations import recommendation_events
+from llm_gateway import LLMGateway, Provider
+
+MESSAGE = ("Aww, that's so exciting! I'm happy to help you find the paw-fect gift for your furry friend. "
+              "Can you tell me a bit more about your dog? What's their breed, size, and personality like? "
+              "That way, I can give you super tailored recommendations. In the meantime, here are some fun "
+              "ideas to get you started:")
+TAGS = [
+    "Indestructible Chew Toys for Aggressive Chewers",
+    "Orthopedic Dog Beds for Large Dogs",
+    "Grain-Free Natural Dog Food",
+    "Interactive Puzzle Toys for Dogs",
+    "Waterproof Dog Coats for Winter"
+]
+REPLIES = {
+    "tags last": json.dumps({"message": MESSAGE, "product_tags": TAGS}),
+    "tags first": json.dumps({"product_tags": TAGS, "message": MESSAGE})
+}
+# Roughly what a tokenizer makes of English, enough for timing
+CHARS_PER_TOKEN = 4
+
+
+class SimulatedProvider(Provider):
+    name = "simulated"
+
+    def __init__(self, reply, token_seconds):
+        self.reply = reply
+        self.token_seconds = token_seconds
+
+    def stream(self, model, messages, timeout, **kwargs):
+        for start in range(0, len(self.reply), CHARS_PER_TOKEN):
+            time.sleep(self.token_seconds)
+            yield self.reply[start:start + CHARS_PER_TOKEN]
+
+
+def sequential(client, lookup, pool):
+    reply = json.loads(client.complete([], model="simulated"))
+    return dict(zip(reply["product_tags"], pool.map(lookup, reply["product_tags"])))
+
+
+def pipelined(client, lookup, pool):
+    results = {}
+    for kind, value in recommendation_events(client, [], lambda tag: pool.submit(lookup, tag)):
+        if kind == "search_result":
+            results[value[0]] = value[1]
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare sequential and pipelined tag retrieval.")
+    parser.add_argument("--token-ms", type=float, default=15)
+    parser.add_argument("--lookup-ms", type=float, default=800)
+    args = parser.parse_args()
+
+    def lookup(tag):
+        time.sleep(args.lookup_ms / 1000)
+        return tag
+
+    tokens = -(-len(REPLIES["tags last"]) // CHARS_PER_TOKEN)
+    print(f"Generation ~{tokens * args.token_ms / 1000:.2f}s ({tokens} tokens), retrieval {args.lookup_ms / 1000:.2f}s")
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for order, reply in REPLIES.items():
+            client = LLMGateway(SimulatedProvider(reply, args.token_ms / 1000))
+            for name, run in (("sequential", sequential), ("pipelined", pipelined)):
+                started = time.perf_counter()
+                results = run(client, lookup, pool)
+                print(f"{order:>10}, {name:>10}: {time.perf_counter() - started:.2f}s for {len(results)} tags")
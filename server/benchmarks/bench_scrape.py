@@ -0,0 +1,209 @@
+"""
+Offline benchmark and regression check for the scrape_web extractors.
+
+Runs against the search pages in benchmarks/fixtures, so no network is
+needed. The pages are synthetic, written by make_fixtures.py: amazon.in and
+flipkart.com card markup with made-up products, padded with script and
+style payloads of realistic weight.
+
+    python benchmarks/bench_scrape.py               # everything
+    python benchmarks/bench_scrape.py --skip-async  # parsers only
+
+For each page and extraction engine it reports pages/sec, the cost per
+product card and the peak RSS growth while parsing one page. Every engine's
+output is compared field by field with the golden JSON next to the page,
+which was produced once by the original BeautifulSoup extractor.
+tests/test_scrape_fixtures.py runs the same comparison.
+The async section replays the pages from a local aiohttp server and drives
+scrape_amazon/scrape_flipkart, fetch_page included, end to end.
+
+Exits with status 1 if any output differs from its golden file.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+sys.path.insert(0, SERVER_DIR)
+
+import scrape_web
+import host_policy
+
+ENGINES = ("soup", "fast")
+
+
+def source_of(path):
+    return "amazon" if os.path.basename(path).startswith("amazon") else "flipkart"
+
+
+def extractor(engine, source):
+    if engine == "soup":
+        return getattr(scrape_web, f"parse_{source}_soup")
+    import product_parser
+    return getattr(product_parser, f"parse_{source}")
+
+
+def load_pages():
+    pages = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            pages.append((path, f.read()))
+    return pages
+
+
+def golden_path(path):
+    return os.path.splitext(path)[0] + ".json"
+
+
+def check_golden(path, products):
+    with open(golden_path(path), encoding="utf-8") as f:
+        expected = json.load(f)
+    errors = []
+    if len(products) != len(expected):
+        errors.append(f"{len(products)} products, expected {len(expected)}")
+    for i, (got, want) in enumerate(zip(products, expected)):
+        for field in want:
+            if got.get(field) != want[field]:
+                errors.append(f"card {i} {field}: {got.get(field)!r} != {want[field]!r}")
+    return errors
+
+
+def peak_rss_kb(engine, path):
+    # Measured in a fresh interpreter so earlier pages don't hide the peak
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), "--measure-rss", engine, path]
+    )
+    return int(output)
+
+
+def high_water_kb():
+    # VmHWM starts fresh after exec, unlike ru_maxrss which can carry the parent's peak
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure_rss(engine, path):
+    with open(path, encoding="utf-8") as f:
+        webpage = f.read()
+    parse = extractor(engine, source_of(path))
+    before = high_water_kb()
+    parse(webpage)
+    print(high_water_kb() - before)
+
+
+def bench_parsers(pages, engines, repeat):
+    failures = 0
+    print(f"{'engine':<6} {'page':<26}{'cards':>6}{'pages/s':>10}{'us/card':>10}{'peak KB':>10}")
+    for engine in engines:
+        for path, webpage in pages:
+            parse = extractor(engine, source_of(path))
+            products = parse(webpage)
+            errors = check_golden(path, products)
+            if errors:
+                failures += 1
+                print(f"{engine} {os.path.basename(path)} differs from golden output:")
+                for error in errors[:10]:
+                    print(f"    {error}")
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                parse(webpage)
+            per_page = (time.perf_counter() - start) / repeat
+            per_card = per_page / len(products) * 1e6 if products else 0.0
+            print(f"{engine:<6} {os.path.basename(path):<26}{len(products):>6}"
+                  f"{1 / per_page:>10.1f}{per_card:>10.1f}{peak_rss_kb(engine, path):>10}")
+    return failures
+
+
+async def bench_async(pages, queries, concurrency):
+    from aiohttp import web
+
+    amazon_pages = [webpage for path, webpage in pages if source_of(path) == "amazon"]
+    flipkart_pages = [webpage for path, webpage in pages if source_of(path) == "flipkart"]
+
+    async def amazon(request):
+        return web.Response(text=amazon_pages[hash(request.query.get("k")) % len(amazon_pages)],
+                            content_type="text/html")
+
+    async def flipkart(request):
+        return web.Response(text=flipkart_pages[hash(request.query.get("q")) % len(flipkart_pages)],
+                            content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/s", amazon)
+    app.router.add_get("/search", flipkart)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    scrape_web.AMAZON_SEARCH_URL = f"http://127.0.0.1:{port}/s?k={{}}"
+    scrape_web.FLIPKART_SEARCH_URL = f"http://127.0.0.1:{port}/search?q={{}}"
+    # The replay server is local, don't throttle it like a retailer
+    host_policy.policy_for(scrape_web.AMAZON_SEARCH_URL).bucket = host_policy.TokenBucket(rate=1e6, burst=1e6)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(session, query):
+        async with semaphore:
+            start = time.perf_counter()
+            amazon_products, flipkart_products = await asyncio.gather(
+                scrape_web.scrape_amazon(session, query),
+                scrape_web.scrape_flipkart(session, query)
+            )
+            latencies.append(time.perf_counter() - start)
+            return len(amazon_products) + len(flipkart_products)
+
+    try:
+        async with scrape_web.make_session() as session:
+            start = time.perf_counter()
+            counts = await asyncio.gather(*(one(session, f"query {i}") for i in range(queries)))
+            elapsed = time.perf_counter() - start
+    finally:
+        await runner.cleanup()
+
+    latencies.sort()
+    print(f"\nasync path: {queries} queries x 2 retailers, concurrency {concurrency}")
+    print(f"    {2 * queries / elapsed:.1f} pages/s, {sum(counts)} products")
+    print(f"    latency p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20, help="parses per page when timing")
+    parser.add_argument("--engine", choices=ENGINES, action="append", help="engines to benchmark")
+    parser.add_argument("--queries", type=int, default=50, help="queries replayed through the async path")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--skip-async", action="store_true")
+    parser.add_argument("--measure-rss", nargs=2, metavar=("ENGINE", "PAGE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure_rss:
+        measure_rss(*args.measure_rss)
+        return 0
+
+    pages = load_pages()
+    failures = bench_parsers(pages, args.engine or ENGINES, args.repeat)
+    if not args.skip_async:
+        asyncio.run(bench_async(pages, args.queries, args.concurrency))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
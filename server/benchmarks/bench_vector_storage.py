@@ -0,0 +1,141 @@
+"""
+Memory and recall of the LocalStore storage modes.
+
+    python benchmarks/bench_vector_storage.py [--items 100000] [--queries 200] [--modes float32 float16 pq]
+
+Builds each mode over the same synthetic catalog: clustered 768-dim
+vectors, which are harder to quantize than uniform noise, with metadata
+shaped like productMetadata. For each mode it reports memory per million
+items, split into vectors/codes, metadata and the whole store as seen
+by tracemalloc (ids and the id map included). It also reports the
+float32 bytes kept on disk for re-ranking, query latency and recall@10
+against exact float32 search. The metadata line compares the side table
+with a list of per-item dicts.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, SERVER_DIR)
+
+from metadata_table import MetadataTable
+from vector_store import DIMENSION, STORAGE_MODES, LocalStore
+
+MILLION = 1_000_000
+
+
+def make_catalog(items, queries, clusters=500, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, DIMENSION)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, items)] + rng.normal(size=(items, DIMENSION)).astype(np.float32)
+    # Queries land near catalog items, like a tag near the products it should find
+    picks = rng.integers(0, items, queries)
+    query_vectors = vectors[picks] + 0.7 * rng.normal(size=(queries, DIMENSION)).astype(np.float32)
+    return vectors, query_vectors
+
+
+def metadata_for(i):
+    return {
+        "content": f"Orthopedic Memory Foam Dog Bed with Washable Cover, Large, Grey #{i}",
+        "link": f"https://www.amazon.in/dp/B0{i:08d}",
+        "image": f"https://m.media-amazon.com/images/I/{i:011d}._AC_UL320_.jpg",
+        "rating": "4.3 out of 5 stars",
+        "review_count": f"{i % 5000:,}",
+        "price": f"{500 + i % 3000:,}",
+        "availability": "In Stock"
+    }
+
+
+def exact_neighbours(vectors, queries, k):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    truth = []
+    for query in queries:
+        scores = normalized @ (query / np.linalg.norm(query))
+        best = np.argpartition(-scores, k - 1)[:k]
+        truth.append(set(best.tolist()))
+    return truth
+
+
+def build(mode, vectors, path, batch_size=1000):
+    store = LocalStore(path=path, storage=mode, save_interval=10 ** 9, hnsw_threshold=10 ** 12)
+    for start in range(0, len(vectors), batch_size):
+        store.upsert([
+            {"id": str(i), "values": vectors[i], "metadata": metadata_for(i)}
+            for i in range(start, min(start + batch_size, len(vectors)))
+        ])
+    return store
+
+
+def bench_mode(mode, vectors, queries, truth, k):
+    with tempfile.TemporaryDirectory() as path:
+        tracemalloc.start()
+        start = time.perf_counter()
+        store = build(mode, vectors, path)
+        build_seconds = time.perf_counter() - start
+        traced, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        latencies = []
+        recall = 0.0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            matches = store.query(query, k, include_metadata=False)["matches"]
+            latencies.append(time.perf_counter() - start)
+            recall += len(expected & {int(match["id"]) for match in matches}) / k
+        latencies.sort()
+
+        items = len(vectors)
+        codes = store.vectors[:store.size].nbytes + (store.codebooks.nbytes if store.codebooks is not None else 0)
+        disk = store.exact.rows * store.exact.row_bytes if store.exact is not None else 0
+        print(f"{mode:<8}{codes / items * MILLION / 2 ** 20:>10.0f}{store.metadata.nbytes() / items * MILLION / 2 ** 20:>10.0f}"
+              f"{traced / items * MILLION / 2 ** 20:>10.0f}{disk / items * MILLION / 2 ** 20:>10.0f}"
+              f"{latencies[len(latencies) // 2] * 1000:>9.1f}{recall / len(queries):>10.3f}{build_seconds:>9.1f}")
+        if store.exact is not None:
+            store.exact.close()
+        store.dirty = False
+
+
+def bench_metadata(items):
+    sample = min(items, 100000)
+    tracemalloc.start()
+    dicts = [metadata_for(i) for i in range(sample)]
+    dict_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del dicts
+
+    table = MetadataTable()
+    tracemalloc.start()
+    for i in range(sample):
+        table.append(metadata_for(i))
+    table_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"\nmetadata per million items: dicts {dict_bytes / sample * MILLION / 2 ** 20:.0f} MB, "
+          f"side table {table_bytes / sample * MILLION / 2 ** 20:.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--modes", nargs="+", choices=STORAGE_MODES, default=list(STORAGE_MODES))
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    vectors, queries = make_catalog(args.items, args.queries)
+    truth = exact_neighbours(vectors, queries, args.k)
+
+    print(f"{args.items} items, {args.queries} queries, MB per million items")
+    print(f"{'storage':<8}{'vectors':>10}{'metadata':>10}{'total':>10}{'on disk':>10}"
+          f"{'p50 ms':>9}{f'recall@{args.k}':>10}{'build s':>9}")
+    for mode in args.modes:
+        bench_mode(mode, vectors, queries, truth, args.k)
+    bench_metadata(args.items)
+
+
+if __name__ == '__main__':
+    main()
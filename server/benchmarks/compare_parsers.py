@@ -0,0 +1,52 @@
+"""
+Times the BeautifulSoup extractors against the lxml engine on saved search pages.
+
+Usage:
+    python benchmarks/compare_parsers.py [page1.html page2.html ...]
+
+Without arguments the pages in benchmarks/fixtures are used.
+File names must contain "amazon" or "flipkart" so the right extractor is used.
+Exits with status 1 if the two engines disagree on any page.
+"""
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import product_parser
+import scrape_web
+
+
+def time_call(fn, webpage, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(webpage)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main(paths, repeat=20):
+    mismatches = 0
+    print(f"{'page':<24}{'cards':>6}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for path in paths:
+        source = "amazon" if "amazon" in os.path.basename(path) else "flipkart"
+        with open(path, encoding="utf-8") as f:
+            webpage = f.read()
+
+        before = getattr(scrape_web, f"parse_{source}_soup")
+        after = getattr(product_parser, f"parse_{source}")
+        expected = before(webpage, strain=False)
+        if after(webpage) != expected:
+            mismatches += 1
+            print(f"{os.path.basename(path)}: extracted products differ")
+
+        before_ms = time_call(lambda page: before(page, strain=False), webpage, repeat)
+        after_ms = time_call(after, webpage, repeat)
+        print(f"{os.path.basename(path):<24}{len(expected):>6}{before_ms:>12.1f}{after_ms:>12.1f}{before_ms / after_ms:>9.1f}x")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    fixtures = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "*.html")
+    sys.exit(main(sys.argv[1:] or sorted(glob.glob(fixtures))))
@@ -0,0 +1,203 @@
+"""
+Writes the synthetic search pages in benchmarks/fixtures.
+
+    python benchmarks/make_fixtures.py
+
+The pages are generated, not saved from the retailers: product cards use
+the markup and class names the extractors read, with made-up brands,
+titles, prices and links for a "dog bed" and an "earphones" search, and
+are padded with script and style payloads of roughly real page weight.
+Both Flipkart card layouts are covered. Output is deterministic.
+
+The golden JSON files next to the pages were produced once from the
+original BeautifulSoup extractor and are checked in as is. Regenerating
+the pages means regenerating the goldens from an extractor that is known
+to be right, not from the one under test.
+"""
+import html
+import os
+import random
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+CATALOG = {
+    "dog bed": {
+        "brands": ["Woofnest", "SnugPaws", "Barkley Home", "Pawzone", "Hound & Hearth"],
+        "products": ["Orthopedic Memory Foam Dog Bed", "Bolster Dog Bed", "Donut Calming Dog Bed",
+                     "Waterproof Dog Mattress", "Elevated Cooling Dog Cot", "Reversible Dog Cushion"],
+        "details": ["with Removable Washable Cover", "with Non-Slip Bottom", "for Small and Medium Dogs",
+                    "for Large Dogs", "Water Resistant Lining", "Machine Washable"],
+        "variants": ["Grey, Large", "Brown, Medium", "Beige, XL", "Navy Blue, Small", "Charcoal, Large"],
+        "prices": (399, 4999),
+    },
+    "earphones": {
+        "brands": ["Sonivo", "Boltune", "AudioMax", "Tunebeat", "Kestrel Sound"],
+        "products": ["Wireless Earbuds", "Bluetooth Neckband Earphones", "Wired In-Ear Earphones",
+                     "True Wireless Earbuds", "Sports Bluetooth Earphones"],
+        "details": ["with Mic", "with 40H Playtime", "with ENC Calling", "with Deep Bass",
+                    "with Fast Charging", "IPX5 Sweat Resistant"],
+        "variants": ["Black", "White", "Midnight Blue", "Graphite Grey", "Sage Green"],
+        "prices": (299, 3999),
+    },
+}
+
+SCRIPT = ("(window.P||(window.P={})).when('A','ready').execute(function(A){if(A.state&&A.state('s-metadata'))"
+          "{A.trigger('s:refresh',{count:24,page:1});}var w=window,d=document;w.ue&&w.ue.count('sp.render',1);});\n")
+
+
+def script(size):
+    return "<script type='text/javascript'>" + SCRIPT * (size // len(SCRIPT) + 1) + "</script>"
+
+
+def product(rng, query):
+    """
+    Returns:
+        tuple: (brand, title without the brand).
+    """
+    catalog = CATALOG[query]
+    brand = rng.choice(catalog["brands"])
+    name = f"{rng.choice(catalog['products'])} {rng.choice(catalog['details'])} ({rng.choice(catalog['variants'])})"
+    return brand, name
+
+
+def slug(title):
+    return "-".join(word.strip("(),&") for word in title.split() if word.strip("(),&"))[:40]
+
+
+def price(rng, query):
+    low, high = CATALOG[query]["prices"]
+    return f"{rng.randint(low, high) // 10 * 10 - 1:,}"
+
+
+def amazon_page(rng, query, count):
+    keywords = query.replace(" ", "+")
+    out = [f"<!doctype html><html><head><meta charset='utf-8'><title>Amazon.in : {query}</title>"]
+    out.extend(script(rng.randint(1000, 6000)) for _ in range(12))
+    out.append("<style>.a{color:red}" + "x" * 20000 + "</style></head><body><div id='a-page'><!-- sp:feature:nav -->")
+    out.append("<div class='s-main-slot s-result-list s-search-results sg-row'>")
+    for i in range(count):
+        # Some cards lack the title link, the ratings or the price, like sponsored and unavailable ones
+        kind = rng.random()
+        brand, name = product(rng, query)
+        title = html.escape(f"{brand} {name}")
+        asin = "B0" + "".join(rng.choice("ABCDEFGHJK0123456789") for _ in range(8))
+        amount = price(rng, query)
+        card = [
+            f"<div data-asin='{asin}' data-index='{i}' data-component-type='s-search-result' "
+            f"class='sg-col-4-of-24 s-result-item s-asin'>",
+            "<div class='sg-col-inner'><div class='s-widget-container'>",
+            f"<span class='rush-component'><a class='a-link-normal s-no-outline' "
+            f"href='/{slug(brand + ' ' + name)}/dp/{asin}/ref=sr_1_{i}?keywords={keywords}&qid=1700000000&sr=8-{i}'>",
+            f"<div class='a-section aok-relative s-image-square-aspect'><img class='s-image' "
+            f"src='https://m.media-amazon.com/images/I/{asin}._AC_UL320_.jpg' alt='{title}' srcset='x 1x, y 2x' "
+            f"data-image-latency='s-product-image'></div></a></span>",
+        ]
+        if kind > 0.3:
+            card.append(
+                f"<h2 class='a-size-mini a-spacing-none a-color-base s-line-clamp-4'><a class='a-link-normal "
+                f"s-underline-text s-underline-link-text s-link-style a-text-normal' "
+                f"href='/{asin}/dp/{asin}/ref=sr_1_{i}?dib=abc&th=1'><span class='a-size-base-plus a-color-base "
+                f"a-text-normal'>{title}</span></a></h2>"
+            )
+        if kind > 0.15:
+            stars = f"4.{rng.randint(0, 9)} out of 5 stars"
+            card.append(
+                f"<div class='a-row a-size-small'><span aria-label='{stars}'><i class='a-icon a-icon-star-small "
+                f"a-star-small-4 aok-align-bottom'><span class='a-icon-alt'>{stars}</span></i></span>"
+                f"<a class='a-link-normal s-underline-text s-underline-link-text s-link-style' "
+                f"href='#customerReviews'><span class='a-size-base s-underline-text'>{rng.randint(10, 99999):,}"
+                f"</span></a></div>"
+            )
+        if kind > 0.1:
+            card.append(
+                f"<div class='a-row'><span class='a-price' data-a-size='xl'><span class='a-offscreen'>₹{amount}</span>"
+                f"<span aria-hidden='true'><span class='a-price-symbol'>₹</span><span class='a-price-whole'>{amount}"
+                f"<span class='a-price-decimal'>.</span></span></span></span></div>"
+            )
+        card.append("<div class='a-row a-size-base a-color-secondary s-align-children-center'>"
+                    "<span>FREE delivery <span class='a-text-bold'>Tue, 21 Oct</span></span></div>")
+        card.append("</div></div></div>")
+        out.append("".join(card))
+    out.append("</div>")
+    out.extend(script(rng.randint(1000, 4000)) for _ in range(4))
+    out.append("</div></body></html>")
+    return "\n".join(out)
+
+
+def flipkart_page(rng, query, count, grid):
+    """
+    grid pages use the slAVV4 cards, the others the _1sdMkc list cards with a separate brand line.
+    """
+    out = [f"<!DOCTYPE html><html lang='en'><head><meta charset='utf-8'><title>{query.title()}- Buy Products "
+           f"Online at Best Price in India - All Categories | Flipkart.com</title>"]
+    out.append("<link rel='stylesheet' href='x.css'><style>" + "._1a{}" * 5000 + "</style>")
+    out.extend(script(rng.randint(3000, 12000)) for _ in range(6))
+    out.append("</head><body><div id='container'><div class='DOjaWF gdgoEp'>")
+    for _ in range(count):
+        brand, name = product(rng, query)
+        pid = "".join(rng.choice("ABCDEFGHJKLMNPQRSTUVWXYZ0123456789") for _ in range(16))
+        href = (f"/{slug(brand + ' ' + name).lower()}/p/itm{pid[:13].lower()}?pid={pid}&lid=LSTX{pid}"
+                f"&marketplace=FLIPKART&q={query.replace(' ', '+')}&sattr[]=size&st=size")
+        amount = f"₹{price(rng, query)}"
+        if grid:
+            title = html.escape(f"{brand} {name}")
+            card = [
+                f"<div class='slAVV4' data-id='{pid}'>",
+                f"<a class='VJA3rP' target='_blank' rel='noopener noreferrer' href='{href}'><div class='_4WELSP'>"
+                f"<img loading='eager' class='DByuf4' alt='{title}' "
+                f"src='https://rukminim2.flixcart.com/image/200/200/{pid}.jpeg?q=90'></div></a>",
+                f"<a class='wjcEIp' title='{title}' target='_blank' rel='noopener noreferrer' href='{href}'>{title}</a>",
+            ]
+            if rng.random() > 0.2:
+                card.append(
+                    f"<div class='_5OesEi afFzxY'><span class='Y1HWO0'><div class='XQDdHH'>4.{rng.randint(0, 9)}"
+                    f"<img src='data:image/svg+xml;base64,PHN2Zz4=' class='Rza2QY'></div></span>"
+                    f"<span class='Wphh3N'>({rng.randint(10, 99999):,})</span></div>"
+                )
+            card.append(
+                f"<a class='+tlBoD' target='_blank' rel='noopener noreferrer' href='{href}'><div class='hl05eU'>"
+                f"<div class='Nx9bqj'>{amount}</div><div class='yRaY8j'>₹9,999</div>"
+                f"<div class='UkUFwK'><span>62% off</span></div></div></a></div>"
+            )
+        else:
+            title = html.escape(name)
+            card = [
+                f"<div class='_1sdMkc LFEi7Z' data-id='{pid}'><div class='_75nlfW'>",
+                f"<a class='rPDeLR' target='_blank' rel='noopener noreferrer' href='{href}'>"
+                f"<div class='_4WELSP _6lpKCl'><img class='_53J4C-' alt='{title}' "
+                f"src='https://rukminim2.flixcart.com/image/612/612/{pid}.jpeg?q=70'></div></a>",
+                f"<div class='hCKiGj'><div class='syl9yP'>{html.escape(brand)}</div><a class='WKTcLC' title='{title}' "
+                f"target='_blank' rel='noopener noreferrer' href='{href}'>{title}</a>",
+                f"<a class='+tlBoD' target='_blank' rel='noopener noreferrer' href='{href}'><div class='hl05eU'>"
+                f"<div class='Nx9bqj'>{amount}</div></div></a>",
+            ]
+            if rng.random() > 0.3:
+                card.append(
+                    f"<div class='_5OesEi'><span class='Y1HWO0'><div class='XQDdHH'>3.{rng.randint(0, 9)}"
+                    f"<img class='Rza2QY'></div></span><span class='Wphh3N'>(<!-- -->{rng.randint(10, 999)}"
+                    f"<!-- -->)</span></div>"
+                )
+            card.append("</div></div></div>")
+        out.append("".join(card))
+    out.append("</div>")
+    out.extend(script(rng.randint(2000, 8000)) for _ in range(3))
+    out.append("</div></body></html>")
+    return "\n".join(out)
+
+
+def main():
+    rng = random.Random(7)
+    pages = {
+        "amazon_dog_bed.html": amazon_page(rng, "dog bed", 48),
+        "amazon_earphones.html": amazon_page(rng, "earphones", 24),
+        "flipkart_dog_bed.html": flipkart_page(rng, "dog bed", 40, grid=True),
+        "flipkart_earphones.html": flipkart_page(rng, "earphones", 24, grid=False),
+    }
+    for name, webpage in pages.items():
+        with open(os.path.join(FIXTURES_DIR, name), "w", encoding="utf-8") as f:
+            f.write(webpage)
+        print(f"Wrote {name}")
+
+
+if __name__ == '__main__':
+    main()
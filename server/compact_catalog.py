@@ -0,0 +1,250 @@
+"""
+Maintenance pass over the vector store that keeps the catalog small and fresh.
+
+Ingestion stamps every product with last_seen. This job:
+  - expires products not seen in PRODUCT_MAX_AGE_DAYS,
+  - collapses copies of the same product (same canonical URL under
+    different IDs) down to the most recently seen one,
+  - collapses near-duplicates, i.e. neighbours with cosine similarity of
+    at least DUPLICATE_SIMILARITY whose titles share DUPLICATE_SHINGLE_OVERLAP
+    of their word bigrams, again keeping the most recently seen one.
+
+It walks the index page by page and finds near-duplicates with one batched
+nearest-neighbour query per page (query_many), so the vectors are never
+all in memory. It does keep one small entry per distinct product
+(canonical ID, last_seen and vector ID) to spot URL duplicates across
+pages, plus the IDs it removes, so its memory still grows with the
+catalog, by about 300 bytes per product. Products stored before last_seen existed are stamped with
+the time of the first run.
+
+A pass holds COMPACTION_LOCK_PATH, next to the lexical index by default,
+so passes started by the CLI, cron or app workers never overlap, wherever
+they were started from: a scheduled pass skips its turn while another one
+runs, the CLI waits for it.
+
+Usage:
+    python compact_catalog.py                     # report what would change
+    python compact_catalog.py --apply             # delete and stamp
+    python compact_catalog.py --report out.json   # also write the report
+
+The app runs it every COMPACTION_INTERVAL_HOURS when that is set.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: passes are not serialized across processes
+    fcntl = None
+from product_ids import product_id
+from lexical_index import LEXICAL_INDEX_PATH, lexical_index, tokenize
+from result_cache import result_cache
+
+PRODUCT_MAX_AGE_DAYS = float(os.getenv("PRODUCT_MAX_AGE_DAYS", 30))
+DUPLICATE_SIMILARITY = float(os.getenv("DUPLICATE_SIMILARITY", 0.97))
+DUPLICATE_SHINGLE_OVERLAP = float(os.getenv("DUPLICATE_SHINGLE_OVERLAP", 0.5))
+# 0 disables the scheduled run
+COMPACTION_INTERVAL_HOURS = float(os.getenv("COMPACTION_INTERVAL_HOURS", 0))
+COMPACTION_REPORT_PATH = os.getenv("COMPACTION_REPORT_PATH", "")
+COMPACTION_LOCK_PATH = os.getenv("COMPACTION_LOCK_PATH",
+                                 os.path.join(os.path.dirname(LEXICAL_INDEX_PATH), "compaction.lock"))
+# Neighbours checked per product for near-duplicates
+NEIGHBOURS = 5
+# Pairs listed in the report for spot checks
+REPORT_EXAMPLES = 20
+
+
+def try_lock(path, blocking=False):
+    """
+    Takes an exclusive lock on path for this process.
+
+    Returns:
+        file: Holds the lock until it is closed, or None if another process holds it.
+    """
+    f = open(path, "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return None
+    return f
+
+
+def shingles(title, size=2):
+    tokens = tokenize(title or "")
+    if len(tokens) < size:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def shingle_overlap(first, second):
+    first, second = shingles(first), shingles(second)
+    union = first | second
+    return len(first & second) / len(union) if union else 0.0
+
+
+def compact(vector_store, apply=False, page_size=100, max_age_days=PRODUCT_MAX_AGE_DAYS,
+            similarity=DUPLICATE_SIMILARITY, overlap=DUPLICATE_SHINGLE_OVERLAP, now=None):
+    """
+    Runs one compaction pass.
+
+    Args:
+        apply (bool): Delete and stamp for real instead of only reporting.
+        page_size (int): Vectors fetched at a time.
+        max_age_days (float): Products last seen longer ago than this expire.
+        similarity (float): Cosine similarity from which neighbours may be duplicates.
+        overlap (float): Title shingle overlap (Jaccard) duplicates need as well.
+
+    Returns:
+        dict: Counters and example pairs describing what was (or would be) removed.
+    """
+    now = time.time() if now is None else now
+    cutoff = now - max_age_days * 86400
+    started = time.perf_counter()
+    report = {"scanned": 0, "expired": 0, "url_duplicates": 0, "near_duplicates": 0, "stamped": 0, "examples": []}
+    # Canonical product ID -> (last_seen, vector ID) of the copy kept so far
+    kept = {}
+    removed = set()
+
+    def remove(loser, winner, reason, deletes):
+        deletes.add(loser)
+        report[reason] += 1
+        if len(report["examples"]) < REPORT_EXAMPLES:
+            report["examples"].append({"reason": reason, "removed": loser, "kept": winner})
+
+    for ids in vector_store.list_ids(page_size):
+        vectors = vector_store.fetch([vector_id for vector_id in ids if vector_id not in removed])
+        deletes = set()
+        stamps = []
+        # Vector ID -> freshness of the products left to check for near-duplicates
+        candidates = {}
+        for vector_id, vector in vectors.items():
+            report["scanned"] += 1
+            if vector_id in deletes:
+                continue
+            metadata = vector["metadata"]
+            last_seen = metadata.get("last_seen")
+            if last_seen is None:
+                # Stored before ingestion stamped products, start its clock now
+                last_seen = now
+                stamps.append({"id": vector_id, "values": vector["values"],
+                               "metadata": {**metadata, "last_seen": int(now)}})
+            elif last_seen < cutoff:
+                deletes.add(vector_id)
+                report["expired"] += 1
+                continue
+            freshness = (last_seen, vector_id)
+
+            key = product_id(metadata.get("link", ""), metadata.get("content", ""))
+            if key in kept and kept[key][1] not in removed and kept[key][1] not in deletes:
+                if kept[key] > freshness:
+                    remove(vector_id, kept[key][1], "url_duplicates", deletes)
+                    continue
+                remove(kept[key][1], vector_id, "url_duplicates", deletes)
+            kept[key] = freshness
+            candidates[vector_id] = freshness
+
+        # One batched neighbour query for the page instead of one per product
+        neighbours = vector_store.query_many([vectors[vector_id]["values"] for vector_id in candidates],
+                                             top_k=NEIGHBOURS + 1)
+        for (vector_id, freshness), result in zip(candidates.items(), neighbours):
+            if vector_id in deletes:
+                continue
+            content = vectors[vector_id]["metadata"].get("content")
+            for match in result["matches"]:
+                other = match["id"]
+                if other == vector_id or other in removed or other in deletes or match["score"] < similarity:
+                    continue
+                if shingle_overlap(content, match["metadata"].get("content")) < overlap:
+                    continue
+                if (match["metadata"].get("last_seen", now), other) > freshness:
+                    remove(vector_id, other, "near_duplicates", deletes)
+                    break
+                remove(other, vector_id, "near_duplicates", deletes)
+
+        removed |= deletes
+        stamps = [stamp for stamp in stamps if stamp["id"] not in deletes]
+        report["stamped"] += len(stamps)
+        if apply:
+            if stamps:
+                vector_store.upsert(stamps)
+            if deletes:
+                vector_store.delete(list(deletes))
+                lexical_index.remove(deletes)
+        print(f"Scanned {report['scanned']} vectors, {len(removed)} to remove")
+
+    if apply and removed:
+        result_cache.bump()
+    if apply:
+        # Fold the BM25 journal, every process reloads the smaller snapshot
+        lexical_index.snapshot()
+    report["removed"] = len(removed)
+    report["seconds"] = round(time.perf_counter() - started, 2)
+    return report
+
+
+def write_report(report, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"), **report}, f, indent=2)
+
+
+def start_schedule(get_vector_store, interval_hours=COMPACTION_INTERVAL_HOURS, report_path=COMPACTION_REPORT_PATH):
+    """
+    Runs compact(apply=True) every interval_hours on a daemon thread.
+    get_vector_store returns the store, or None while it is still warming up.
+
+    Every app worker calls this, but only the process holding the schedule
+    lock (COMPACTION_LOCK_PATH + ".schedule") runs passes. The others keep
+    trying for it, so one of them takes over if that process exits.
+    """
+    def run():
+        schedule_lock = None
+        while True:
+            time.sleep(interval_hours * 3600)
+            if schedule_lock is None:
+                schedule_lock = try_lock(COMPACTION_LOCK_PATH + ".schedule")
+                if schedule_lock is None:
+                    continue
+            vector_store = get_vector_store()
+            if vector_store is None:
+                continue
+            lock = try_lock(COMPACTION_LOCK_PATH)
+            if lock is None:
+                print("Catalog compaction is already running in another process, skipping")
+                continue
+            try:
+                report = compact(vector_store, apply=True)
+                print(f"Catalog compaction: {report}")
+                if report_path:
+                    write_report(report, report_path)
+            except Exception as e:
+                print(f"Catalog compaction failed: {e}")
+            finally:
+                lock.close()
+
+    threading.Thread(target=run, name="catalog-compaction", daemon=True).start()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Expire stale products and collapse duplicates in the vector store.")
+    parser.add_argument("--apply", action="store_true", help="write the changes instead of only reporting them")
+    parser.add_argument("--max-age-days", type=float, default=PRODUCT_MAX_AGE_DAYS)
+    parser.add_argument("--similarity", type=float, default=DUPLICATE_SIMILARITY)
+    parser.add_argument("--report", default=COMPACTION_REPORT_PATH, help="write the report to this JSON file")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    from vector_store import create_vector_store
+
+    with try_lock(COMPACTION_LOCK_PATH, blocking=True):
+        report = compact(create_vector_store(), apply=args.apply, max_age_days=args.max_age_days,
+                         similarity=args.similarity)
+    if args.report:
+        write_report(report, args.report)
+    print(report if args.apply else f"Dry run, nothing written: {report}")
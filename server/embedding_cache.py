@@ -0,0 +1,139 @@
+"""
+Two-tier cache around an embeddings model.
+
+Vectors are keyed by (model name, normalized text). Recent ones stay in a
+bounded in-process LRU; all of them are written to an SQLite file as
+float32 blobs so they survive restarts and are shared by every worker on
+the host. Rows carry the name of the model that produced them, so workers
+running different models share the file without evicting each other.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 4096))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+
+
+def normalize_text(text):
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class CachedEmbeddings:
+    """
+    Drop-in wrapper exposing embed_query/embed_documents like the wrapped model.
+    Set path to "" to keep only the in-memory tier.
+    """
+
+    def __init__(self, embeddings, model_name=None, max_entries=EMBEDDING_CACHE_SIZE, path=EMBEDDING_CACHE_PATH):
+        self.embeddings = embeddings
+        self.model_name = model_name or getattr(embeddings, "model_name", type(embeddings).__name__)
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            # Taken before reading the schema so concurrent workers migrate it once
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, model TEXT, vector BLOB)")
+            self._migrate()
+            self.db.execute("CREATE INDEX IF NOT EXISTS embeddings_model ON embeddings (model)")
+            self.db.commit()
+
+    def _migrate(self):
+        """
+        Files written before rows carried their model had one model per file,
+        recorded in a meta table. Their rows are tagged with it.
+        """
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(embeddings)")]
+        if "model" in columns:
+            return
+        self.db.execute("ALTER TABLE embeddings ADD COLUMN model TEXT")
+        if self.db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'meta'").fetchone():
+            self.db.execute("UPDATE embeddings SET model = (SELECT value FROM meta WHERE name = 'model')")
+            self.db.execute("DROP TABLE meta")
+
+    def _key(self, text):
+        return hashlib.sha1(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, key):
+        vector = self.entries.get(key)
+        if vector is not None:
+            self.entries.move_to_end(key)
+            self.counters["memory_hits"] += 1
+            return vector
+        if self.db is not None:
+            row = self.db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                vector = array("f", row[0]).tolist()
+                self._remember(key, vector)
+                self.counters["disk_hits"] += 1
+                return vector
+        return None
+
+    def _remember(self, key, vector):
+        self.entries[key] = vector
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def embed_documents(self, texts):
+        texts = [normalize_text(text) for text in texts]
+        keys = [self._key(text) for text in texts]
+        vectors = {}
+        with self.lock:
+            for key in keys:
+                if key not in vectors:
+                    vector = self._lookup(key)
+                    if vector is not None:
+                        vectors[key] = vector
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if missing:
+            computed = self.embeddings.embed_documents(list(missing.values()))
+            with self.lock:
+                self.counters["misses"] += len(missing)
+                for key, vector in zip(missing, computed):
+                    # Rounded to float32 so both tiers return identical vectors
+                    vector = array("f", vector).tolist()
+                    vectors[key] = vector
+                    self._remember(key, vector)
+                if self.db is not None:
+                    self.db.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)",
+                        [(key, self.model_name, array("f", vectors[key]).tobytes()) for key in missing]
+                    )
+                    self.db.commit()
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def invalidate(self):
+        """
+        Drops every vector cached for this model, e.g. after its weights were updated in place.
+        """
+        with self.lock:
+            self.entries.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM embeddings WHERE model = ?", (self.model_name,))
+                self.db.commit()
+
+    def stats(self):
+        with self.lock:
+            lookups = sum(self.counters.values())
+            hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+            return {
+                **self.counters,
+                "model": self.model_name,
+                "entries": len(self.entries),
+                "hit_rate": hits / lookups if lookups else 0.0
+            }
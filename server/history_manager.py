@@ -0,0 +1,237 @@
+"""
+Keeps the conversation history put into the recommendation prompt bounded.
+
+The prompt gets the newest turns verbatim, at most HISTORY_MAX_TURNS of
+them and HISTORY_TOKEN_BUDGET tokens together, preceded by a rolling
+summary of everything older. The summary is stored on the history
+document next to summarized_turns, the number of turns it covers. After a
+response has been saved, schedule_summary folds the turns that dropped out
+of the window into it on a background thread, so requests never wait for
+it. While a summary lags behind, the turns between the ones it covers and
+the window are left out of the prompt until it catches up. The history
+array itself is kept whole for /get_history.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", 6))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 1500))
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", 300))
+# Summaries are plain prose, a smaller model writes them well enough
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "llama3-8b-8192")
+# Rough average for English text, close enough for budgeting without a tokenizer
+CHARS_PER_TOKEN = 4
+
+summary_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="history-summary")
+in_flight = set()
+in_flight_lock = threading.Lock()
+# Summaries running on the event loop, which only keeps weak references to its tasks
+summary_tasks = set()
+
+
+def estimate_tokens(text):
+    return -(-len(text or "") // CHARS_PER_TOKEN)
+
+
+def turn_tokens(entry):
+    return estimate_tokens(entry.get("query")) + estimate_tokens(entry.get("bot_response"))
+
+
+def recent_turns(history, max_turns=HISTORY_MAX_TURNS, budget=HISTORY_TOKEN_BUDGET):
+    """
+    Returns:
+        int: How many of the newest entries fit the window. The newest one always
+        does, it is truncated when building the prompt if it is over budget.
+    """
+    count = 0
+    used = 0
+    for entry in reversed(history[-max_turns:] if max_turns > 0 else []):
+        used += turn_tokens(entry)
+        if count and used > budget:
+            break
+        count += 1
+    return count
+
+
+def window_projection(max_turns=HISTORY_MAX_TURNS):
+    return {"summary": 1, "history": {"$slice": -max_turns} if max_turns > 0 else {"$slice": 0}}
+
+
+def window_messages(user_history, max_turns=HISTORY_MAX_TURNS, budget=HISTORY_TOKEN_BUDGET):
+    """
+    Builds the prompt's history messages from a document loaded with window_projection.
+    """
+    history_messages = []
+    if not user_history:
+        return history_messages
+    if user_history.get("summary"):
+        history_messages.append({
+            "role": "system",
+            "content": f"Summary of the earlier conversation: {user_history['summary']}"
+        })
+    history = user_history.get("history", [])
+    for entry in history[len(history) - recent_turns(history, max_turns, budget):]:
+        history_messages.append({
+            "role": "user",
+            "content": entry["query"]
+        })
+        history_messages.append({
+            "role": "assistant",
+            # A single turn can't take more than the whole budget
+            "content": entry["bot_response"][:budget * CHARS_PER_TOKEN]
+        })
+    return history_messages
+
+
+def conversation_history(email, history_collection, max_turns=HISTORY_MAX_TURNS, budget=HISTORY_TOKEN_BUDGET):
+    """
+    Returns the user's history as chat messages for the prompt: the rolling
+    summary, if there is one, then the newest turns that fit the budget.
+    """
+    user_history = history_collection.find_one({"email": email}, window_projection(max_turns))
+    return window_messages(user_history, max_turns, budget)
+
+
+async def aconversation_history(email, history_collection, max_turns=HISTORY_MAX_TURNS, budget=HISTORY_TOKEN_BUDGET):
+    """
+    conversation_history for a Motor collection.
+    """
+    user_history = await history_collection.find_one({"email": email}, window_projection(max_turns))
+    return window_messages(user_history, max_turns, budget)
+
+
+def summary_messages(summary, entries):
+    turns = "\n".join(f"User: {entry.get('query', '')}\nAssistant: {entry.get('bot_response', '')}" for entry in entries)
+    return [
+        {
+            "role": "user",
+            "content": (
+                "You keep a running summary of a shopping assistant's conversation with a user. "
+                "Merge the new turns into the summary. Keep what the user wants, their preferences, budget, "
+                "who they are shopping for and products already suggested, drop pleasantries. "
+                f"Answer with the updated summary only, in at most {HISTORY_SUMMARY_TOKENS * 3 // 4} words.\n"
+                f"Current summary: {summary or 'none'}\n"
+                f"New turns:\n{turns}"
+            )
+        }
+    ]
+
+
+SUMMARY_PROJECTION = {"summary": 1, "summarized_turns": 1, "history": 1}
+
+
+def pending_turns(user_history, max_turns=HISTORY_MAX_TURNS, budget=HISTORY_TOKEN_BUDGET):
+    """
+    Returns:
+        tuple: (turns already summarized, turns that should be), or None if nothing new left the window.
+    """
+    if not user_history:
+        return None
+    history = user_history.get("history", [])
+    summarized = user_history.get("summarized_turns", 0)
+    fold_until = len(history) - recent_turns(history, max_turns, budget)
+    return (summarized, fold_until) if fold_until > summarized else None
+
+
+def summary_update(email, summarized, fold_until, summary):
+    # Only written if no other summary landed meanwhile, None also matches a missing field
+    return (
+        {"email": email, "summarized_turns": {"$in": [summarized, None] if summarized == 0 else [summarized]}},
+        {"$set": {"summary": summary, "summarized_turns": fold_until}}
+    )
+
+
+def summarize(email, history_collection, client, max_turns=HISTORY_MAX_TURNS, budget=HISTORY_TOKEN_BUDGET):
+    """
+    Folds every turn older than the prompt window into the stored summary.
+
+    Returns:
+        bool: Whether the summary was updated.
+    """
+    user_history = history_collection.find_one({"email": email}, SUMMARY_PROJECTION)
+    pending = pending_turns(user_history, max_turns, budget)
+    if pending is None:
+        return False
+    summarized, fold_until = pending
+    summary = client.complete(
+        summary_messages(user_history.get("summary", ""), user_history["history"][summarized:fold_until]),
+        model=SUMMARY_MODEL,
+        max_tokens=HISTORY_SUMMARY_TOKENS,
+    ).strip()
+    result = history_collection.update_one(*summary_update(email, summarized, fold_until, summary))
+    return result.modified_count > 0
+
+
+async def asummarize(email, history_collection, client, max_turns=HISTORY_MAX_TURNS, budget=HISTORY_TOKEN_BUDGET):
+    """
+    summarize for a Motor collection and an AsyncLLMGateway.
+    """
+    user_history = await history_collection.find_one({"email": email}, SUMMARY_PROJECTION)
+    pending = pending_turns(user_history, max_turns, budget)
+    if pending is None:
+        return False
+    summarized, fold_until = pending
+    summary = (await client.complete(
+        summary_messages(user_history.get("summary", ""), user_history["history"][summarized:fold_until]),
+        model=SUMMARY_MODEL,
+        max_tokens=HISTORY_SUMMARY_TOKENS,
+    )).strip()
+    result = await history_collection.update_one(*summary_update(email, summarized, fold_until, summary))
+    return result.modified_count > 0
+
+
+def claim(email):
+    with in_flight_lock:
+        if email in in_flight:
+            return False
+        in_flight.add(email)
+        return True
+
+
+def release(email):
+    with in_flight_lock:
+        in_flight.discard(email)
+
+
+def schedule_summary(email, history_collection, client):
+    """
+    Updates the user's summary in the background after a response is saved.
+    A user with a summary already in progress is skipped, the next request catches up.
+    """
+    if not claim(email):
+        return
+
+    def run():
+        try:
+            if summarize(email, history_collection, client):
+                print(f"Updated the conversation summary for {email}")
+        except Exception as e:
+            print(f"Conversation summary failed: {e}")
+        finally:
+            release(email)
+
+    summary_pool.submit(run)
+
+
+def schedule_async_summary(email, history_collection, client):
+    """
+    schedule_summary as a task on the running event loop.
+    """
+    if not claim(email):
+        return
+
+    async def run():
+        try:
+            if await asummarize(email, history_collection, client):
+                print(f"Updated the conversation summary for {email}")
+        except Exception as e:
+            print(f"Conversation summary failed: {e}")
+        finally:
+            release(email)
+
+    task = asyncio.ensure_future(run())
+    summary_tasks.add(task)
+    task.add_done_callback(summary_tasks.discard)
+    return task
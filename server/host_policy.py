@@ -0,0 +1,176 @@
+"""
+Per-host request policy for the retailer scrapers.
+
+Each host gets an adaptive token bucket, exponential backoff with full
+jitter, and a circuit breaker. While a host's breaker is open its fetches
+fail fast, so a blocked retailer degrades to results from the other one
+instead of holding up every request.
+"""
+import asyncio
+import os
+import random
+import time
+from urllib.parse import urlsplit
+
+SCRAPER_RATE = float(os.getenv("SCRAPER_RATE", 2))
+SCRAPER_BURST = int(os.getenv("SCRAPER_BURST", 4))
+SCRAPER_MIN_RATE = float(os.getenv("SCRAPER_MIN_RATE", 0.2))
+BACKOFF_BASE = float(os.getenv("SCRAPER_BACKOFF_BASE", 0.5))
+BACKOFF_CAP = float(os.getenv("SCRAPER_BACKOFF_CAP", 4))
+BREAKER_FAILURES = int(os.getenv("SCRAPER_BREAKER_FAILURES", 5))
+BREAKER_BLOCKS = int(os.getenv("SCRAPER_BREAKER_BLOCKS", 2))
+BREAKER_COOLDOWN = float(os.getenv("SCRAPER_BREAKER_COOLDOWN", 60))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class TokenBucket:
+    """
+    Token bucket whose rate halves when the host pushes back and creeps
+    back up towards the configured rate on every success.
+    """
+
+    def __init__(self, rate=SCRAPER_RATE, burst=SCRAPER_BURST, min_rate=SCRAPER_MIN_RATE):
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def slow_down(self):
+        self.rate = max(self.min_rate, self.rate / 2)
+
+    def speed_up(self):
+        self.rate = min(self.max_rate, self.rate + self.max_rate * 0.1)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=BREAKER_FAILURES, block_threshold=BREAKER_BLOCKS,
+                 cooldown=BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.block_threshold = block_threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self.blocks = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def allow_request(self):
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            # Let a single probe through and hold everything else back until it settles
+            if self.probing:
+                return False
+            self.probing = True
+        return True
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.blocks = 0
+        self.probing = False
+
+    def record_failure(self, blocked=False):
+        self.failures += 1
+        if blocked:
+            self.blocks += 1
+        if (self.state == HALF_OPEN or self.failures >= self.failure_threshold
+                or self.blocks >= self.block_threshold):
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self.probing = False
+
+    def record_abort(self):
+        """
+        Settles a half-open probe that ended without an answer, e.g. a cancelled
+        fetch. The breaker goes back to open with its cooldown already over, so
+        the next request probes again.
+        """
+        if self.state == HALF_OPEN and self.probing:
+            self.state = OPEN
+            self.probing = False
+
+
+class HostPolicy:
+    def __init__(self, host):
+        self.host = host
+        self.bucket = TokenBucket()
+        self.breaker = CircuitBreaker()
+
+    def allow_request(self):
+        return self.breaker.allow_request()
+
+    async def acquire(self):
+        await self.bucket.acquire()
+
+    def record_success(self):
+        self.bucket.speed_up()
+        self.breaker.record_success()
+
+    def record_failure(self, blocked=False):
+        if blocked:
+            self.bucket.slow_down()
+        self.breaker.record_failure(blocked)
+
+    def is_probing(self):
+        return self.breaker.probing
+
+    def record_abort(self):
+        self.breaker.record_abort()
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """
+        Exponential backoff with full jitter, honouring Retry-After up to the cap.
+        """
+        if retry_after is not None:
+            return min(BACKOFF_CAP, retry_after)
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+    def stats(self):
+        return {
+            "state": self.breaker.state,
+            "failures": self.breaker.failures,
+            "blocks": self.breaker.blocks,
+            "rate": self.bucket.rate
+        }
+
+
+policies = {}
+
+
+def policy_for(url):
+    host = urlsplit(url).hostname or ""
+    if host not in policies:
+        policies[host] = HostPolicy(host)
+    return policies[host]
+
+
+def parse_retry_after(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def stats():
+    return {host: policy.stats() for host, policy in policies.items()}
@@ -0,0 +1,405 @@
+"""
+BM25 inverted index over ingested product titles.
+
+Dense vectors blur exact model numbers and brand names ("boAt Rockerz 450",
+"M2 MacBook Air"), so findItems also ranks products lexically and fuses
+both rankings with reciprocal_rank_fusion. The index is fed by the
+ingestion path, addDocuments, one batch at a time.
+
+Only the product IDs and the terms of their titles are kept; callers
+take the rest of a hit's metadata from the vector store. Posting lists
+are pairs of compact arrays (document numbers, term counts) that are
+appended to in place. A re-ingested product tombstones its old document,
+and only the posting lists of its terms are filtered, once a quarter of a
+list is dead, so an update never rebuilds the whole index.
+
+On disk the index is a snapshot of the live documents at
+LEXICAL_INDEX_PATH plus a journal next to it (.log) that every process
+appends its adds and removes to. Each process replays the journal lines
+written by the others before searching, so the app workers, the
+compaction job and the backfill all see each other's changes. Folding the
+journal into a new snapshot is left to one process at a time: --rebuild,
+--snapshot and compact_catalog do it, and so does the process whose
+append takes the journal past LEXICAL_JOURNAL_LIMIT bytes. Processes
+reload a new snapshot when they notice it, which also drops their
+tombstoned rows.
+
+    python lexical_index.py --rebuild    # re-index every title in the vector store
+    python lexical_index.py --snapshot   # fold the journal into the snapshot
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: journal appends are single writes, only folding is unguarded
+    fcntl = None
+
+# Next to this module by default, wherever the process was started from
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH",
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)), "lexical_index.json"))
+# Journal size in bytes from which an append folds it into a new snapshot, 0 leaves folding to --snapshot
+LEXICAL_JOURNAL_LIMIT = int(os.getenv("LEXICAL_JOURNAL_LIMIT", 16 * 1024 * 1024))
+# Seconds between checks for journal lines written by other processes
+LEXICAL_REFRESH_INTERVAL = float(os.getenv("LEXICAL_REFRESH_INTERVAL", 1))
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Lexical hits scoring below this are not fused, roughly a single term found in a third of the titles
+BM25_MIN_SCORE = float(os.getenv("BM25_MIN_SCORE", 1.0))
+RRF_K = 60
+
+TOKEN = re.compile(r"[a-z0-9]+")
+# Glue words of tags and titles, they would match most of the catalog
+STOPWORDS = frozenset("""
+a an and are as at be by for from in into is it of on or the to under up upto with without
+""".split())
+
+
+def tokenize(text):
+    # Model numbers stay whole: "Rockerz 450" -> ["rockerz", "450"], "M2" -> ["m2"]
+    return TOKEN.findall(text.lower())
+
+
+def terms(text):
+    """
+    The tokens BM25 indexes and searches, stopwords dropped.
+    """
+    return [token for token in tokenize(text) if token not in STOPWORDS]
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Merges ranked match lists by summing 1 / (k + rank) for each id.
+
+    Args:
+        rankings (list): Lists of {"id", "score", "metadata"} matches, best first.
+
+    Returns:
+        list: The merged matches, best first, scored by their fused score.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, match in enumerate(ranking, start=1):
+            entry = fused.setdefault(match["id"], {**match, "score": 0.0})
+            entry["score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda match: match["score"], reverse=True)
+
+
+@contextmanager
+def locked(f, exclusive=True):
+    if fcntl is None:
+        yield
+        return
+    fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    try:
+        yield
+    finally:
+        fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    # Snapshots are replaced, never written in place, so the inode changes too
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class LexicalIndex:
+    """
+    Set path to "" to keep the index in memory only.
+    """
+
+    def __init__(self, path=LEXICAL_INDEX_PATH, refresh_interval=LEXICAL_REFRESH_INTERVAL,
+                 journal_limit=LEXICAL_JOURNAL_LIMIT):
+        self.path = path
+        self.journal_path = path + ".log" if path else ""
+        self.refresh_interval = refresh_interval
+        self.journal_limit = journal_limit
+        # Appended to through one handle, opened on the first change
+        self.journal = None
+        self.lock = threading.RLock()
+        # What this process has read: the snapshot it loaded and how far into the journal
+        self.snapshot_stamp = None
+        self.journal_offset = 0
+        self.refreshed_at = 0.0
+        self._reset()
+        if path:
+            self.load()
+
+    def _reset(self):
+        self.postings = {}
+        # Tombstoned entries per posting list
+        self.dead = Counter()
+        self.ids = []
+        # The terms of each row's title, interned, to tombstone and snapshot it
+        self.terms = []
+        self.lengths = array("I")
+        self.alive = bytearray()
+        self.rows = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _add(self, vector_id, title_terms):
+        old_row = self.rows.get(vector_id)
+        if old_row is not None:
+            self._tombstone(old_row)
+        title_terms = tuple(sys.intern(term) for term in title_terms)
+        counts = Counter(title_terms)
+        row = len(self.ids)
+        for term, count in counts.items():
+            docs, freqs = self.postings.setdefault(term, (array("I"), array("H")))
+            docs.append(row)
+            freqs.append(min(count, 0xFFFF))
+        length = sum(counts.values())
+        self.ids.append(vector_id)
+        self.terms.append(title_terms)
+        self.lengths.append(length)
+        self.alive.append(1)
+        self.rows[vector_id] = row
+        self.total_length += length
+
+    def _remove(self, vector_id):
+        row = self.rows.pop(vector_id, None)
+        if row is not None:
+            self._tombstone(row)
+
+    def _tombstone(self, row):
+        # The row itself stays until the next snapshot is loaded
+        self.alive[row] = 0
+        self.total_length -= self.lengths[row]
+        self.ids[row] = None
+        row_terms, self.terms[row] = self.terms[row], ()
+        for term in set(row_terms):
+            self.dead[term] += 1
+            if self.dead[term] * 4 > len(self.postings[term][0]):
+                self._prune(term)
+
+    def _prune(self, term):
+        docs, freqs = self.postings[term]
+        keep = np.frombuffer(self.alive, dtype=np.uint8)[np.frombuffer(docs, dtype=np.uint32)] == 1
+        if keep.any():
+            self.postings[term] = (
+                array("I", np.frombuffer(docs, dtype=np.uint32)[keep].tobytes()),
+                array("H", np.frombuffer(freqs, dtype=np.uint16)[keep].tobytes())
+            )
+        else:
+            del self.postings[term]
+        del self.dead[term]
+
+    def _apply(self, change):
+        for vector_id, title in change.get("add", []):
+            if isinstance(title, dict):
+                # Journaled before only the terms were kept, title is the product's metadata
+                title = " ".join(terms(title.get("content") or ""))
+            self._add(vector_id, title.split())
+        for vector_id in change.get("remove", []):
+            self._remove(vector_id)
+
+    def _change(self, change):
+        with self.lock:
+            self.refresh()
+            self._apply(change)
+            if self.journal_path:
+                self._append(change)
+
+    def add(self, vectors):
+        """
+        Indexes the titles of upserted vectors, [{"id", "metadata"}, ...].
+        """
+        self._change({"add": [[vector["id"], " ".join(terms((vector.get("metadata") or {}).get("content") or ""))]
+                              for vector in vectors]})
+
+    def remove(self, ids):
+        self._change({"remove": list(ids)})
+
+    def search(self, query, top_k):
+        """
+        Returns the top_k products by BM25 score as {"id", "score"} matches,
+        without metadata. Products scoring below BM25_MIN_SCORE are dropped
+        before ranking.
+        """
+        query_terms = set(terms(query))
+        with self.lock:
+            self.refresh()
+            live = len(self.rows)
+            if not query_terms or live == 0:
+                return []
+            average_length = self.total_length / live or 1.0
+            lengths = np.frombuffer(self.lengths, dtype=np.uint32).astype(np.float32)
+            scores = np.zeros(len(self.ids), dtype=np.float32)
+            for term in query_terms:
+                if term not in self.postings:
+                    continue
+                docs, freqs = self.postings[term]
+                docs = np.frombuffer(docs, dtype=np.uint32)
+                freqs = np.frombuffer(freqs, dtype=np.uint16).astype(np.float32)
+                # Document frequency of live documents only
+                frequency = len(docs) - self.dead[term]
+                idf = math.log(1 + (live - frequency + 0.5) / (frequency + 0.5))
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[docs] / average_length)
+                scores[docs] += idf * freqs * (BM25_K1 + 1) / (freqs + norm)
+            scores[scores < BM25_MIN_SCORE] = 0
+            scores[np.frombuffer(self.alive, dtype=np.uint8) == 0] = 0
+
+            matched = np.flatnonzero(scores)
+            top_k = min(top_k, len(matched))
+            if top_k == 0:
+                return []
+            best = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+            best = best[np.argsort(-scores[best])]
+            return [{"id": self.ids[row], "score": float(scores[row])} for row in best.tolist()]
+
+    # Persistence
+
+    def _append(self, change):
+        line = (json.dumps(change, ensure_ascii=False) + "\n").encode("utf-8")
+        if self.journal is None:
+            self.journal = open(self.journal_path, "ab")
+        with locked(self.journal):
+            # Folding only truncates the journal, so the handle stays on the same file
+            start = self.journal.seek(0, os.SEEK_END)
+            self.journal.write(line)
+            # Written before the lock is released, start must stay where the line is
+            self.journal.flush()
+        if start == self.journal_offset:
+            # Nobody else wrote since the last refresh, don't read this line back
+            self.journal_offset = start + len(line)
+        if self.journal_limit and start + len(line) >= self.journal_limit:
+            self.snapshot(min_journal_size=self.journal_limit)
+
+    def _read_journal(self, f):
+        f.seek(self.journal_offset)
+        data = f.read()
+        # A line still being written by another process is read next time
+        data = data[:data.rfind(b"\n") + 1]
+        for line in data.splitlines():
+            self._apply(json.loads(line))
+        self.journal_offset += len(data)
+
+    def refresh(self, force=False):
+        """
+        Catches up with the journal lines and snapshots written by other processes.
+        """
+        if not self.path:
+            return
+        with self.lock:
+            now = time.monotonic()
+            if not force and now - self.refreshed_at < self.refresh_interval:
+                return
+            self.refreshed_at = now
+            if not os.path.exists(self.journal_path) and self.snapshot_stamp == file_stamp(self.path):
+                return
+            with open(self.journal_path, "a+b") as f, locked(f, exclusive=False):
+                journal_size = os.fstat(f.fileno()).st_size
+                if file_stamp(self.path) != self.snapshot_stamp or journal_size < self.journal_offset:
+                    self._load(f)
+                elif journal_size > self.journal_offset:
+                    self._read_journal(f)
+
+    def _load(self, journal):
+        self.snapshot_stamp = file_stamp(self.path)
+        items = {"ids": [], "terms": []}
+        if self.snapshot_stamp is not None:
+            with open(self.path, encoding="utf-8") as f:
+                items = json.load(f)
+        if "terms" not in items:
+            # Snapshots written before only the terms were kept
+            items["terms"] = [" ".join(terms(metadata.get("content") or "")) for metadata in items["metadata"]]
+        self._reset()
+        for vector_id, title in zip(items["ids"], items["terms"]):
+            self._add(vector_id, title.split())
+        self.journal_offset = 0
+        if journal is not None:
+            self._read_journal(journal)
+
+    def load(self):
+        with self.lock:
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path, "rb") as f, locked(f, exclusive=False):
+                    self._load(f)
+            else:
+                self._load(None)
+
+    def snapshot(self, min_journal_size=0):
+        """
+        Folds the journal into a new snapshot of the live documents and empties it.
+
+        Args:
+            min_journal_size (int): Only fold a journal of at least this many
+                bytes, another process may have folded it meanwhile.
+        """
+        if not self.path:
+            return
+        with self.lock, open(self.journal_path, "a+b") as f, locked(f):
+            if os.fstat(f.fileno()).st_size < min_journal_size:
+                return
+            if file_stamp(self.path) != self.snapshot_stamp:
+                self._load(f)
+            else:
+                self._read_journal(f)
+            live_rows = sorted(self.rows.values())
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as out:
+                json.dump({
+                    "ids": [self.ids[row] for row in live_rows],
+                    "terms": [" ".join(self.terms[row]) for row in live_rows]
+                }, out)
+            os.replace(tmp_path, self.path)
+            # Readers hold the lock while comparing both, so they never see one without the other
+            f.truncate(0)
+            self.snapshot_stamp = file_stamp(self.path)
+            self.journal_offset = 0
+
+    def rebuild(self, vector_store, page_size=100):
+        """
+        Re-indexes every product in the vector store, e.g. after migrate_product_ids.py.
+        Changes journaled meanwhile by other processes are kept.
+        """
+        with self.lock:
+            self.refresh(force=True)
+            journal_offset = self.journal_offset
+            snapshot_stamp = self.snapshot_stamp
+            self._reset()
+            for ids in vector_store.list_ids(page_size):
+                for vector_id, vector in vector_store.fetch(ids).items():
+                    self._add(vector_id, terms(vector["metadata"].get("content") or ""))
+            self.journal_offset = journal_offset
+            self.snapshot_stamp = snapshot_stamp
+            self.snapshot()
+            return len(self.rows)
+
+
+lexical_index = LexicalIndex()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Maintain the BM25 index of product titles.")
+    parser.add_argument("--rebuild", action="store_true", help="re-index every title in the vector store")
+    parser.add_argument("--snapshot", action="store_true", help="fold the journal into the snapshot")
+    args = parser.parse_args()
+
+    if args.snapshot:
+        lexical_index.snapshot()
+        print(f"Snapshot holds {len(lexical_index)} products")
+    elif args.rebuild:
+        from dotenv import load_dotenv
+        load_dotenv()
+        from vector_store import create_vector_store
+        print(f"Indexed {lexical_index.rebuild(create_vector_store())} products")
+    else:
+        parser.print_help()
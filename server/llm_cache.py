@@ -0,0 +1,214 @@
+"""
+Cache of the LLM's {message, product_tags} replies to the recommendation prompts.
+
+Exact lookups are keyed by the prompt kind, the normalized user query and
+a digest of the conversation history, so a user's follow-ups never reuse
+a reply written for another conversation. Queries without history can
+also reuse the reply to a semantically close query: the query is embedded
+and the closest cached query of the same kind is taken when its cosine
+similarity reaches LLM_CACHE_SIMILARITY.
+
+Entries expire after LLM_CACHE_TTL seconds and stay in a bounded
+in-memory LRU. When REDIS_URL is set, exact entries are shared through
+Redis as well; semantic lookups only see the local entries.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from scrape_cache import normalize_query
+
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", 512))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 3600))
+# Cosine similarity from which a history-free query reuses another's reply, 0 turns semantic lookups off
+LLM_CACHE_SIMILARITY = float(os.getenv("LLM_CACHE_SIMILARITY", 0.95))
+REDIS_URL = os.getenv("REDIS_URL", "")
+
+
+def history_digest(history_messages):
+    if not history_messages:
+        return ""
+    return hashlib.sha256(json.dumps(history_messages, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class Lookup:
+    """
+    The outcome of LLMCache.lookup: reply is the cached reply or None on a
+    miss, store() caches the reply generated after a miss.
+    """
+
+    def __init__(self, cache, kind, user_query, history, vector, reply):
+        self.cache = cache
+        self.kind = kind
+        self.user_query = user_query
+        self.history = history
+        self.vector = vector
+        self.reply = reply
+
+    def store(self, reply, seconds):
+        """
+        Args:
+            reply (dict): The parsed reply, only its message and product_tags are kept.
+            seconds (float): How long the completion took, counted as saved on every hit.
+        """
+        self.cache.set(self.kind, self.user_query, self.history, reply, seconds, self.vector)
+
+
+class LLMCache:
+    def __init__(self, max_entries=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL, similarity=LLM_CACHE_SIMILARITY,
+                 redis_url=REDIS_URL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        # key -> {"kind", "reply", "seconds", "expires", "vector"}
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "semantic_hits": 0, "shared_hits": 0, "misses": 0, "expired": 0,
+                         "seconds_saved": 0.0}
+        self.redis = None
+        if redis_url:
+            import redis
+            self.redis = redis.Redis.from_url(redis_url, socket_timeout=0.5)
+
+    def _key(self, kind, user_query, history):
+        return f"searchly:llm:{kind}:{history}:{normalize_query(user_query)}"
+
+    def exact(self, kind, user_query, history_messages=None):
+        """
+        The local exact lookup on its own: no Redis round trip and no
+        embedding, so the event loop can try it before handing lookup to
+        a thread.
+
+        Returns:
+            Lookup: With the cached reply, or None on a miss, which isn't counted.
+        """
+        history = history_digest(history_messages)
+        if self.max_entries <= 0:
+            return None
+        with self.lock:
+            entry = self._live(self._key(kind, user_query, history), time.time())
+            if entry is None:
+                return None
+            self._hit("hits", entry)
+            return Lookup(self, kind, user_query, history, entry["vector"], entry["reply"])
+
+    def lookup(self, kind, user_query, history_messages=None, embeddings=None):
+        """
+        Looks the prompt up, exactly and then semantically if it has no history.
+
+        Args:
+            kind (str): Which prompt the query goes into, replies of different prompts never mix.
+            history_messages (list): The conversation history included in the prompt.
+            embeddings: Embeds the query for the semantic lookup, None to skip it.
+
+        Returns:
+            Lookup: With the cached reply, or None as reply on a miss.
+        """
+        history = history_digest(history_messages)
+        key = self._key(kind, user_query, history)
+        now = time.time()
+        if self.max_entries <= 0:
+            return Lookup(self, kind, user_query, history, None, None)
+
+        # Exact keys first, locally then in Redis, the query is only embedded when both miss
+        found = self.exact(kind, user_query, history_messages)
+        if found is not None:
+            return found
+
+        if self.redis is not None:
+            try:
+                payload = self.redis.get(key)
+            except Exception as e:
+                print(f"LLM cache lookup failed: {e}")
+                payload = None
+            if payload is not None:
+                entry = json.loads(payload)
+                with self.lock:
+                    self._hit("shared_hits", entry)
+                return Lookup(self, kind, user_query, history, None, entry["reply"])
+
+        vector = None
+        if not history and self.similarity > 0 and embeddings is not None:
+            try:
+                vector = np.asarray(embeddings.embed_query(normalize_query(user_query)), dtype=np.float32)
+                vector /= np.linalg.norm(vector) or 1.0
+            except Exception as e:
+                print(f"LLM cache could not embed the query: {e}")
+            if vector is not None:
+                with self.lock:
+                    entry = self._nearest(kind, vector, now)
+                    if entry is not None:
+                        self._hit("semantic_hits", entry)
+                        return Lookup(self, kind, user_query, history, vector, entry["reply"])
+
+        with self.lock:
+            self.counters["misses"] += 1
+        return Lookup(self, kind, user_query, history, vector, None)
+
+    def set(self, kind, user_query, history, reply, seconds, vector=None):
+        if self.max_entries <= 0:
+            return
+        key = self._key(kind, user_query, history)
+        entry = {
+            "kind": kind,
+            "reply": {"message": reply.get("message", ""), "product_tags": list(reply.get("product_tags", []))},
+            "seconds": seconds,
+            "expires": time.time() + self.ttl,
+            "vector": vector
+        }
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        if self.redis is not None:
+            try:
+                self.redis.set(key, json.dumps({"reply": entry["reply"], "seconds": seconds}), ex=self.ttl)
+            except Exception as e:
+                print(f"LLM cache store failed: {e}")
+
+    def _live(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry["expires"] <= now:
+            del self.entries[key]
+            self.counters["expired"] += 1
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _nearest(self, kind, vector, now):
+        candidates = [(key, entry) for key, entry in self.entries.items()
+                      if entry["kind"] == kind and entry["vector"] is not None and entry["expires"] > now]
+        if not candidates:
+            return None
+        scores = np.stack([entry["vector"] for _, entry in candidates]) @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None
+        key, entry = candidates[best]
+        self.entries.move_to_end(key)
+        return entry
+
+    def _hit(self, counter, entry):
+        self.counters[counter] += 1
+        self.counters["seconds_saved"] += entry["seconds"]
+
+    def stats(self):
+        with self.lock:
+            hits = self.counters["hits"] + self.counters["semantic_hits"] + self.counters["shared_hits"]
+            lookups = hits + self.counters["misses"]
+            return {
+                **self.counters,
+                "seconds_saved": round(self.counters["seconds_saved"], 2),
+                "entries": len(self.entries),
+                "shared": self.redis is not None,
+                "hit_rate": hits / lookups if lookups else 0.0
+            }
+
+
+llm_cache = LLMCache()
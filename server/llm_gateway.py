@@ -0,0 +1,442 @@
+"""
+The one way the app talks to an LLM.
+
+LLMGateway wraps a provider with:
+  - a bound of LLM_MAX_CONCURRENCY calls in flight. Callers wait for a slot
+    at most until their deadline, then fail fast instead of piling up
+    behind a slow provider and tying up every worker,
+  - a deadline of LLM_DEADLINE seconds per call, covering the wait for a
+    slot, the first token and the whole stream,
+  - optional hedging (LLM_HEDGE=1). When the first token hasn't arrived
+    after the recent p95 time to first token, a second identical request
+    is sent if a slot is free, and whichever answers first is used.
+
+Providers only have to stream text. GroqProvider calls Groq. StubProvider
+answers deterministically with configurable latency and no network, for
+offline latency and load tests (LLM_PROVIDER=stub). AsyncLLMGateway does
+the same on an event loop for the ASGI app, with AsyncGroqProvider.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", 30))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", 95))
+# Times to first token kept for the percentile, and how many are needed before hedging starts
+LATENCY_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+LLM_STUB_FIRST_TOKEN_MS = float(os.getenv("LLM_STUB_FIRST_TOKEN_MS", 300))
+LLM_STUB_TOKEN_MS = float(os.getenv("LLM_STUB_TOKEN_MS", 10))
+
+
+class LLMTimeout(TimeoutError):
+    """Raised when a call can't get a slot or finish before its deadline."""
+
+
+class Provider:
+    """
+    The calls the gateway makes on an LLM API.
+    """
+    name = "provider"
+
+    def stream(self, model, messages, timeout, **kwargs):
+        """
+        Yields the completion's text as it is generated. Closing the generator
+        must abort the request. timeout is the seconds left for the whole call.
+        """
+        raise NotImplementedError
+
+    def astream(self, model, messages, timeout, **kwargs):
+        """
+        The same as an async generator, for AsyncLLMGateway. Cancelling the
+        task iterating it must abort the request.
+        """
+        raise NotImplementedError
+
+
+class GroqProvider(Provider):
+    name = "groq"
+
+    def __init__(self, api_key=None):
+        from groq import Groq
+        self.client = Groq(api_key=api_key or os.getenv("GROQ_API_KEY"))
+
+    def stream(self, model, messages, timeout, **kwargs):
+        stream = self.client.chat.completions.create(
+            model=model, messages=messages, stream=True, timeout=timeout, **kwargs
+        )
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.close()
+
+
+class AsyncGroqProvider(Provider):
+    name = "groq"
+
+    def __init__(self, api_key=None):
+        from groq import AsyncGroq
+        self.client = AsyncGroq(api_key=api_key or os.getenv("GROQ_API_KEY"))
+
+    async def astream(self, model, messages, timeout, **kwargs):
+        stream = await self.client.chat.completions.create(
+            model=model, messages=messages, stream=True, timeout=timeout, **kwargs
+        )
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+
+
+class StubProvider(Provider):
+    """
+    Answers the recommendation prompts with a well-formed reply built from the
+    user's query, and anything else with a short summary. The same messages
+    always get the same text and timing.
+    """
+    name = "stub"
+    SUFFIXES = ["for beginners", "premium", "budget", "best seller", "compact", "with warranty", "gift set"]
+
+    def __init__(self, first_token_ms=LLM_STUB_FIRST_TOKEN_MS, token_ms=LLM_STUB_TOKEN_MS, chars_per_token=4):
+        self.first_token_seconds = first_token_ms / 1000
+        self.token_seconds = token_ms / 1000
+        self.chars_per_token = chars_per_token
+
+    def reply(self, messages):
+        prompt = messages[-1]["content"] if messages[-1]["role"] == "user" else messages[-2]["content"]
+        seed = int(hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).hexdigest()[:16], 16)
+        rng = random.Random(seed)
+        asked = re.search(r"The user asked: '(.*)'\.", prompt, re.S)
+        if not asked:
+            return f"The user is shopping and has asked {len(prompt)} characters worth of questions."
+        query = asked.group(1)
+        tags = [f"{query} {suffix}" for suffix in rng.sample(self.SUFFIXES, rng.randint(3, 5))]
+        return json.dumps({
+            "product_tags": tags,
+            "message": f"Happy to help with '{query}'! Here are a few ideas that should fit what you're after."
+        })
+
+    def stream(self, model, messages, timeout, **kwargs):
+        text = self.reply(messages)
+        time.sleep(self.first_token_seconds)
+        for start in range(0, len(text), self.chars_per_token):
+            if start:
+                time.sleep(self.token_seconds)
+            yield text[start:start + self.chars_per_token]
+
+    async def astream(self, model, messages, timeout, **kwargs):
+        text = self.reply(messages)
+        await asyncio.sleep(self.first_token_seconds)
+        for start in range(0, len(text), self.chars_per_token):
+            if start:
+                await asyncio.sleep(self.token_seconds)
+            yield text[start:start + self.chars_per_token]
+
+
+class BaseGateway:
+    """
+    What the thread and asyncio gateways share: settings, counters and the
+    recent times to first token that hedging works from.
+    """
+
+    def __init__(self, provider, deadline=LLM_DEADLINE, hedge=LLM_HEDGE, hedge_percentile=LLM_HEDGE_PERCENTILE):
+        self.provider = provider
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.first_token_seconds = deque(maxlen=LATENCY_WINDOW)
+        self.lock = threading.Lock()
+        self.counters = {"calls": 0, "rejected": 0, "timeouts": 0, "errors": 0, "hedges": 0, "hedge_wins": 0}
+
+    def hedge_delay(self):
+        """
+        Returns:
+            float: Seconds without a first token after which to hedge, or None not to hedge yet.
+        """
+        with self.lock:
+            if not self.hedge or len(self.first_token_seconds) < HEDGE_MIN_SAMPLES:
+                return None
+            samples = sorted(self.first_token_seconds)
+        return samples[min(len(samples) - 1, int(len(samples) * self.hedge_percentile / 100))]
+
+    def _count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def _first_token(self, seconds, hedged):
+        with self.lock:
+            self.first_token_seconds.append(seconds)
+            if hedged:
+                self.counters["hedge_wins"] += 1
+
+    def stats(self):
+        hedge_after = self.hedge_delay()
+        with self.lock:
+            return {
+                **self.counters,
+                "provider": self.provider.name,
+                "hedge_after": round(hedge_after, 3) if hedge_after is not None else None
+            }
+
+
+class Slot:
+    """
+    An attempt's hold on one of the gateway's slots. It is given back once,
+    by whichever of the attempt's thread and the call is done with it first.
+    """
+
+    def __init__(self, slots):
+        self.slots = slots
+        self.lock = threading.Lock()
+        self.held = True
+
+    def release(self):
+        with self.lock:
+            held, self.held = self.held, False
+        if held:
+            self.slots.release()
+
+
+class LLMGateway(BaseGateway):
+    def __init__(self, provider, max_concurrency=LLM_MAX_CONCURRENCY, deadline=LLM_DEADLINE, hedge=LLM_HEDGE,
+                 hedge_percentile=LLM_HEDGE_PERCENTILE):
+        super().__init__(provider, deadline, hedge, hedge_percentile)
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        # Every attempt runs here. An abandoned attempt, e.g. a losing hedge, gives its slot back at
+        # once but keeps its thread until the provider's next chunk, so there are threads to spare
+        self.pool = ThreadPoolExecutor(max_workers=2 * max_concurrency, thread_name_prefix="llm")
+
+    def _attempt(self, number, model, messages, deadline, events, stop, slot, kwargs):
+        chunks = None
+        try:
+            chunks = self.provider.stream(model, messages, max(deadline - time.monotonic(), 0.001), **kwargs)
+            for text in chunks:
+                if stop.is_set():
+                    break
+                events.put((number, "text", text))
+            events.put((number, "end", None))
+        except Exception as e:
+            events.put((number, "error", e))
+        finally:
+            if chunks is not None and hasattr(chunks, "close"):
+                chunks.close()
+            slot.release()
+
+    def stream(self, messages, model, deadline=None, **kwargs):
+        """
+        Streams a completion through the provider.
+
+        Args:
+            messages (list): The chat messages.
+            model (str): The provider's model name.
+            deadline (float): Seconds for the whole call, LLM_DEADLINE by default.
+            kwargs: Passed on to the provider, e.g. stop or max_tokens.
+
+        Yields:
+            str: The completion's text as it arrives.
+
+        Raises:
+            LLMTimeout: If no slot frees up or the call doesn't finish in time.
+        """
+        started = time.monotonic()
+        deadline = started + (self.deadline if deadline is None else deadline)
+        self._count("calls")
+        if not self.slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            self._count("rejected")
+            raise LLMTimeout(f"No LLM capacity within {deadline - started:.1f}s")
+
+        events = queue.Queue()
+        stops = [threading.Event()]
+        held = [Slot(self.slots)]
+        # When each attempt was sent, waiting for the slot doesn't count towards time to first token
+        sent = [time.monotonic()]
+        self.pool.submit(self._attempt, 0, model, messages, deadline, events, stops[0], held[0], kwargs)
+        hedge_delay = self.hedge_delay()
+        hedge_at = sent[0] + hedge_delay if hedge_delay is not None else None
+        winner = None
+        failed = 0
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    self._count("timeouts")
+                    raise LLMTimeout(f"LLM call missed its {deadline - started:.1f}s deadline")
+                wait_until = deadline if hedge_at is None or winner is not None else min(hedge_at, deadline)
+                try:
+                    number, kind, payload = events.get(timeout=max(wait_until - now, 0))
+                except queue.Empty:
+                    if hedge_at is not None and winner is None and time.monotonic() >= hedge_at:
+                        hedge_at = None
+                        # A hedge only uses spare capacity, it never waits for a slot
+                        if self.slots.acquire(blocking=False):
+                            self._count("hedges")
+                            stops.append(threading.Event())
+                            held.append(Slot(self.slots))
+                            sent.append(time.monotonic())
+                            self.pool.submit(self._attempt, 1, model, messages, deadline, events, stops[1], held[1],
+                                             kwargs)
+                    continue
+                if winner is not None and number != winner:
+                    continue
+                if kind == "error":
+                    failed += 1
+                    if failed < len(stops) and winner is None:
+                        # The other attempt may still answer
+                        continue
+                    self._count("errors")
+                    raise payload
+                if winner is None:
+                    winner = number
+                    self._first_token(time.monotonic() - sent[number], number == 1)
+                    for other, stop in enumerate(stops):
+                        if other != number:
+                            # The loser's slot is free for other calls from now on
+                            stop.set()
+                            held[other].release()
+                if kind == "end":
+                    return
+                yield payload
+        finally:
+            for stop, slot in zip(stops, held):
+                stop.set()
+                slot.release()
+
+    def complete(self, messages, model, deadline=None, **kwargs):
+        """
+        Returns:
+            str: The whole completion, see stream for the arguments.
+        """
+        return "".join(self.stream(messages, model, deadline, **kwargs))
+
+
+class AsyncLLMGateway(BaseGateway):
+    """
+    LLMGateway for the ASGI app: the same limits, deadlines and hedging,
+    with attempts running as tasks on the event loop instead of threads.
+    """
+
+    def __init__(self, provider, max_concurrency=LLM_MAX_CONCURRENCY, deadline=LLM_DEADLINE, hedge=LLM_HEDGE,
+                 hedge_percentile=LLM_HEDGE_PERCENTILE):
+        super().__init__(provider, deadline, hedge, hedge_percentile)
+        self.slots = asyncio.Semaphore(max_concurrency)
+
+    async def _attempt(self, number, model, messages, deadline, events, kwargs):
+        try:
+            async for text in self.provider.astream(model, messages, max(deadline - time.monotonic(), 0.001),
+                                                    **kwargs):
+                events.put_nowait((number, "text", text))
+            events.put_nowait((number, "end", None))
+        except Exception as e:
+            events.put_nowait((number, "error", e))
+
+    def _start(self, number, model, messages, deadline, events, kwargs):
+        slot = Slot(self.slots)
+        task = asyncio.ensure_future(self._attempt(number, model, messages, deadline, events, kwargs))
+        # Released when the task ends, even if it was cancelled before it started
+        task.add_done_callback(lambda _: slot.release())
+        return task, slot
+
+    async def stream(self, messages, model, deadline=None, **kwargs):
+        """
+        Async version of LLMGateway.stream.
+        """
+        started = time.monotonic()
+        deadline = started + (self.deadline if deadline is None else deadline)
+        self._count("calls")
+        try:
+            await asyncio.wait_for(self.slots.acquire(), timeout=max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            self._count("rejected")
+            raise LLMTimeout(f"No LLM capacity within {deadline - started:.1f}s")
+
+        events = asyncio.Queue()
+        sent = [time.monotonic()]
+        task, slot = self._start(0, model, messages, deadline, events, kwargs)
+        tasks, held = [task], [slot]
+        hedge_delay = self.hedge_delay()
+        hedge_at = sent[0] + hedge_delay if hedge_delay is not None else None
+        winner = None
+        failed = 0
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    self._count("timeouts")
+                    raise LLMTimeout(f"LLM call missed its {deadline - started:.1f}s deadline")
+                wait_until = deadline if hedge_at is None or winner is not None else min(hedge_at, deadline)
+                try:
+                    number, kind, payload = await asyncio.wait_for(events.get(), timeout=max(wait_until - now, 0))
+                except asyncio.TimeoutError:
+                    if hedge_at is not None and winner is None and time.monotonic() >= hedge_at:
+                        hedge_at = None
+                        # A hedge only uses spare capacity, it never waits for a slot
+                        if not self.slots.locked():
+                            await self.slots.acquire()
+                            self._count("hedges")
+                            sent.append(time.monotonic())
+                            task, slot = self._start(1, model, messages, deadline, events, kwargs)
+                            tasks.append(task)
+                            held.append(slot)
+                    continue
+                if winner is not None and number != winner:
+                    continue
+                if kind == "error":
+                    failed += 1
+                    if failed < len(tasks) and winner is None:
+                        # The other attempt may still answer
+                        continue
+                    self._count("errors")
+                    raise payload
+                if winner is None:
+                    winner = number
+                    self._first_token(time.monotonic() - sent[number], number == 1)
+                    for other, task in enumerate(tasks):
+                        if other != number:
+                            # The loser's slot is free for other calls from now on, not once it has unwound
+                            task.cancel()
+                            held[other].release()
+                if kind == "end":
+                    return
+                yield payload
+        finally:
+            for task, slot in zip(tasks, held):
+                task.cancel()
+                slot.release()
+
+    async def complete(self, messages, model, deadline=None, **kwargs):
+        """
+        Returns:
+            str: The whole completion, see LLMGateway.stream for the arguments.
+        """
+        return "".join([text async for text in self.stream(messages, model, deadline, **kwargs)])
+
+
+def create_gateway(provider=LLM_PROVIDER):
+    if provider == "groq":
+        return LLMGateway(GroqProvider())
+    if provider == "stub":
+        return LLMGateway(StubProvider())
+    raise ValueError(f"Unknown LLM provider: {provider}")
+
+
+def create_async_gateway(provider=LLM_PROVIDER):
+    if provider == "groq":
+        return AsyncLLMGateway(AsyncGroqProvider())
+    if provider == "stub":
+        return AsyncLLMGateway(StubProvider())
+    raise ValueError(f"Unknown LLM provider: {provider}")
@@ -0,0 +1,117 @@
+"""
+Metadata filters in Pinecone's query syntax.
+
+    {"price_value": {"$gte": 500, "$lte": 2000}, "rating_value": {"$gte": 4}}
+
+PineconeStore passes them through to the index. LocalStore and the BM25
+index evaluate them here, as a mask over every row before ranking, so
+filtering never needs over-fetching.
+"""
+import operator
+import numpy as np
+
+COMPARISONS = {
+    "$eq": operator.eq,
+    "$ne": operator.ne,
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le
+}
+SET_OPERATORS = ("$in", "$nin")
+
+
+def build_filter(min_price=None, max_price=None, min_rating=None):
+    """
+    Returns:
+        dict: A metadata filter on the parsed price and rating, or None without bounds.
+    """
+    conditions = {}
+    price = {}
+    if min_price is not None:
+        price["$gte"] = float(min_price)
+    if max_price is not None:
+        price["$lte"] = float(max_price)
+    if price:
+        conditions["price_value"] = price
+    if min_rating is not None:
+        conditions["rating_value"] = {"$gte": float(min_rating)}
+    return conditions or None
+
+
+def _conditions(metadata_filter):
+    for field, condition in metadata_filter.items():
+        if field in ("$and", "$or"):
+            continue
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, operand in condition.items():
+            if op not in COMPARISONS and op not in SET_OPERATORS:
+                raise ValueError(f"Unsupported filter operator: {op}")
+            yield field, op, operand
+
+
+def _compare(value, op, operand):
+    if value is None:
+        # A missing field only satisfies negative conditions
+        return op in ("$ne", "$nin")
+    if op == "$in":
+        return value in operand
+    if op == "$nin":
+        return value not in operand
+    try:
+        return COMPARISONS[op](value, operand)
+    except TypeError:
+        return False
+
+
+def matches(metadata, metadata_filter):
+    """
+    Whether one metadata dict satisfies the filter.
+    """
+    if not metadata_filter:
+        return True
+    if "$and" in metadata_filter and not all(matches(metadata, part) for part in metadata_filter["$and"]):
+        return False
+    if "$or" in metadata_filter and not any(matches(metadata, part) for part in metadata_filter["$or"]):
+        return False
+    return all(_compare(metadata.get(field), op, operand) for field, op, operand in _conditions(metadata_filter))
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def filter_mask(table, metadata_filter):
+    """
+    Evaluates the filter for every row of a MetadataTable at once. Numeric
+    conditions run on the table's numeric columns, anything else falls
+    back to checking rows one by one.
+
+    Returns:
+        np.ndarray: One bool per row.
+    """
+    mask = np.ones(len(table), dtype=bool)
+    if not metadata_filter:
+        return mask
+    for part in metadata_filter.get("$and", []):
+        mask &= filter_mask(table, part)
+    if "$or" in metadata_filter:
+        mask &= np.logical_or.reduce([filter_mask(table, part) for part in metadata_filter["$or"]])
+    for field, op, operand in _conditions(metadata_filter):
+        if op in COMPARISONS and _is_number(operand):
+            values = table.numbers(field)
+            if op == "$ne":
+                # NaN marks a missing field, which satisfies $ne
+                mask &= np.isnan(values) | (values != operand)
+            else:
+                with np.errstate(invalid="ignore"):
+                    mask &= COMPARISONS[op](values, operand)
+        elif op in SET_OPERATORS and all(_is_number(item) for item in operand):
+            found = np.isin(table.numbers(field), np.asarray(operand, dtype=np.float64))
+            mask &= found if op == "$in" else ~found
+        else:
+            rows = np.flatnonzero(mask)
+            for row in rows.tolist():
+                mask[row] = _compare(table.get(row).get(field), op, operand)
+    return mask
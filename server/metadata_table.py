@@ -0,0 +1,104 @@
+"""
+Array-backed side table for product metadata.
+
+Each field is a column holding every row's JSON-encoded value in one
+bytearray, with the row boundaries in an array of offsets. A million
+products then cost a handful of Python objects instead of a million dicts
+and seven million strings. Rows are decoded back into dicts on access,
+which only happens for the few rows a query returns. Fields that filters
+compare numerically also get a float64 column, built on first use.
+"""
+import json
+import math
+from array import array
+import numpy as np
+
+
+class MetadataTable:
+    def __init__(self, rows=()):
+        # name -> (data, offsets), offsets has one entry more than there are rows
+        self.columns = {}
+        # name -> array("d") of every row's value, NaN where missing or not a number
+        self.numeric = {}
+        self.size = 0
+        for metadata in rows:
+            self.append(metadata)
+
+    def __len__(self):
+        return self.size
+
+    def append(self, metadata):
+        metadata = metadata or {}
+        for name in metadata:
+            if name not in self.columns:
+                # Earlier rows have no value for a new field
+                self.columns[name] = (bytearray(), array("Q", [0] * (self.size + 1)))
+        for name, (data, offsets) in self.columns.items():
+            if name in metadata:
+                data += json.dumps(metadata[name], ensure_ascii=False).encode("utf-8")
+            offsets.append(len(data))
+        for name, values in self.numeric.items():
+            values.append(as_number(metadata.get(name)))
+        self.size += 1
+
+    def _value(self, name, row):
+        if name not in self.columns:
+            return None
+        data, offsets = self.columns[name]
+        start, end = offsets[row], offsets[row + 1]
+        return json.loads(data[start:end]) if end > start else None
+
+    def numbers(self, name):
+        """
+        Returns:
+            np.ndarray: A float64 copy of the field for every row, NaN where it isn't a number.
+        """
+        if name not in self.numeric:
+            self.numeric[name] = array("d", (as_number(self._value(name, row)) for row in range(self.size)))
+        # A copy, so no view pins the array's buffer while rows are appended
+        return np.array(self.numeric[name], dtype=np.float64)
+
+    def get(self, row):
+        metadata = {}
+        for name, (data, offsets) in self.columns.items():
+            start, end = offsets[row], offsets[row + 1]
+            if end > start:
+                metadata[name] = json.loads(data[start:end])
+        return metadata
+
+    def take(self, rows):
+        """
+        Returns a new table holding only the given rows, in that order.
+        """
+        table = MetadataTable()
+        for name, (data, offsets) in self.columns.items():
+            taken = bytearray()
+            taken_offsets = array("Q", [0])
+            for row in rows:
+                taken += data[offsets[row]:offsets[row + 1]]
+                taken_offsets.append(len(taken))
+            table.columns[name] = (taken, taken_offsets)
+        for name, values in self.numeric.items():
+            table.numeric[name] = array("d", (values[row] for row in rows))
+        table.size = len(rows)
+        return table
+
+    def copy(self):
+        """
+        Returns a table with the same rows that later appends don't touch.
+        """
+        table = MetadataTable()
+        table.columns = {name: (bytearray(data), array("Q", offsets)) for name, (data, offsets) in self.columns.items()}
+        table.numeric = {name: array("d", values) for name, values in self.numeric.items()}
+        table.size = self.size
+        return table
+
+    def nbytes(self):
+        return (sum(len(data) + offsets.itemsize * len(offsets) for data, offsets in self.columns.values())
+                + sum(values.itemsize * len(values) for values in self.numeric.values()))
+
+
+def as_number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return math.nan
@@ -0,0 +1,69 @@
+"""
+One-off migration from random uuid4 vector IDs to content-addressed product IDs.
+
+Walks the vector store page by page, re-keys every vector under
+product_id(link, content) and deletes the old IDs. Vectors that were
+duplicates of the same product collapse into a single one. Only the set
+of IDs already written is kept in memory, never the vectors themselves.
+The migration is idempotent, a second run reports nothing left to re-key.
+
+Usage:
+    python migrate_product_ids.py            # report what would change
+    python migrate_product_ids.py --apply    # rewrite the index
+"""
+import argparse
+from dotenv import load_dotenv
+from product_ids import product_id
+
+load_dotenv()
+
+from vector_store import create_vector_store
+
+
+def migrate(vector_store, apply=False, page_size=100):
+    written = set()
+    report = {"scanned": 0, "rekeyed": 0, "duplicates_removed": 0, "unchanged": 0}
+
+    for ids in vector_store.list_ids(page_size):
+        vectors = vector_store.fetch(ids)
+        upserts = []
+        deletes = []
+        for old_id, vector in vectors.items():
+            report["scanned"] += 1
+            metadata = vector["metadata"]
+            new_id = product_id(metadata.get("link", ""), metadata.get("content", ""))
+
+            if new_id == old_id:
+                # Already migrated, or written earlier in this run
+                if new_id not in written:
+                    written.add(new_id)
+                    report["unchanged"] += 1
+                continue
+
+            deletes.append(old_id)
+            if new_id in written:
+                report["duplicates_removed"] += 1
+                continue
+            written.add(new_id)
+            upserts.append({"id": new_id, "values": vector["values"], "metadata": metadata})
+            report["rekeyed"] += 1
+
+        if apply:
+            # Write the new IDs before deleting the old ones so nothing is lost midway
+            if upserts:
+                vector_store.upsert(upserts)
+            if deletes:
+                vector_store.delete(deletes)
+        print(f"Scanned {report['scanned']} vectors, {report['rekeyed']} re-keyed, "
+              f"{report['duplicates_removed']} duplicates")
+
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Re-key product vectors by canonical URL and drop duplicates.")
+    parser.add_argument("--apply", action="store_true", help="write the changes instead of only reporting them")
+    args = parser.parse_args()
+
+    report = migrate(create_vector_store(), apply=args.apply)
+    print(report if args.apply else f"Dry run, nothing written: {report}")
@@ -0,0 +1,127 @@
+"""
+ONNX Runtime backend for the sentence-transformer the app embeds with.
+
+The model HuggingFaceEmbeddings loads by default is exported once to ONNX
+and, unless ONNX_QUANTIZE=0, dynamically quantized to int8 weights. At
+runtime only onnxruntime and tokenizers are needed, not PyTorch. Pooling
+matches the sentence-transformers model (mean over tokens, then L2
+normalization), so its vectors stay within COSINE_TOLERANCE of the
+PyTorch ones already stored in the index.
+
+Export ahead of time to keep it off the warm-up path:
+
+    python onnx_embeddings.py --export [--no-quantize]
+
+Select it with EMBEDDING_BACKEND=onnx.
+"""
+import argparse
+import os
+import numpy as np
+
+MODEL_NAME = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "onnx_model")
+ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "1") == "1"
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", os.cpu_count() or 1))
+ONNX_BATCH_SIZE = int(os.getenv("ONNX_BATCH_SIZE", 32))
+# Same limit as the sentence-transformers model config
+MAX_SEQ_LENGTH = 384
+# Every ONNX vector has cosine >= 1 - COSINE_TOLERANCE with the PyTorch one,
+# checked by benchmarks/bench_embeddings.py
+COSINE_TOLERANCE = 0.02
+
+
+def model_file(model_dir, quantize):
+    return os.path.join(model_dir, "model_quantized.onnx" if quantize else "model.onnx")
+
+
+def export_model(model_name=MODEL_NAME, model_dir=ONNX_MODEL_DIR, quantize=ONNX_QUANTIZE):
+    """
+    Exports the transformer and its tokenizer to model_dir, and the int8
+    variant next to it when quantize is set. Needs optimum[onnxruntime].
+
+    Returns:
+        str: Path of the .onnx file to load.
+    """
+    from optimum.exporters.onnx import main_export
+
+    if not os.path.exists(model_file(model_dir, False)):
+        main_export(model_name, output=model_dir, task="feature-extraction")
+    if quantize and not os.path.exists(model_file(model_dir, True)):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(model_file(model_dir, False), model_file(model_dir, True), weight_type=QuantType.QInt8)
+    return model_file(model_dir, quantize)
+
+
+class OnnxEmbeddings:
+    """
+    Exposes embed_query/embed_documents like HuggingFaceEmbeddings.
+    The model is exported on first use if model_dir doesn't hold it yet.
+    """
+
+    def __init__(self, model_name=MODEL_NAME, model_dir=ONNX_MODEL_DIR, quantize=ONNX_QUANTIZE,
+                 threads=ONNX_THREADS, batch_size=ONNX_BATCH_SIZE):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        path = model_file(model_dir, quantize)
+        if not os.path.exists(path):
+            path = export_model(model_name, model_dir, quantize)
+
+        # Quantized vectors differ slightly, keep them apart in the embedding cache
+        self.model_name = f"{model_name}:onnx{'-int8' if quantize else ''}"
+        self.batch_size = batch_size
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding()
+
+    def _embed_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            inputs["token_type_ids"] = np.zeros_like(input_ids)
+
+        token_embeddings = self.session.run(None, inputs)[0]
+        # Mean pooling over real tokens, as the sentence-transformers Pooling layer does
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        # Sorting by length keeps padding within each batch small
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._embed_batch([texts[i] for i in batch])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX.")
+    parser.add_argument("--export", action="store_true", help="export (and quantize) the model")
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--output", default=ONNX_MODEL_DIR)
+    parser.add_argument("--no-quantize", action="store_true")
+    args = parser.parse_args()
+
+    if args.export:
+        print(f"Exported to {export_model(args.model, args.output, not args.no_quantize)}")
+    else:
+        parser.print_help()
@@ -0,0 +1,66 @@
+"""
+Deterministic product IDs derived from canonical product URLs.
+
+The same product scraped twice, even through links carrying different
+tracking parameters, maps to the same vector ID, so re-ingesting it
+overwrites its vector instead of adding a duplicate.
+"""
+import hashlib
+import re
+from urllib.parse import urlsplit, parse_qsl, urlencode, urljoin
+
+AMAZON_ASIN = re.compile(r"/(?:dp|gp/product|gp/aw/d)/([A-Z0-9]{10})(?:[/?]|$)", re.I)
+
+# Query parameters that only track the visit and never identify the product
+TRACKING_PARAMS = re.compile(
+    r"^(utm_.*|ref|ref_|tag|qid|sr|sprefix|crid|keywords|dib|dib_tag|th|psc|"
+    r"lid|marketplace|q|store|srno|otracker.*|fm|iid|ppt|ppn|ssid|spotlighttagid|"
+    r"sattr\[\]|st|gclid|fbclid)$",
+    re.I
+)
+
+
+def canonical_url(url):
+    """
+    Reduces a product link to the part that identifies the product:
+    https://www.amazon.in/dp/<ASIN> for Amazon, https://www.flipkart.com/p?pid=<PID>
+    for Flipkart, and the URL without tracking parameters for anything else.
+    """
+    if not url:
+        return ""
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if not host:
+        return ""
+    if host.startswith("www."):
+        host = host[4:]
+    params = parse_qsl(parts.query, keep_blank_values=True)
+
+    if host.startswith("amazon."):
+        if parts.path.startswith("/sspa/click"):
+            # Sponsored results wrap the real product link in the url parameter
+            target = next((value for key, value in params if key == "url" and value), None)
+            if target:
+                return canonical_url(urljoin(url, target))
+        asin = AMAZON_ASIN.search(parts.path)
+        if asin:
+            return f"https://www.{host}/dp/{asin.group(1).upper()}"
+
+    if host == "flipkart.com":
+        pid = next((value for key, value in params if key == "pid" and value), None)
+        if pid:
+            return f"https://www.flipkart.com/p?pid={pid.upper()}"
+
+    kept = sorted((key, value) for key, value in params if not TRACKING_PARAMS.match(key))
+    path = parts.path.rstrip("/") or "/"
+    query = f"?{urlencode(kept)}" if kept else ""
+    return f"{parts.scheme.lower() or 'https'}://{host}{path}{query}"
+
+
+def product_id(url, title=""):
+    """
+    Returns a stable vector ID for a product: a hash of its canonical URL,
+    or of its normalized title when the link is missing.
+    """
+    key = canonical_url(url) or "title:" + " ".join(title.lower().split())
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
@@ -0,0 +1,170 @@
+"""
+Single-pass product card extraction for Amazon and Flipkart search pages.
+
+Mirrors the get_* helpers in scrape_web.py field for field, but uses lxml
+with precompiled XPath selectors and only keeps the parts of the page that
+can contain result cards. Each card is visited once and every field is read
+in the same pass.
+"""
+import re
+from lxml import etree
+
+# Scripts, styles and comments make up most of a search page and never contain cards
+NON_CONTENT = re.compile(
+    r"<script\b[^>]*>.*?</script\s*>|<style\b[^>]*>.*?</style\s*>|<!--.*?-->",
+    re.S | re.I
+)
+
+PARSER = etree.HTMLParser(
+    recover=True,
+    no_network=True,
+    remove_comments=True,
+    remove_pis=True,
+    collect_ids=False
+)
+
+
+def has_class(name):
+    # Matches one class among many, like BeautifulSoup's attrs={'class': name}
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def class_is(value):
+    # Matches the whole class attribute, like BeautifulSoup with a multi-word class string
+    return f"normalize-space(@class)='{value}'"
+
+
+AMAZON_CARDS = etree.XPath("//div[@data-component-type='s-search-result']")
+AMAZON_IMAGE = etree.XPath(f"(.//img[{has_class('s-image')}])[1]")
+AMAZON_LINK = etree.XPath(
+    "(.//a[" + class_is('a-link-normal s-underline-text s-underline-link-text s-link-style a-text-normal') + "])[1]"
+)
+AMAZON_LINK_FALLBACK = etree.XPath("(.//a[" + class_is('a-link-normal s-no-outline') + "])[1]")
+AMAZON_RATING = etree.XPath(f"(.//span[{has_class('a-icon-alt')}])[1]")
+AMAZON_REVIEWS = etree.XPath("(.//span[" + class_is('a-size-base s-underline-text') + "])[1]")
+AMAZON_PRICE = etree.XPath(f"(.//span[{has_class('a-price-whole')}])[1]")
+
+FLIPKART_CARDS = etree.XPath(
+    f"//div[{has_class('slAVV4')} or ({has_class('_1sdMkc')} and {has_class('LFEi7Z')})]"
+)
+FLIPKART_IMAGE = etree.XPath(f"(.//img[{has_class('DByuf4')}])[1]")
+FLIPKART_IMAGE_FALLBACK = etree.XPath(f"(.//img[{has_class('_53J4C-')}])[1]")
+FLIPKART_BRAND = etree.XPath(f"(.//div[{has_class('syl9yP')}])[1]")
+FLIPKART_TITLE_LINK = etree.XPath(f"(.//a[{has_class('WKTcLC')}])[1]")
+FLIPKART_LINK = etree.XPath("(.//a[normalize-space(@rel)='noopener noreferrer'])[1]")
+FLIPKART_PRICE = etree.XPath(f"(.//div[{has_class('Nx9bqj')}])[1]")
+FLIPKART_RATING = etree.XPath(f"(.//div[{has_class('XQDdHH')}])[1]")
+FLIPKART_REVIEWS = etree.XPath(f"(.//span[{has_class('Wphh3N')}])[1]")
+
+
+def parse_tree(webpage):
+    webpage = NON_CONTENT.sub("", webpage)
+    if not webpage.strip():
+        return None
+    return etree.fromstring(webpage, PARSER)
+
+
+def first(selector, node):
+    matches = selector(node)
+    return matches[0] if matches else None
+
+
+def text_of(node):
+    # Same as BeautifulSoup's .text
+    return "".join(node.itertext())
+
+
+def string_of(node):
+    # Same as BeautifulSoup's .string: the only string inside the tag, or None
+    while True:
+        if len(node) == 0:
+            return node.text
+        if len(node) > 1 or node.text or node[0].tail:
+            return None
+        node = node[0]
+
+
+def parse_amazon(webpage):
+    """
+    Extracts product dicts from an Amazon search results page.
+
+    Returns the same list scrape_amazon built with the get_* helpers.
+    """
+    tree = parse_tree(webpage)
+    if tree is None:
+        return []
+
+    product_list = []
+    for card in AMAZON_CARDS(tree):
+        image = first(AMAZON_IMAGE, card)
+        title = image.get('alt') if image is not None else ""
+        if not title:
+            continue
+
+        link = first(AMAZON_LINK, card)
+        if link is None:
+            link = first(AMAZON_LINK_FALLBACK, card)
+        rating = first(AMAZON_RATING, card)
+        rating = string_of(rating) if rating is not None else None
+        reviews = first(AMAZON_REVIEWS, card)
+        reviews = string_of(reviews) if reviews is not None else None
+        price = first(AMAZON_PRICE, card)
+
+        product_list.append({
+            'source': "amazon",
+            'title': title,
+            'link': "https://www.amazon.in" + (link.get('href') or "") if link is not None else "",
+            'image': image.get('src'),
+            'rating': rating.strip() if rating is not None else "",
+            'review_count': reviews.strip() if reviews is not None else "",
+            'price': "Rs." + (text_of(price) if price is not None else "")
+        })
+    return product_list
+
+
+def parse_flipkart(webpage):
+    """
+    Extracts product dicts from a Flipkart search results page.
+
+    Returns the same list scrape_flipkart built with the get_* helpers.
+    """
+    tree = parse_tree(webpage)
+    if tree is None:
+        return []
+
+    product_list = []
+    for card in FLIPKART_CARDS(tree):
+        image = first(FLIPKART_IMAGE, card)
+        if image is not None:
+            title = image.get('alt') or ""
+            image_url = image.get('src')
+        else:
+            brand = first(FLIPKART_BRAND, card)
+            title_link = first(FLIPKART_TITLE_LINK, card)
+            brand_string = text_of(brand).strip() + " " if brand is not None else ""
+            title_string = title_link.get('title') if title_link is not None else None
+            title = brand_string + (title_string or "")
+            fallback_image = first(FLIPKART_IMAGE_FALLBACK, card)
+            image_url = fallback_image.get('src') if fallback_image is not None else ""
+        if not title:
+            continue
+
+        link = first(FLIPKART_LINK, card)
+        href = link.get('href') if link is not None else None
+        price = first(FLIPKART_PRICE, card)
+        rating = first(FLIPKART_RATING, card)
+        reviews = first(FLIPKART_REVIEWS, card)
+
+        product_list.append({
+            'source': "flipkart",
+            'title': title,
+            'link': "https://www.flipkart.com" + href if href is not None else "",
+            'image': image_url,
+            'rating': text_of(rating).strip() if rating is not None else "",
+            'review_count': (
+                "".join(s.strip() for s in reviews.itertext()).replace('(', '').replace(')', '')
+                if reviews is not None else ""
+            ),
+            'price': text_of(price) if price is not None else "Rs."
+        })
+    return product_list
@@ -0,0 +1,53 @@
+"""
+Numeric values parsed from the price, rating and review strings the scrapers return.
+
+The display strings stay as they are, typed copies are stored next to them
+in the vector metadata so the index can filter on them:
+
+    "Rs.1,299." / "₹1,299"   -> price_value 1299.0
+    "4.2 out of 5 stars"     -> rating_value 4.2
+    "(12,345)" / "1.2K"      -> review_count_value 12345 / 1200
+
+Fields that don't parse are left out, Pinecone rejects null metadata values.
+"""
+import re
+
+NUMBER = re.compile(r"\d[\d,]*(?:\.\d+)?")
+COUNT = re.compile(r"(\d[\d,]*(?:\.\d+)?)\s*([kKmM]?)")
+MULTIPLIERS = {"": 1, "k": 1_000, "m": 1_000_000}
+
+
+def parse_number(text):
+    match = NUMBER.search(str(text or ""))
+    return float(match.group().replace(",", "")) if match else None
+
+
+def parse_price(price):
+    # The first amount wins for ranges like "₹1,299 - ₹1,999"
+    return parse_number(price)
+
+
+def parse_rating(rating):
+    value = parse_number(rating)
+    return value if value is not None and 0 <= value <= 5 else None
+
+
+def parse_review_count(review_count):
+    match = COUNT.search(str(review_count or ""))
+    if not match:
+        return None
+    number, suffix = match.groups()
+    return int(float(number.replace(",", "")) * MULTIPLIERS[suffix.lower()])
+
+
+def numeric_fields(price, rating, review_count):
+    """
+    Returns:
+        dict: price_value, rating_value and review_count_value, for the ones that parse.
+    """
+    values = {
+        "price_value": parse_price(price),
+        "rating_value": parse_rating(rating),
+        "review_count_value": parse_review_count(review_count)
+    }
+    return {name: value for name, value in values.items() if value is not None}
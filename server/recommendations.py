@@ -1,279 +1,648 @@
+import asyncio
 import json
-from flask import Flask, request, jsonify
+import math
+from flask import request, jsonify, Response, stream_with_context
 from datetime import datetime
-from uuid import uuid4
-from pymongo import MongoClient
 import time
-import pandas as pd
-from pinecone import Pinecone
-from langchain.embeddings import HuggingFaceEmbeddings
 import random
-import asyncio
-from scrape_web import scrape
+import os
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from concurrent.futures import FIRST_COMPLETED, wait
+from scrape_web import iter_scrape_many, iter_scrape, scraper
+from product_ids import product_id
+from lexical_index import lexical_index, reciprocal_rank_fusion
+from result_cache import result_cache
+from llm_cache import llm_cache
+from history_manager import conversation_history, schedule_summary
+from llm_gateway import LLMTimeout
+from product_values import numeric_fields
+from metadata_filter import matches
+from validation import read_email, read_query, read_recommendation_request
+from stream_parser import RecommendationStreamParser
 
 SIMILARITY_THRESHOLD =0.2
+LLM_MODEL = "llama3-70b-8192"
+# Vectors per upsert request and upsert requests sent in parallel during ingestion
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", 100))
+UPSERT_WORKERS = int(os.getenv("UPSERT_WORKERS", 2))
+# Concurrent vector queries for multi-tag lookups and how long to wait for them
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", 8))
+QUERY_DEADLINE = float(os.getenv("QUERY_DEADLINE", 5))
+# Threads ingesting scraped tags, shared by every request since the embedding model is the bottleneck anyway
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))
+# Candidates taken from each of the vector and BM25 rankings per requested item before fusing
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 3))
+# Tags kept per user, the newest ones
+MAX_TAGS = 20
+# Tags /get_recommendations looks up
+RECOMMENDATION_TAGS = 21
 
-def save_conversation(email, query, bot_response, tags, search_results, history_collection):
-    history_entry = {
+query_pool = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="vector-query")
+ingest_pool = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="tag-ingest")
+
+def history_entry(query, bot_response, tags, search_results):
+    return {
         "timestamp": datetime.utcnow(),
         "query": query,
         "bot_response": bot_response,
         "product_tags": tags,
         "search_results": search_results
     }
-    if history_collection.find_one({"email": email}):
-        history_collection.update_one(
-            {"email": email},
-            {"$push": {"history": history_entry}}
-        )
-    else:
-        history_document = {
-            "email": email,
-            "history": [history_entry]
-        }
-        history_collection.insert_one(history_document)
+
+
+def conversation_update(email, query, bot_response, tags, search_results):
+    """
+    The filter and update that append a turn to the user's history,
+    creating the document on the first one, so run them with upsert=True.
+    """
+    return {"email": email}, {"$push": {"history": history_entry(query, bot_response, tags, search_results)}}
+
+
+def save_conversation(email, query, bot_response, tags, search_results, history_collection):
+    history_collection.update_one(*conversation_update(email, query, bot_response, tags, search_results), upsert=True)
+
 
 def remove_conversation(history_collection):
-    email = request.json.get('email','')
+    email = request.get_json().get('email', '')
     history_collection.delete_one({"email": email})
     return jsonify({"message": "Conversation history deleted successfully"}), 200
 
 
-def addDocument(content, link, image, rating, review_count, price, availability, embeddings, vector_store):
-    embedding = embeddings.embed_query(content)
-    
+def notnull(value):
+    # Same as pandas.notnull for the scalars scraping produces
+    return value is not None and not (isinstance(value, float) and math.isnan(value))
+
+
+def productMetadata(content, link, image, rating, review_count, price, availability):
+    # Parsed before the defaults below replace missing values with text
+    numbers = numeric_fields(price, rating, review_count)
     # Convert NaNs and missing values to safe, descriptive defaults
-    rating = str(rating) if pd.notnull(rating) else "No rating available"
-    review_count = str(review_count) if pd.notnull(review_count) else "No reviews"
-    price = str(price) if pd.notnull(price) else "Price not available"
+    rating = str(rating) if notnull(rating) else "No rating available"
+    review_count = str(review_count) if notnull(review_count) else "No reviews"
+    price = str(price) if notnull(price) else "Price not available"
     availability = availability if availability else "Unknown"
 
-    # Ensure all values are strings to avoid Pinecone errors
-    vector_store.upsert(vectors=[{
-        "id": str(uuid4()),  # Unique ID for each document
+    # Ensure no value is null to avoid Pinecone errors
+    return {
+        "content": content,
+        "link": link,
+        "image": image,
+        "rating": rating,
+        "review_count": review_count,
+        "price": price,
+        "availability": availability,
+        # Re-ingesting a product refreshes it, compact_catalog.py expires the ones not seen for a while
+        "last_seen": int(time.time()),
+        # price_value, rating_value and review_count_value, for filtering in the index
+        **numbers
+    }
+
+
+def shown(metadata):
+    # Everything a cached result can show, last_seen changes on every re-ingest without changing results
+    return {name: value for name, value in metadata.items() if name != "last_seen"}
+
+
+def changes_results(vectors, vector_store):
+    """
+    Tells whether upserting vectors can change what findItems returns: one
+    of them is new to the index, or its metadata differs from the stored
+    copy. Product IDs are stable, so a re-ingest of unchanged products keeps
+    the cached results.
+    """
+    try:
+        stored = vector_store.fetch([vector["id"] for vector in vectors])
+    except Exception as e:
+        print(f"Could not compare the products with the index: {e}")
+        return True
+    return any(vector["id"] not in stored or shown(stored[vector["id"]]["metadata"]) != shown(vector["metadata"])
+               for vector in vectors)
+
+
+def addDocument(content, link, image, rating, review_count, price, availability, embeddings, vector_store):
+    embedding = embeddings.embed_query(content)
+
+    vector = {
+        "id": product_id(link, content),  # Same product, same ID, so rescrapes overwrite in place
         "values": embedding,
-        "metadata": {
-            "content": content,
-            "link": link,
-            "image": image,
-            "rating": rating,
-            "review_count": review_count,
-            "price": price,
-            "availability": availability
-        }
-    }])
+        "metadata": productMetadata(content, link, image, rating, review_count, price, availability)
+    }
+    changed = changes_results([vector], vector_store)
+    vector_store.upsert(vectors=[vector])
+    lexical_index.add([vector])
+    if changed:
+        result_cache.bump()
     # print(f"Document added: {content}, {link}, {rating}")
 
 
-def findItems(query: str, numItems: int, embeddings, vector_store):
+def addDocuments(products, embeddings, vector_store, batch_size=UPSERT_BATCH_SIZE, workers=UPSERT_WORKERS):
+    """
+    Adds many scraped products to the vector store with a single batched
+    embedding call and chunked upserts, instead of one forward pass and one
+    round trip per product.
+
+    Args:
+        products (list): Scraped product dicts.
+        batch_size (int): Vectors per upsert request.
+        workers (int): Upsert requests sent in parallel.
+
+    Returns:
+        dict: Seconds spent embedding and on each upsert batch.
+    """
+    timings = {"embed": 0.0, "upserts": []}
+    if not products:
+        return timings
+
+    start = time.perf_counter()
+    contents = [product.get('title', 'N/A') for product in products]
+    values = embeddings.embed_documents(contents)
+    timings["embed"] = time.perf_counter() - start
+    print(f"Embedded {len(contents)} products in {timings['embed']:.2f}s")
+
+    # Keyed by ID so a product listed twice on a page is only sent once
+    vectors = {}
+    for product, content, embedding in zip(products, contents, values):
+        vector_id = product_id(product.get('link', ''), content)  # Same product, same ID, so rescrapes overwrite in place
+        vectors[vector_id] = {
+            "id": vector_id,
+            "values": embedding,
+            "metadata": productMetadata(
+                content,
+                product.get('link', 'N/A'),
+                product.get('image', 'N/A'),
+                product.get('rating', None),
+                product.get('review_count', None),
+                product.get('price', None),
+                "In Stock"  # Set default availability
+            )
+        }
+    vectors = list(vectors.values())
+    batches = [vectors[i:i + batch_size] for i in range(0, len(vectors), batch_size)]
+
+    changed = []
+
+    def upsert(numbered_batch):
+        number, batch = numbered_batch
+        start = time.perf_counter()
+        if changes_results(batch, vector_store):
+            changed.append(number)
+        vector_store.upsert(vectors=batch)
+        elapsed = time.perf_counter() - start
+        print(f"Upserted batch {number}/{len(batches)} ({len(batch)} vectors) in {elapsed:.2f}s")
+        return elapsed
+
+    numbered_batches = list(enumerate(batches, start=1))
+    if workers > 1 and len(batches) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            timings["upserts"] = list(pool.map(upsert, numbered_batches))
+    else:
+        timings["upserts"] = [upsert(numbered_batch) for numbered_batch in numbered_batches]
+    # Keep the BM25 index in step with what was just written, and retire cached results if they may differ
+    lexical_index.add(vectors)
+    if changed:
+        result_cache.bump()
+    return timings
+
+
+def formatMatches(results_with_scores, threshold=SIMILARITY_THRESHOLD):
+    # If no matches are found, return an empty list
+    if not results_with_scores["matches"]:
+        return []
+
+    # Filter results based on similarity threshold
+    relevant_results = [
+        result for result in results_with_scores["matches"] if result["score"] >= threshold
+    ]
+
+    # If no relevant results, return an empty list
+    if not relevant_results:
+        return []
+
+    # Format the results to match the required structure
+    formatted_results = [
+        {
+            "name": result['metadata'].get('content', 'N/A'),
+            "price": result['metadata'].get('price', 'N/A'),
+            "url": result['metadata'].get('link', 'N/A'),
+            "image": result['metadata'].get('image', 'N/A'),
+            "rating": result['metadata'].get('rating', 'N/A'),
+            "reviews": result['metadata'].get('review_count', 'N/A'),
+            "price_value": result['metadata'].get('price_value'),
+            "rating_value": result['metadata'].get('rating_value'),
+            "reviews_value": result['metadata'].get('review_count_value')
+        } for result in relevant_results
+    ]
+
+    return formatted_results
+
+
+def hybridMatches(query, results_with_scores, numItems, vector_store, filters=None):
+    """
+    Fuses the vector matches above the similarity threshold with the BM25
+    matches for the same query, so exact brand names and model numbers
+    rank even when their embeddings are not the closest. The BM25 index
+    only keeps titles, so the metadata of its hits that the vector query
+    did not return is fetched from vector_store and filtered here.
+
+    Returns:
+        list: Up to numItems findItems-style results.
+    """
+    dense = [match for match in results_with_scores["matches"] if match["score"] >= SIMILARITY_THRESHOLD]
+    lexical = lexical_index.search(query, numItems * HYBRID_CANDIDATES)
+    # The vector query's matches already passed the filter
+    known = {match["id"]: match["metadata"] for match in results_with_scores["matches"]}
+    missing = [match["id"] for match in lexical if match["id"] not in known]
+    if missing:
+        fetched = vector_store.fetch(missing)
+        known.update({vector_id: vector["metadata"] for vector_id, vector in fetched.items()
+                      if matches(vector["metadata"], filters)})
+    lexical = [{**match, "metadata": known[match["id"]]} for match in lexical if match["id"] in known]
+    fused = reciprocal_rank_fusion([dense, lexical])[:numItems]
+    # Fused scores are not similarities, the threshold was applied above
+    return formatMatches({"matches": fused}, threshold=0)
+
+
+def findItems(query: str, numItems: int, embeddings, vector_store, filters=None):
+    generation = result_cache.generation()
+    cached = result_cache.get(query, numItems, generation, filters)
+    if cached is not None:
+        return cached
     try:
         query_embedding = embeddings.embed_query(query)
         results_with_scores = vector_store.query(
             vector=query_embedding,
-            top_k=numItems,
-            include_metadata=True
+            top_k=numItems * HYBRID_CANDIDATES,
+            include_metadata=True,
+            filter=filters  # Pruned in the index, not after fetching
         )
-
-        # If no matches are found, return an empty list
-        if not results_with_scores["matches"]:
-            return []
-
-        # Filter results based on similarity threshold
-        relevant_results = [
-            result for result in results_with_scores["matches"] if result["score"] >= SIMILARITY_THRESHOLD
-        ]
-
-        # If no relevant results, return an empty list
-        if not relevant_results:
-            return []
-
-        # Format the results to match the required structure
-        formatted_results = [
-            {
-                "name": result['metadata'].get('content', 'N/A'),
-                "price": result['metadata'].get('price', 'N/A'),
-                "url": result['metadata'].get('link', 'N/A'),
-                "image": result['metadata'].get('image', 'N/A'),
-                "rating": result['metadata'].get('rating', 'N/A'),
-                "reviews": result['metadata'].get('review_count', 'N/A')
-            } for result in relevant_results
-        ]
-
-        return formatted_results
+        results = hybridMatches(query, results_with_scores, numItems, vector_store, filters)
+        result_cache.set(query, numItems, generation, results, filters)
+        return results
 
     except Exception as e:
         print(f"Error retrieving items: {str(e)}")
         return []
-    
 
-def add_tags(email, tags, tags_collection):
-    # Add tags to the user's document
-    tags_collection.update_one(
-        {"email": email},
-        {"$addToSet": {"tags": {"$each": tags}}}  # Add unique tags only
-    )
 
-    # Retrieve the updated document to check the total number of tags
-    user = tags_collection.find_one({"email": email}, {"tags": 1})
-    if user and "tags" in user:
-        total_tags = len(user["tags"])
-
-        # If the total number of tags exceeds 20, keep only the latest 20
-        if total_tags > 20:
-            trimmed_tags = user["tags"][-20:]  # Keep only the last 20 tags
-            tags_collection.update_one(
-                {"email": email},
-                {"$set": {"tags": trimmed_tags}}  # Update the tags array
-            )
+def iter_items_many(tags, numItems, embeddings, vector_store, deadline=QUERY_DEADLINE, filters=None):
+    """
+    Looks up several tags at once: one batched embedding call, then the
+    vector queries run concurrently and are cut off at the deadline.
+    Each tag's matches are fused with BM25 like in findItems, and tags
+    with cached results skip the embedding and the query entirely.
+
+    Args:
+        tags (list): The tags to look up.
+        numItems (int): Results per tag.
+        deadline (float): Seconds to wait for the vector queries.
+        filters (dict): Metadata filter from build_filter, applied by the index.
+
+    Yields:
+        tuple: (tag, findItems-style result list) as each tag's query finishes,
+        with an empty list if it failed or missed the deadline.
+    """
+    generation = result_cache.generation()
+    unique_tags = []
+    for tag in dict.fromkeys(tags):
+        cached = result_cache.get(tag, numItems, generation, filters)
+        if cached is not None:
+            yield tag, cached
+        else:
+            unique_tags.append(tag)
+    if not unique_tags:
+        return
+
+    try:
+        query_embeddings = embeddings.embed_documents(unique_tags)
+    except Exception as e:
+        print(f"Error retrieving items: {str(e)}")
+        for tag in unique_tags:
+            yield tag, []
+        return
+
+    futures = {
+        query_pool.submit(
+            vector_store.query, vector=query_embedding, top_k=numItems * HYBRID_CANDIDATES, include_metadata=True,
+            filter=filters
+        ): tag
+        for tag, query_embedding in zip(unique_tags, query_embeddings)
+    }
+    pending = set(futures)
+    ends_at = None if deadline is None else time.monotonic() + deadline
+    while pending:
+        # Yielding happens outside the wait, queries that finished while the caller was busy still count
+        timeout = None if ends_at is None else max(ends_at - time.monotonic(), 0)
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            tag = futures[future]
+            try:
+                results = hybridMatches(tag, future.result(), numItems, vector_store, filters)
+                result_cache.set(tag, numItems, generation, results, filters)
+            except Exception as e:
+                print(f"Error retrieving items: {str(e)}")
+                results = []
+            yield tag, results
+    for future in pending:
+        future.cancel()
+        print(f"Query for '{futures[future]}' missed the {deadline}s deadline")
+        yield futures[future], []
+
+
+def find_items_many(tags, numItems, embeddings, vector_store, deadline=QUERY_DEADLINE, filters=None):
+    """
+    Collects iter_items_many into a dict.
+
+    Returns:
+        dict: Each tag mapped to a findItems-style result list, empty if it failed or missed the deadline.
+    """
+    results = {tag: [] for tag in tags}
+    results.update(iter_items_many(tags, numItems, embeddings, vector_store, deadline, filters))
+    return results
+
+
+def tags_update(tags):
+    # Add unique tags only
+    return {"$addToSet": {"tags": {"$each": tags}}}
+
+
+def tags_trim(user):
+    """
+    Returns:
+        dict: The update keeping only the newest MAX_TAGS of a tags document, None if it has no more.
+    """
+    tags = (user or {}).get("tags", [])
+    if len(tags) <= MAX_TAGS:
+        return None
+    return {"$set": {"tags": tags[-MAX_TAGS:]}}
 
+
+def add_tags(email, tags, tags_collection):
+    tags_collection.update_one({"email": email}, tags_update(tags))
+    # Retrieve the updated document to check the total number of tags
+    trim = tags_trim(tags_collection.find_one({"email": email}, {"tags": 1}))
+    if trim is not None:
+        tags_collection.update_one({"email": email}, trim)
     print("Tags updated successfully")
 
 
-def search_product(query, embeddings, vector_store):
+def format_product(product):
+    numbers = numeric_fields(product.get('price'), product.get('rating'), product.get('review_count'))
+    return {
+        "name": product.get('title', 'N/A'),
+        "price": product.get('price', 'N/A'),
+        "url": product.get('link', 'N/A'),
+        "image": product.get('image', 'N/A'),
+        "rating": product.get('rating', 'N/A'),
+        "reviews": product.get('review_count', 'N/A'),
+        "price_value": numbers.get('price_value'),
+        "rating_value": numbers.get('rating_value'),
+        "reviews_value": numbers.get('review_count_value')
+    }
+
+
+def ingest_results(top_results, embeddings, vector_store, filters=None):
+    """
+    Adds scraped products to the vector store and returns the top product
+    matching the filters for immediate use. Every product is indexed either way.
+    """
+    print(f"{len(top_results)} Results found")
+    if not top_results:
+        return {"error": "No results found"}
+
+    addDocuments(top_results, embeddings, vector_store)
+    print("Added new products to the database successfully!")
+    # Return the first matching result as the top result for immediate use
+    for product in top_results:
+        numbers = numeric_fields(product.get('price'), product.get('rating'), product.get('review_count'))
+        if matches(numbers, filters):
+            return format_product(product)
+    return {"error": "No results match the filters"}
+
+
+def iter_search_products(queries, embeddings, vector_store, filters=None):
     """
-    Searches for a product on Amazon and Flipkart and adds results to Pinecone.
+    Searches Amazon and Flipkart for several queries at once and adds results to the vector store.
+
+    Args:
+        queries (list): The search queries.
+        filters (dict): Metadata filter from build_filter for picking each query's top product.
+
+    Yields:
+        tuple: (query, top product details or an error message) as each query's pages come in.
+    """
+    print(queries)
+    remaining = list(dict.fromkeys(queries))
+    try:
+        # Scrape every query concurrently in one batch
+        for query, products in scraper.iterate(iter_scrape_many(list(remaining))):
+            remaining.remove(query)
+            try:
+                yield query, ingest_results(products, embeddings, vector_store, filters)
+            except Exception as e:
+                print(f"Error adding the products!: {e}")
+                yield query, {"error": str(e)}
+    except Exception as e:
+        print(f"Error fetching the products!: {e}")
+        for query in remaining:
+            yield query, {"error": str(e)}
+
+
+def search_products(queries, embeddings, vector_store, filters=None):
+    """
+    Collects iter_search_products into a dict.
+
+    Returns:
+        dict: Each query mapped to its top product details or an error message.
+    """
+    return dict(iter_search_products(queries, embeddings, vector_store, filters))
+
+
+def search_product(query, embeddings, vector_store, max_items=None, max_pages=1):
+    """
+    Searches for a product on Amazon and Flipkart and adds results to the vector store.
+    Each retailer page is added as soon as it is parsed instead of waiting for both.
 
     Args:
         query (str): The search query.
+        max_items (int): Maximum number of products to scrape, or None for no limit.
+        max_pages (int): Number of result pages to fetch per retailer.
 
     Returns:
         dict: The top product details or an error message.
     """
     print(query)
     try:
-        # Perform the scrape
-        top_results = asyncio.run(scrape(query))
+        top_results = []
+        for products in scraper.iterate(iter_scrape(query, max_items, max_pages)):
+            addDocuments(products, embeddings, vector_store)
+            top_results.extend(products)
         print(f"{len(top_results)} Results found")
-        print("hi1")
-        
-        if top_results:
-            print("hi2")
-            # Loop through the results and add each one to Pinecone
-            for result in top_results:
-                addDocument(
-                    content=result.get('title', 'N/A'),
-                    link=result.get('link', 'N/A'),
-                    image=result.get('image', 'N/A'),
-                    rating=result.get('rating', None),
-                    review_count=result.get('review_count', None),
-                    price=result.get('price', None),
-                    availability="In Stock", # Set default availability
-                    embeddings=embeddings,
-                    vector_store=vector_store
-                )
-            print("Added new products to the database successfully!")
-            # Return the first result as the top result for immediate use
-            return {
-                "name": top_results[0].get('title', 'N/A'),
-                "price": top_results[0].get('price', 'N/A'),
-                "url": top_results[0].get('link', 'N/A'),
-                "image": top_results[0].get('image', 'N/A'),
-                "rating": top_results[0].get('rating', 'N/A'),
-                "reviews": top_results[0].get('review_count', 'N/A')
-            }
-        else:
-            print("hi3")
+
+        if not top_results:
             return {"error": "No results found"}
+        # Prefer the top Amazon result, like the batch path
+        top_results.sort(key=lambda product: product.get('source') != "amazon")
+        return format_product(top_results[0])
     except Exception as e:
         print(f"Error fetching the products!: {e}")
         return {"error": str(e)}
 
 
+def db_messages(user_query, history_messages):
+    """
+    The prompt for recommendations from indexed products, given the user's history.
+    """
+    return [
+        {
+            "role": "user",
+            "content": (
+                "You are a professional product recommendation specialist dedicated to deeply understanding the user's needs and preferences based on their inquiry and their history. "
+                f"Here is the history of the user: {history_messages}"
+                "Listen attentively to their requirements, empathize with their situation, and craft a personalized response. "
+                "Provide your reply in JSON format with two fields: "
+                "1. 'product_tags' - A list of 3 to 5 as strings that excatly align with the user's needs. These tags should be formulated so that when searched on Amazon, the exact product the user is looking for appears first. "
+                "2. 'message' - A personalized and empathetic message addressing the user's request. "
+                "Write 'product_tags' before 'message'. "
+                """Example for a json is: {
+                "product_tags": [
+                    "Indestructible Chew Toys for Aggressive Chewers",
+                    "Orthopedic Dog Beds for Large Dogs",
+                    "Grain-Free Natural Dog Food",
+                    "Interactive Puzzle Toys for Dogs",
+                    "Waterproof Dog Coats for Winter",
+                    "Portable Dog Water Bottles for Travel"
+                ],
+                "message": "Aww, that's so exciting! I'm happy to help you find the paw-fect gift for your furry friend. Can you tell me a bit more about your dog? What's their breed, size, and personality like? That way, I can give you super tailored recommendations. In the meantime, here are some fun ideas to get you started:"
+                }"""
+                f"The user asked: '{user_query}'."
+            )
+        },
+        {
+            "role": "assistant",
+            "content": "```json"
+        }
+    ]
+
+
+def web_messages(user_query):
+    """
+    The prompt for recommendations scraped live from the retailers.
+    """
+    return [
+        {
+            "role": "user",
+            "content": (
+                "You are a professional product recommendation specialist dedicated to deeply understanding the user's needs and preferences based on their inquiry. "
+                "Listen attentively to their requirements, empathize with their situation, and craft a personalized response. "
+                "Provide your reply in JSON format with two fields: "
+                "1. 'product_tags' - A list of 3 to 5 products as strings that excatly align with the user's needs. These tags should be formulated so that when searched on Amazon, the exact product the user is looking for appears first. "
+                "2. 'message' - A personalized and empathetic message addressing the user's request. "
+                "Write 'product_tags' before 'message'. "
+                """Example for a json is: {
+                "product_tags": [
+                    "Indestructible Chew Toys for Aggressive Chewers",
+                    "Orthopedic Dog Beds for Large Dogs",
+                    "Grain-Free Natural Dog Food",
+                    "Interactive Puzzle Toys for Dogs",
+                    "Waterproof Dog Coats for Winter",
+                    "Portable Dog Water Bottles for Travel"
+                ],
+                "message": "Aww, that's so exciting! I'm happy to help you find the paw-fect gift for your furry friend. Can you tell me a bit more about your dog? What's their breed, size, and personality like? That way, I can give you super tailored recommendations. In the meantime, here are some fun ideas to get you started:"
+                }"""
+                f"The user asked: '{user_query}'."
+            )
+        },
+        {
+            "role": "assistant",
+            "content": "```json"
+        }
+    ]
+
+
+def select_unique(url_set):
+    """
+    Returns a select function for stream_recommendation that takes the
+    first of a tag's products whose URL isn't in url_set yet.
+    """
+    def select(tag, results):
+        for result in results or []:
+            if result['url'] not in url_set:
+                url_set.add(result['url'])
+                return result
+        return None
+    return select
+
+
+def db_search_results(product_tags, results_by_tag):
+    """
+    One unique product per tag, in tag order, skipping tags without one.
+    """
+    select = select_unique(set())
+    search_results = {}
+    for tag in product_tags:
+        result = select(tag, results_by_tag.get(tag))
+        if result is not None:
+            search_results[tag] = result
+    return search_results
+
+
 def recommend_from_db(tags_collection, history_collection, embeddings, vector_store, client):
-    # Get the user query from the request
-    user_query = request.json.get('query', '')
-    email = request.json.get('email','')
-    if not (user_query and email):
-        return jsonify({"error": "No query/email provided"}), 400
-    user_history = history_collection.find_one({"email": email})
-    history_messages = []
-    if user_history and "history" in user_history:
-        for entry in user_history["history"]:
-            history_messages.append({
-                "role": "user",
-                "content": entry["query"]
-            })
-            history_messages.append({
-                "role": "assistant",
-                "content": entry["bot_response"]
-            })
-    current_messages = [
-                {
-                    "role": "user",
-                    "content": (
-                        "You are a professional product recommendation specialist dedicated to deeply understanding the user's needs and preferences based on their inquiry and their history. "
-                        f"Here is the history of the user: {history_messages}"
-                        "Listen attentively to their requirements, empathize with their situation, and craft a personalized response. "
-                        "Provide your reply in JSON format with two fields: "
-                        "1. 'message' - A personalized and empathetic message addressing the user's request. "
-                        "2. 'product_tags' - A list of 3 to 5 as strings that excatly align with the user's needs. These tags should be formulated so that when searched on Amazon, the exact product the user is looking for appears first."
-                        """Example for a json is: {
-                        "message": "Aww, that's so exciting! I'm happy to help you find the paw-fect gift for your furry friend. Can you tell me a bit more about your dog? What's their breed, size, and personality like? That way, I can give you super tailored recommendations. In the meantime, here are some fun ideas to get you started:",
-                        "product_tags": [
-                            "Indestructible Chew Toys for Aggressive Chewers",
-                            "Orthopedic Dog Beds for Large Dogs",
-                            "Grain-Free Natural Dog Food",
-                            "Interactive Puzzle Toys for Dogs",
-                            "Waterproof Dog Coats for Winter",
-                            "Portable Dog Water Bottles for Travel"
-                        ]
-                        }"""
-                        f"The user asked: '{user_query}'."
-                    )
-                },
-                {
-                    "role": "assistant",
-                    "content": "```json"
-                }
-            ]
+    fields, error = read_query(request.get_json())
+    if error:
+        return jsonify(error), 400
+    user_query, email, filters = fields
+    history_messages = conversation_history(email, history_collection)
+    current_messages = db_messages(user_query, history_messages)
     try:
-        
-        completion = client.chat.completions.create(
-            model="llama3-70b-8192",
-            messages=current_messages,
-            stop="```",
+        # Fetch up to 3 results per tag, each looked up as soon as the model has written it
+        cached = llm_cache.lookup("db", user_query, history_messages, embeddings)
+        response_data, results_by_tag = collect_recommendation(
+            client, current_messages, lookup_items(embeddings, vector_store, filters), QUERY_DEADLINE, cached
         )
-        # Extract and parse the JSON response
-        response_json = completion.choices[0].message.content.strip()
-        print(response_json)
-        response_data = json.loads(response_json.replace("null", "None"))  # Replace `null` with Python's `None`
 
         # Populate 'search_results' with data for each product tag
         product_tags = response_data.get('product_tags', [])
         bot_response = response_data.get('message', '')
         add_tags(email, product_tags, tags_collection)
-        search_results = {}
-        url_set = set()
-
-        for tag in product_tags:
-            results = findItems(tag, 3, embeddings, vector_store)  # Fetch up to 3 results for the current tag
-            if not results:
-                continue  # Skip if no results are found
-
-            for result in results:
-                if result['url'] not in url_set:  # Ensure the URL is unique
-                    search_results[tag] = result
-                    url_set.add(result['url'])
-                    break  # Break to only add one unique product per tag
+        search_results = db_search_results(product_tags, results_by_tag)
 
         # Add search results to the response data
         response_data['search_results'] = search_results
         save_conversation(email, user_query, bot_response, product_tags, search_results, history_collection)
+        schedule_summary(email, history_collection, client)
         return jsonify(response_data)
 
+    except LLMTimeout as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-def getrecommendations(users_collection, tags_collection ,embeddings, vector_store):
-    data = request.get_json()
-    email = data.get('email')
+def unique_items(tags, items_by_tag):
+    """
+    The products found for the tags, each URL once, in random order.
+    """
+    results = []
+    seen = set()
+    for tag in tags:
+        for item in items_by_tag[tag]:
+            # Use 'url' as the unique identifier for each product
+            if item['url'] not in seen:
+                results.append(item)
+                seen.add(item['url'])
+    random.shuffle(results)
+    return results
+
 
-    if not email:
-        return jsonify({"message": "Email is required"}), 400
+def getrecommendations(users_collection, tags_collection, embeddings, vector_store):
+    fields, error = read_recommendation_request(request.get_json())
+    if error:
+        return jsonify(error), 400
+    email, filters = fields
 
-    user_check = users_collection.find_one({"email": email})
-    if not user_check:
+    if not users_collection.find_one({"email": email}):
         return jsonify({"message": "Oops something went wrong!"}), 400
 
     # Find the user's tags or initialize them if not present
@@ -284,26 +653,24 @@ def getrecommendations(users_collection, tags_collection ,embeddings, vector_sto
         return jsonify({"result": []}), 200
 
     # If tags field is empty, return an empty result
-    user_tags = existing_user.get('tags', [])
+    user_tags = existing_user.get('tags', [])[:RECOMMENDATION_TAGS]
     if not user_tags:
         return jsonify({"result": []}), 200
 
-    results = []
-    seen = set()
+    items_by_tag = find_items_many(user_tags, 3, embeddings, vector_store, filters=filters)
+    return jsonify({"result": unique_items(user_tags, items_by_tag)}), 200
 
-    for tag in user_tags[:21]:
-        items = findItems(tag, 3, embeddings, vector_store)
-        for item in items:
-            # Use 'url' as the unique identifier for each product
-            if item['url'] not in seen:
-                results.append(item)
-                seen.add(item['url'])
 
-    # Shuffle the results
-    random.shuffle(results)
+def web_result(tag, value):
+    """
+    A tag's result on the web endpoints, JSON and SSE alike: a scrape that
+    failed or came back empty reads as an error for the tag.
+    """
+    return value or {"error": "No results found"}
 
-    return jsonify({"result": results}), 200
 
+def web_search_results(product_tags, results_by_tag):
+    return {tag: web_result(tag, results_by_tag.get(tag)) for tag in product_tags}
 
 
 def recommend_from_web(tags_collection, history_collection, embeddings, vector_store, client):
@@ -312,82 +679,410 @@ def recommend_from_web(tags_collection, history_collection, embeddings, vector_s
     generates product recommendations using Groq, and fetches
     details for each product tag.
     """
-    # Get the user query from the request
-    user_query = request.json.get('query', '')
-    email = request.json.get('email','')
-    if not (user_query and email):
-        return jsonify({"error": "No query/email provided"}), 400
+    fields, error = read_query(request.get_json())
+    if error:
+        return jsonify(error), 400
+    user_query, email, filters = fields
 
     # Generate the response using Groq
     try:
-        
-        completion = client.chat.completions.create(
-            model="llama3-70b-8192",
-            messages=[
-                {
-                    "role": "user",
-                    "content": (
-                        "You are a professional product recommendation specialist dedicated to deeply understanding the user's needs and preferences based on their inquiry. "
-                        "Listen attentively to their requirements, empathize with their situation, and craft a personalized response. "
-                        "Provide your reply in JSON format with two fields: "
-                        "1. 'message' - A personalized and empathetic message addressing the user's request. "
-                        "2. 'product_tags' - A list of 3 to 5 products as strings that excatly align with the user's needs. These tags should be formulated so that when searched on Amazon, the exact product the user is looking for appears first."
-                        """Example for a json is: {
-                        "message": "Aww, that's so exciting! I'm happy to help you find the paw-fect gift for your furry friend. Can you tell me a bit more about your dog? What's their breed, size, and personality like? That way, I can give you super tailored recommendations. In the meantime, here are some fun ideas to get you started:",
-                        "product_tags": [
-                            "Indestructible Chew Toys for Aggressive Chewers",
-                            "Orthopedic Dog Beds for Large Dogs",
-                            "Grain-Free Natural Dog Food",
-                            "Interactive Puzzle Toys for Dogs",
-                            "Waterproof Dog Coats for Winter",
-                            "Portable Dog Water Bottles for Travel"
-                        ]
-                        }"""
-                        f"The user asked: '{user_query}'."
-                    )
-                },
-                {
-                    "role": "assistant",
-                    "content": "```json"
-                }
-            ],
-            stop="```",
+        # Each tag is scraped as soon as the model has written it
+        cached = llm_cache.lookup("web", user_query, embeddings=embeddings)
+        response_data, results_by_tag = collect_recommendation(
+            client, web_messages(user_query), lookup_products(embeddings, vector_store, filters), cached=cached
         )
-        # Extract and parse the JSON response
-        response_json = completion.choices[0].message.content.strip()
-        print(response_json)
-        response_data = json.loads(response_json.replace("null", "None"))  # Replace `null` with Python's `None`
 
         # Populate 'search_results' with data for each product tag
         product_tags = response_data.get('product_tags', [])
         bot_response = response_data.get('message', '')
         add_tags(email, product_tags, tags_collection)
-        search_results = {}
-        url_set = set()
-        for tag in product_tags:
-            result = search_product(tag, embeddings, vector_store)
-            if(not url_set.__contains__(result['url'])):
-                print("hi4")
-                search_results[tag] = result
-                print("hi5")
+        search_results = web_search_results(product_tags, results_by_tag)
         # Add search results to the response data
         response_data['search_results'] = search_results
         save_conversation(email, user_query, bot_response, product_tags, search_results, history_collection)
+        schedule_summary(email, history_collection, client)
         return jsonify(response_data)
 
+    except LLMTimeout as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
-        print("hi6")
         return jsonify({"error": str(e)}), 500
-    
+
+
+def sse(event, data):
+    """
+    Formats one Server-Sent Event with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_completion(client, messages):
+    """
+    Yields the reply's text as the LLM gateway streams it.
+    """
+    return client.stream(messages, model=LLM_MODEL, stop="```")
+
+
+class RecommendationRun:
+    """
+    The part of recommendation_events that doesn't depend on how lookups
+    are waited for, shared with its version in async_handlers.py: it feeds
+    the reply to the parser, starts each tag's lookup once and decides
+    whether the reply goes into the LLM cache.
+    """
+
+    def __init__(self, submit, cached=None, start=None):
+        self.parser = RecommendationStreamParser()
+        self.submit = submit
+        # Wraps what submit returns, e.g. asyncio.ensure_future
+        self.start = start or (lambda lookup: lookup)
+        self.cached = cached
+        self.started = {}
+        self.close = getattr(submit, "close", lambda: None)
+        self.generation_started = time.perf_counter()
+
+    def cached_text(self):
+        """
+        Returns:
+            str: The cached reply to replay instead of calling the LLM, or None.
+        """
+        if self.cached is not None and self.cached.reply is not None:
+            return json.dumps(self.cached.reply)
+        return None
+
+    def lookup(self, tag):
+        if tag not in self.started:
+            self.started[tag] = self.start(self.submit(tag))
+
+    def feed(self, text):
+        """
+        Yields the ("message", text) events of the next piece of the reply
+        and starts the lookup of each tag it completes.
+        """
+        for kind, value in self.parser.feed(text):
+            if kind == "tag":
+                self.lookup(value)
+            else:
+                yield kind, value
+
+    def finish(self):
+        """
+        Returns:
+            tuple: The parsed reply and its tags, each looked up once.
+        """
+        reply = self.parser.result()
+        print(reply)
+        tags = [tag for tag in dict.fromkeys(reply.get('product_tags', [])) if isinstance(tag, str)]
+        # The parsed reply is authoritative, start anything the scanner didn't see
+        for tag in tags:
+            self.lookup(tag)
+        self.close()
+        return reply, tags
+
+    def to_store(self, reply, tags):
+        """
+        Returns:
+            tuple: The arguments of cached.store after a miss with a usable reply, otherwise None.
+        """
+        if self.cached is not None and self.cached.reply is None and tags and isinstance(reply.get('message'), str):
+            return reply, time.perf_counter() - self.generation_started
+        return None
+
+    def cancel(self):
+        # Lookups that haven't started are dropped if the client goes away
+        for lookup in self.started.values():
+            lookup.cancel()
+        self.close()
+
+
+def recommendation_events(client, messages, submit, deadline=None, cached=None):
+    """
+    Streams the reply and retrieves its products at the same time. Each
+    product tag's lookup is submitted as soon as the tag's closing quote
+    arrives, so the searches overlap the rest of the generation and the
+    request takes about as long as the slower of the two, not their sum.
+
+    Args:
+        messages (list): The prompt.
+        submit (callable): Takes a tag and returns a Future for its lookup. If it
+            has a close() method, that is called once every tag has been submitted.
+        deadline (float): Seconds to wait for the lookups once the reply is done, None to wait for all of them.
+        cached (Lookup): The prompt's llm_cache lookup. A cached reply is replayed
+            instead of calling Groq, a fresh one is stored after a miss.
+
+    Yields:
+        tuple: ("message", text) while the message streams, ("reply", parsed reply)
+        once it is complete, then ("search_result", (tag, value)) as each lookup
+        finishes. value is None if the lookup failed or missed the deadline.
+    """
+    run = RecommendationRun(submit, cached)
+    text = run.cached_text()
+    texts = [text] if text is not None else stream_completion(client, messages)
+    try:
+        for text in texts:
+            yield from run.feed(text)
+        reply, tags = run.finish()
+        entry = run.to_store(reply, tags)
+        if entry is not None:
+            cached.store(*entry)
+        yield "reply", reply
+
+        futures = {run.started[tag]: tag for tag in tags}
+        pending = set(futures)
+        try:
+            for future in as_completed(futures, timeout=deadline):
+                pending.discard(future)
+                try:
+                    value = future.result()
+                except Exception as e:
+                    print(f"Error retrieving '{futures[future]}': {e}")
+                    value = None
+                yield "search_result", (futures[future], value)
+        except FuturesTimeout:
+            for future in pending:
+                print(f"Lookup for '{futures[future]}' missed the {deadline}s deadline")
+                yield "search_result", (futures[future], None)
+    finally:
+        run.cancel()
+
+
+def collect_recommendation(client, messages, submit, deadline=None, cached=None):
+    """
+    Runs recommendation_events to the end for the JSON endpoints.
+
+    Returns:
+        tuple: The parsed reply and a dict of each tag's lookup value.
+    """
+    reply = {}
+    values = {}
+    for kind, value in recommendation_events(client, messages, submit, deadline, cached):
+        if kind == "reply":
+            reply = value
+        elif kind == "search_result":
+            values[value[0]] = value[1]
+    return reply, values
+
+
+def lookup_items(embeddings, vector_store, filters=None):
+    """
+    Returns a submit function for recommendation_events that looks tags up in the index.
+    """
+    def submit(tag):
+        return query_pool.submit(findItems, tag, 3, embeddings, vector_store, filters)
+    return submit
+
+
+class ProductSearch:
+    """
+    A submit function for recommendation_events that scrapes tags from the
+    retailers. The tags of one reply are fed into a single iter_scrape_many
+    on the scraper loop as they are submitted, like search_products does
+    for a known list, and each tag's products are ingested on ingest_pool
+    as soon as its pages are in. Fetches are bounded by the scraper's
+    shared fetch_slots, ingestions by ingest_pool, and neither by the
+    number of requests.
+    """
+
+    def __init__(self, embeddings, vector_store, filters=None):
+        self.embeddings = embeddings
+        self.vector_store = vector_store
+        self.filters = filters
+        self.futures = {}
+        self.queue = None
+        self.task = None
+        self.closed = False
+
+    def __call__(self, tag):
+        future = Future()
+        self.futures[tag] = future
+        if self.task is None:
+            if scraper.loop is None:
+                scraper.start()
+            self.task = asyncio.run_coroutine_threadsafe(self._scrape(), scraper.loop)
+        scraper.loop.call_soon_threadsafe(self._feed, tag)
+        return future
+
+    def close(self):
+        """
+        Ends the scrape once the submitted tags are done, they are still ingested.
+        """
+        if self.task is not None and not self.closed:
+            self.closed = True
+            scraper.loop.call_soon_threadsafe(self._feed, None)
+
+    # On the scraper loop
+
+    def _queue(self):
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+        return self.queue
+
+    def _feed(self, tag):
+        self._queue().put_nowait(tag)
+
+    async def _scrape(self):
+        try:
+            async for tag, products in iter_scrape_many(self._queue()):
+                ingest_pool.submit(self._ingest, tag, products)
+        except Exception as e:
+            print(f"Error fetching the products!: {e}")
+            for future in list(self.futures.values()):
+                self._resolve(future, {"error": str(e)})
+
+    # On ingest_pool
+
+    def _ingest(self, tag, products):
+        try:
+            value = ingest_results(products, self.embeddings, self.vector_store, self.filters)
+        except Exception as e:
+            print(f"Error adding the products!: {e}")
+            value = {"error": str(e)}
+        self._resolve(self.futures[tag], value)
+
+    def _resolve(self, future, value):
+        try:
+            future.set_result(value)
+        except InvalidStateError:
+            # Cancelled by recommendation_events, or already resolved
+            pass
+
+
+def lookup_products(embeddings, vector_store, filters=None):
+    """
+    Returns a submit function for recommendation_events that scrapes tags from the retailers.
+    """
+    return ProductSearch(embeddings, vector_store, filters)
+
+
+class StreamedReply:
+    """
+    Turns the events of recommendation_events into those of
+    stream_recommendation, in the Flask and ASGI apps alike, and collects
+    the body of the final done event.
+    """
+
+    def __init__(self, select):
+        self.select = select
+        self.reply = {}
+        self.product_tags = []
+        self.found = {}
+
+    def event(self, kind, value):
+        """
+        Returns:
+            str: The Server-Sent Event to send, or None to send nothing.
+        """
+        if kind == "message":
+            return sse("message", {"delta": value})
+        if kind == "reply":
+            self.reply = value
+            self.product_tags = value.get('product_tags', [])
+            return sse("product_tags", self.product_tags)
+        tag, result = value[0], self.select(*value)
+        if result is None:
+            return None
+        self.found[tag] = result
+        return sse("search_result", {"tag": tag, "result": result})
+
+    def done(self):
+        """
+        Returns:
+            dict: The reply with its search_results, in the same order as the tags like the JSON endpoint.
+        """
+        self.reply['search_results'] = {tag: self.found[tag] for tag in self.product_tags if tag in self.found}
+        return self.reply
+
+
+def stream_recommendation(email, user_query, messages, submit, select, tags_collection, history_collection,
+                          client, deadline=None, cached=None):
+    """
+    Answers a recommendation request as Server-Sent Events:
+        message         {"delta": text} while the reply's message streams
+        product_tags    the list of tags once the reply is complete
+        search_result   {"tag": tag, "result": product} as each product is found
+        done            the same body the JSON endpoint returns
+        error           {"error": message} if anything fails, ending the stream
+
+    Args:
+        messages (list): The prompt.
+        submit (callable): Starts a tag's lookup, see recommendation_events.
+        select (callable): Takes a tag and its lookup value as they finish and
+            returns the product to send, or None to send nothing for the tag.
+        deadline (float): Seconds to wait for the lookups once the reply is done.
+        cached (Lookup): The prompt's llm_cache lookup.
+
+    Returns:
+        Response: The event stream.
+    """
+    def events():
+        streamed = StreamedReply(select)
+        try:
+            for kind, value in recommendation_events(client, messages, submit, deadline, cached):
+                event = streamed.event(kind, value)
+                if event is not None:
+                    yield event
+                if kind == "reply":
+                    add_tags(email, streamed.product_tags, tags_collection)
+            reply = streamed.done()
+            save_conversation(email, user_query, reply.get('message', ''), streamed.product_tags,
+                              reply['search_results'], history_collection)
+            schedule_summary(email, history_collection, client)
+            yield sse("done", reply)
+        except Exception as e:
+            print(f"Error streaming the recommendation: {e}")
+            yield sse("error", {"error": str(e)})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        # Keep proxies like nginx from holding events back
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def recommend_from_db_stream(tags_collection, history_collection, embeddings, vector_store, client):
+    """
+    Handles the /recommend_from_db_stream route. Takes the same request as
+    /recommend_from_db and streams the answer with stream_recommendation.
+    Each tag gets the first of its products no earlier tag has taken,
+    in the order the tags' lookups finish.
+    """
+    fields, error = read_query(request.get_json())
+    if error:
+        return jsonify(error), 400
+    user_query, email, filters = fields
+
+    history_messages = conversation_history(email, history_collection)
+    cached = llm_cache.lookup("db", user_query, history_messages, embeddings)
+    return stream_recommendation(email, user_query, db_messages(user_query, history_messages),
+                                 lookup_items(embeddings, vector_store, filters), select_unique(set()),
+                                 tags_collection, history_collection, client, QUERY_DEADLINE, cached)
+
+
+def recommend_from_web_stream(tags_collection, history_collection, embeddings, vector_store, client):
+    """
+    Handles the /recommend_stream route. Takes the same request as
+    /recommend and streams the answer with stream_recommendation, sending
+    each tag's product, or its error, as soon as its pages are scraped.
+    """
+    fields, error = read_query(request.get_json())
+    if error:
+        return jsonify(error), 400
+    user_query, email, filters = fields
+
+    cached = llm_cache.lookup("web", user_query, embeddings=embeddings)
+    return stream_recommendation(email, user_query, web_messages(user_query),
+                                 lookup_products(embeddings, vector_store, filters), web_result,
+                                 tags_collection, history_collection, client, cached=cached)
+
+
 def gethistory(history_collection):
     """
     Retrieves the conversation history for a user.
     """
-    data = request.get_json()
-    email = data.get('email')
-
-    if not email:
-        return jsonify({"message": "Email is required"}), 400
+    email, error = read_email(request.get_json())
+    if error:
+        return jsonify(error), 400
 
     history_entries = list(history_collection.find({"email": email}, {"_id": 0}))
 
@@ -0,0 +1,127 @@
+"""
+Cache of findItems results, keyed by normalized tag, number of items and filters.
+
+Results only change when products are ingested, so instead of a TTL each
+entry is stamped with the catalog generation it was computed at. Ingesting
+new or changed products bumps the generation, which retires every older
+entry at once; re-ingesting unchanged ones keeps them. Entries stay in a
+bounded in-memory LRU. When REDIS_URL is set, both the generation counter
+and the entries also live in Redis so every worker shares hits and sees
+the same invalidations.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from scrape_cache import normalize_query
+
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 2048))
+REDIS_URL = os.getenv("REDIS_URL", "")
+# Redis entries of retired generations are never read again, let them expire
+RESULT_CACHE_REDIS_TTL = int(os.getenv("RESULT_CACHE_REDIS_TTL", 86400))
+GENERATION_KEY = "searchly:results:generation"
+
+
+class ResultCache:
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, redis_url=REDIS_URL):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.local_generation = 0
+        self.counters = {"hits": 0, "shared_hits": 0, "misses": 0, "invalidations": 0}
+        self.redis = None
+        if redis_url:
+            import redis
+            self.redis = redis.Redis.from_url(redis_url, socket_timeout=0.5)
+
+    def _key(self, tag, num_items, generation, filters):
+        filters = json.dumps(filters, sort_keys=True) if filters else ""
+        return f"searchly:results:{generation}:{num_items}:{filters}:{normalize_query(tag)}"
+
+    def generation(self):
+        """
+        The current catalog generation, read once per lookup and passed to get and set.
+        """
+        if self.redis is not None:
+            try:
+                return int(self.redis.get(GENERATION_KEY) or 0)
+            except Exception as e:
+                print(f"Result cache generation unavailable: {e}")
+        return self.local_generation
+
+    def bump(self):
+        """
+        Called after new or changed products are upserted, invalidating every cached result.
+        """
+        with self.lock:
+            self.local_generation += 1
+            self.entries.clear()
+            self.counters["invalidations"] += 1
+        if self.redis is not None:
+            try:
+                self.redis.incr(GENERATION_KEY)
+            except Exception as e:
+                print(f"Result cache invalidation not shared: {e}")
+
+    def get(self, tag, num_items, generation, filters=None):
+        """
+        Returns the cached results, or None on a miss.
+        """
+        key = self._key(tag, num_items, generation, filters)
+        with self.lock:
+            results = self.entries.get(key)
+            if results is not None:
+                self.entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return results
+        if self.redis is not None:
+            try:
+                payload = self.redis.get(key)
+            except Exception as e:
+                print(f"Result cache lookup failed: {e}")
+                payload = None
+            if payload is not None:
+                results = json.loads(payload)
+                with self.lock:
+                    self._remember(key, results)
+                    self.counters["shared_hits"] += 1
+                return results
+        with self.lock:
+            self.counters["misses"] += 1
+        return None
+
+    def set(self, tag, num_items, generation, results, filters=None):
+        """
+        Stores results computed at generation. Results of a generation that
+        has since been bumped are stored under a key nobody reads anymore.
+        """
+        key = self._key(tag, num_items, generation, filters)
+        with self.lock:
+            self._remember(key, results)
+        if self.redis is not None:
+            try:
+                self.redis.set(key, json.dumps(results), ex=RESULT_CACHE_REDIS_TTL)
+            except Exception as e:
+                print(f"Result cache store failed: {e}")
+
+    def _remember(self, key, results):
+        self.entries[key] = results
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        generation = self.generation()
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["shared_hits"] + self.counters["misses"]
+            hits = self.counters["hits"] + self.counters["shared_hits"]
+            return {
+                **self.counters,
+                "generation": generation,
+                "entries": len(self.entries),
+                "shared": self.redis is not None,
+                "hit_rate": hits / lookups if lookups else 0.0
+            }
+
+
+result_cache = ResultCache()
@@ -0,0 +1,130 @@
+"""
+TTL cache for scraped search results, keyed by normalized query and retailer.
+
+Entries live in a bounded in-memory LRU and, when SCRAPE_CACHE_PATH is set,
+in an SQLite file so they survive restarts. Once an entry is older than the
+TTL it is still served (for up to SCRAPE_CACHE_MAX_STALE seconds) while the
+caller refreshes it in the background.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+SCRAPE_CACHE_TTL = int(os.getenv("SCRAPE_CACHE_TTL", 3600))
+SCRAPE_CACHE_MAX_STALE = int(os.getenv("SCRAPE_CACHE_MAX_STALE", 86400))
+SCRAPE_CACHE_SIZE = int(os.getenv("SCRAPE_CACHE_SIZE", 512))
+SCRAPE_CACHE_PATH = os.getenv("SCRAPE_CACHE_PATH", "")
+
+PUNCTUATION = re.compile(r"[^\w\s]+")
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    """
+    Normalizes case, unicode forms, punctuation and whitespace so that
+    "Orthopedic Dog-Beds " and "orthopedic dog beds" share an entry.
+    """
+    query = unicodedata.normalize("NFKC", query).lower()
+    query = PUNCTUATION.sub(" ", query)
+    return WHITESPACE.sub(" ", query).strip()
+
+
+def cache_key(query, source):
+    return f"{source}:{normalize_query(query)}"
+
+
+class ScrapeCache:
+    def __init__(self, ttl=SCRAPE_CACHE_TTL, max_stale=SCRAPE_CACHE_MAX_STALE,
+                 max_entries=SCRAPE_CACHE_SIZE, path=SCRAPE_CACHE_PATH):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # SQLite writes take their own lock so they never hold up lookups of the in-memory entries
+        self.db_lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stale_hits": 0, "refreshes": 0}
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS scrape_cache (key TEXT PRIMARY KEY, stored_at REAL, products TEXT)"
+            )
+            self.db.commit()
+
+    def get(self, key):
+        """
+        Returns (products, is_stale) for a cached key, or None on a miss.
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            elif self.db is not None:
+                entry = self._load(key)
+                if entry is not None:
+                    self._remember(key, entry)
+
+            age = now - entry[0] if entry is not None else None
+            if age is None or age > self.ttl + self.max_stale:
+                self.counters["misses"] += 1
+                return None
+            if age > self.ttl:
+                self.counters["stale_hits"] += 1
+                return entry[1], True
+            self.counters["hits"] += 1
+            return entry[1], False
+
+    def set(self, key, products):
+        """
+        Stores products under key. With SQLite behind the cache this blocks on
+        a disk write, async callers run it off the event loop.
+        """
+        entry = (time.time(), products)
+        with self.lock:
+            self._remember(key, entry)
+        if self.db is not None:
+            with self.db_lock:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO scrape_cache VALUES (?, ?, ?)",
+                    (key, entry[0], json.dumps(products))
+                )
+                self.db.commit()
+
+    def record_refresh(self):
+        with self.lock:
+            self.counters["refreshes"] += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["stale_hits"] + self.counters["misses"]
+            served = self.counters["hits"] + self.counters["stale_hits"]
+            return {
+                **self.counters,
+                "entries": len(self.entries),
+                "hit_rate": served / lookups if lookups else 0.0
+            }
+
+    def _remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _load(self, key):
+        with self.db_lock:
+            row = self.db.execute(
+                "SELECT stored_at, products FROM scrape_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+
+scrape_cache = ScrapeCache()
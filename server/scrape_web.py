@@ -1,10 +1,17 @@
 from flask import Flask, jsonify, request
 import asyncio
 import aiohttp
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import urllib
+import re
 import certifi
 import ssl
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from scrape_cache import scrape_cache, cache_key
+from host_policy import policy_for, parse_retry_after
 
 app = Flask(__name__)
 
@@ -13,6 +20,173 @@ HEADERS = ({'User-Agent':'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/
     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,/;q=0.8',
     'Referer': 'https://www.google.com/'})
 
+# Search result pages, overridable so the scrapers can be pointed at a local replay server
+AMAZON_SEARCH_URL = os.getenv("AMAZON_SEARCH_URL", "https://www.amazon.in/s?k={}")
+FLIPKART_SEARCH_URL = os.getenv("FLIPKART_SEARCH_URL", "https://www.flipkart.com/search?q={}")
+
+# Connection pool settings for the shared scraper session
+POOL_LIMIT = int(os.getenv("SCRAPER_POOL_LIMIT", 100))
+POOL_LIMIT_PER_HOST = int(os.getenv("SCRAPER_POOL_LIMIT_PER_HOST", 10))
+DNS_CACHE_TTL = int(os.getenv("SCRAPER_DNS_CACHE_TTL", 300))
+KEEPALIVE_TIMEOUT = int(os.getenv("SCRAPER_KEEPALIVE_TIMEOUT", 30))
+# Maximum number of retailer pages fetched at once, across every request sharing the scraper
+SCRAPE_CONCURRENCY = int(os.getenv("SCRAPER_CONCURRENCY", 8))
+# Worker threads used to parse pages off the event loop
+PARSE_WORKERS = int(os.getenv("SCRAPER_PARSE_WORKERS", 4))
+
+PARSE_POOL = ThreadPoolExecutor(max_workers=PARSE_WORKERS, thread_name_prefix="scraper-parse")
+
+# Built once, loading the CA bundle on every request is expensive
+SSL_CONTEXT = ssl.create_default_context(cafile=certifi.where())
+
+
+def make_session():
+    """
+    Creates an aiohttp session backed by a bounded keep-alive connection pool.
+    Must be called from inside the event loop that will use the session.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=POOL_LIMIT,
+        limit_per_host=POOL_LIMIT_PER_HOST,
+        use_dns_cache=True,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        ssl=SSL_CONTEXT
+    )
+    return aiohttp.ClientSession(headers=HEADERS, connector=connector)
+
+
+class ScraperClient:
+    """
+    Long-lived scraper that owns a single pooled aiohttp session.
+
+    The session lives on a dedicated event loop thread so that synchronous
+    Flask handlers can share warm connections across requests instead of
+    paying a TCP+TLS handshake for every product tag.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.session = None
+        # Caps the fetches of every caller of the pooled session, see fetch_slots
+        self.slots = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="scraper-loop", daemon=True)
+            thread.start()
+            self.session = asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+            self.loop = loop
+            self._thread = thread
+
+    async def _open(self):
+        self.slots = asyncio.Semaphore(SCRAPE_CONCURRENCY)
+        return make_session()
+
+    def stop(self):
+        with self._lock:
+            if self.loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self.loop.close()
+            self.loop = None
+            self.session = None
+            self.slots = None
+            self._thread = None
+
+    async def attach(self):
+        """
+        Makes the calling event loop the scraper loop, for the ASGI app: its
+        handlers then scrape on the pooled session directly, without a thread hop.
+        """
+        with self._lock:
+            if self.loop is not None:
+                return
+            self.session = make_session()
+            self.slots = asyncio.Semaphore(SCRAPE_CONCURRENCY)
+            self.loop = asyncio.get_running_loop()
+
+    async def detach(self):
+        with self._lock:
+            if self.loop is None or self._thread is not None:
+                return
+            session = self.session
+            self.loop = None
+            self.session = None
+            self.slots = None
+        await session.close()
+
+    def get_session(self):
+        """
+        Returns the pooled session if called from the scraper loop, otherwise None.
+        """
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+        if self.session is not None and running_loop is self.loop:
+            return self.session
+        return None
+
+    def run(self, coro, timeout=None):
+        """
+        Runs a coroutine on the scraper loop and blocks until it finishes.
+        """
+        if self.loop is None:
+            self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def iterate(self, agen, timeout=None):
+        """
+        Consumes an async generator on the scraper loop from synchronous code,
+        yielding each item as soon as it is produced.
+        """
+        async def next_item():
+            return await agen.__anext__()
+
+        try:
+            while True:
+                try:
+                    yield self.run(next_item(), timeout)
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run(agen.aclose())
+
+
+scraper = ScraperClient()
+
+
+# Short-lived sessions of one-off scripts get a cap of their own
+session_slots = weakref.WeakKeyDictionary()
+
+
+def fetch_slots(session):
+    """
+    Returns the semaphore that bounds concurrent retailer fetches on session:
+    one for the pooled session, shared by all requests, otherwise one per session.
+    """
+    if session is scraper.session and scraper.slots is not None:
+        return scraper.slots
+    if session not in session_slots:
+        session_slots[session] = asyncio.Semaphore(SCRAPE_CONCURRENCY)
+    return session_slots[session]
+
+
+def start_scraper():
+    scraper.start()
+
+
+def stop_scraper():
+    scraper.stop()
+
 
 def get_title(product, source):
     # brand_string = ""
@@ -171,35 +345,73 @@ def get_link(product, source):
             link = ""
         return link
 
+# Statuses worth retrying, and the ones retailers use to turn scrapers away
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+BLOCK_STATUSES = {403, 429, 503}
+
+# Markers of captcha / robot check pages served with a 200
+BLOCK_MARKERS = (
+    "/errors/validateCaptcha",
+    "Type the characters you see in this image",
+    "api-services-support@amazon.com",
+    "Are you a human?"
+)
+
+def is_block_page(webpage):
+    return any(marker in webpage for marker in BLOCK_MARKERS)
+
 async def fetch_page(session, url, retries=3, timeout=10):
-    ssl_context = ssl.create_default_context(cafile=certifi.where())
-    
+    policy = policy_for(url)
+
     for attempt in range(retries):
+        if not policy.allow_request():
+            # Don't wait on a retailer that is failing, the other one still answers
+            print(f"Skipping {policy.host}, circuit is open")
+            return None
+        # Only one fetch gets through a half-open breaker, it has to settle it whatever happens
+        probe = policy.is_probing()
         try:
-            async with session.get(url, ssl=ssl_context, timeout=timeout) as response:
-                if response.status == 200:
-                    return await response.text()
-                else:
-                    print(f"Failed to fetch page: {response.status}")
-                    return None
-        except (aiohttp.ClientError, aiohttp.ClientConnectorError, asyncio.TimeoutError) as e:
-            print(f"Error fetching page, attempt {attempt + 1} of {retries}: {e}")
-            if attempt + 1 == retries:
-                return None
-        await asyncio.sleep(2)  # Wait before retrying
+            await policy.acquire()
+
+            retry_after = None
+            try:
+                # A slot per attempt, the backoff sleep below doesn't keep other fetches waiting
+                async with fetch_slots(session), \
+                        session.get(url, ssl=SSL_CONTEXT, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                    if response.status == 200:
+                        webpage = await response.text()
+                        if not is_block_page(webpage):
+                            policy.record_success()
+                            return webpage
+                        print(f"Blocked by {policy.host}, attempt {attempt + 1} of {retries}")
+                        policy.record_failure(blocked=True)
+                    elif response.status in RETRYABLE_STATUSES or response.status in BLOCK_STATUSES:
+                        print(f"Failed to fetch page: {response.status}, attempt {attempt + 1} of {retries}")
+                        policy.record_failure(blocked=response.status in BLOCK_STATUSES)
+                        if response.status not in RETRYABLE_STATUSES:
+                            return None
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    else:
+                        # The host answered, the page just isn't there
+                        print(f"Failed to fetch page: {response.status}")
+                        policy.record_success()
+                        return None
+            except (aiohttp.ClientError, aiohttp.ClientConnectorError, asyncio.TimeoutError) as e:
+                print(f"Error fetching page, attempt {attempt + 1} of {retries}: {e}")
+                policy.record_failure()
+        finally:
+            if probe:
+                # Cancelled or failed unexpectedly, a recorded outcome already cleared the probe
+                policy.record_abort()
+        if attempt + 1 < retries:
+            await asyncio.sleep(policy.backoff_delay(attempt, retry_after))  # Wait before retrying
+    return None
     
     
-# Scrape Amazon
-async def scrape_amazon(session, search_query):
-    base_url = "https://www.amazon.in/s?k={}"
-    formatted_query = urllib.parse.quote_plus(search_query)
-    formatted_url = base_url.format(formatted_query)
-
-    webpage = await fetch_page(session, formatted_url)
-    if not webpage:
-        return []
-
-    soup = BeautifulSoup(webpage, "html.parser")
+def parse_amazon_soup(webpage, strain=True):
+    # Only build the result cards instead of the whole page
+    strainer = SoupStrainer("div", attrs={'data-component-type':'s-search-result'}) if strain else None
+    soup = BeautifulSoup(webpage, "html.parser", parse_only=strainer)
     product_list = []
     for product in soup.findAll("div",attrs={'data-component-type':'s-search-result'}):
         
@@ -219,17 +431,12 @@ async def scrape_amazon(session, search_query):
         
     return product_list
 
-# Scrape Flipkart (you will need to adjust this based on Flipkart's page structure)
-async def scrape_flipkart(session, search_query):
-    base_url = "https://www.flipkart.com/search?q={}"
-    formatted_query = urllib.parse.quote_plus(search_query)
-    formatted_url = base_url.format(formatted_query)
-
-    webpage = await fetch_page(session, formatted_url)
-    if not webpage:
-        return []
+FLIPKART_CARD_CLASS = re.compile(r"(^|\s)(slAVV4|_1sdMkc)(\s|$)")
 
-    soup = BeautifulSoup(webpage, "html.parser")
+def parse_flipkart_soup(webpage, strain=True):
+    # Only build the result cards instead of the whole page
+    strainer = SoupStrainer("div", class_=FLIPKART_CARD_CLASS) if strain else None
+    soup = BeautifulSoup(webpage, "html.parser", parse_only=strainer)
     product_list = []
     for product in soup.select("div.slAVV4, div._1sdMkc.LFEi7Z"):
     
@@ -249,16 +456,243 @@ async def scrape_flipkart(session, search_query):
 
     return product_list
 
-# Asynchronous scraping of both Amazon and Flipkart
-async def scrape_amazon_and_flipkart(search_query):
-    async with aiohttp.ClientSession(headers=HEADERS) as session:
-        amazon_task = scrape_amazon(session, search_query)
-        flipkart_task = scrape_flipkart(session, search_query)
+try:
+    from product_parser import parse_amazon, parse_flipkart
+except ImportError:
+    # lxml is not installed, fall back to BeautifulSoup
+    parse_amazon, parse_flipkart = parse_amazon_soup, parse_flipkart_soup
 
-        # Run both tasks concurrently
-        amazon_products, flipkart_products = await asyncio.gather(amazon_task, flipkart_task)
-        return amazon_products + flipkart_products
+async def parse_in_pool(parse_fn, webpage):
+    # Parsing is CPU bound, keep it off the event loop
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(PARSE_POOL, parse_fn, webpage)
+
+# Scrape Amazon
+async def scrape_amazon(session, search_query, page=1):
+    base_url = AMAZON_SEARCH_URL
+    formatted_query = urllib.parse.quote_plus(search_query)
+    formatted_url = base_url.format(formatted_query)
+    if page > 1:
+        formatted_url += f"&page={page}"
+
+    webpage = await fetch_page(session, formatted_url)
+    if not webpage:
+        return []
 
+    return await parse_in_pool(parse_amazon, webpage)
+
+# Scrape Flipkart (you will need to adjust this based on Flipkart's page structure)
+async def scrape_flipkart(session, search_query, page=1):
+    base_url = FLIPKART_SEARCH_URL
+    formatted_query = urllib.parse.quote_plus(search_query)
+    formatted_url = base_url.format(formatted_query)
+    if page > 1:
+        formatted_url += f"&page={page}"
+
+    webpage = await fetch_page(session, formatted_url)
+    if not webpage:
+        return []
+
+    return await parse_in_pool(parse_flipkart, webpage)
+
+SCRAPERS = {"amazon": scrape_amazon, "flipkart": scrape_flipkart}
+
+# Keys with a background refresh in flight, and the tasks doing it
+refreshing = set()
+refresh_tasks = set()
+
+async def refresh_source(session, source, search_query, page, key):
+    try:
+        products = await SCRAPERS[source](session, search_query, page)
+        if products:
+            await asyncio.to_thread(scrape_cache.set, key, products)
+            scrape_cache.record_refresh()
+    except Exception as e:
+        print(f"Error refreshing {source} results for '{search_query}': {e}")
+    finally:
+        refreshing.discard(key)
+
+# Scrape one retailer page through the result cache
+async def scrape_source(session, source, search_query, page=1):
+    key = cache_key(search_query, source if page == 1 else f"{source}#{page}")
+    cached = scrape_cache.get(key)
+    if cached is not None:
+        products, is_stale = cached
+        # Serve stale results right away and refresh them on the pooled session
+        if is_stale and key not in refreshing and scraper.get_session() is session:
+            refreshing.add(key)
+            task = asyncio.create_task(refresh_source(session, source, search_query, page, key))
+            refresh_tasks.add(task)
+            task.add_done_callback(refresh_tasks.discard)
+        return list(products)
+
+    products = await SCRAPERS[source](session, search_query, page)
+    # Failed fetches come back empty, don't cache them
+    if products:
+        # The SQLite write blocks, keep it off the loop every other scrape runs on
+        await asyncio.to_thread(scrape_cache.set, key, products)
+    return products
+
+async def with_session(scrape_fn, *args):
+    session = scraper.get_session()
+    if session is None:
+        # Not running on the scraper loop (e.g. a one-off script), use a short-lived session
+        async with make_session() as session:
+            return await scrape_fn(session, *args)
+    return await scrape_fn(session, *args)
+
+# Asynchronous scraping of both Amazon and Flipkart
+async def scrape_amazon_and_flipkart(search_query):
+    return await with_session(scrape_both, search_query)
+
+async def scrape_both(session, search_query):
+    amazon_task = scrape_source(session, "amazon", search_query)
+    flipkart_task = scrape_source(session, "flipkart", search_query)
+
+    # Run both tasks concurrently
+    amazon_products, flipkart_products = await asyncio.gather(amazon_task, flipkart_task)
+    return amazon_products + flipkart_products
+
+async def iter_scrape_many_with(session, queries):
+    async def both(query):
+        results = await asyncio.gather(scrape_source(session, "amazon", query), scrape_source(session, "flipkart", query),
+                                       return_exceptions=True)
+        products = []
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Error scraping '{query}': {result}")
+                continue
+            products.extend(result)
+        return query, products
+
+    started = set()
+    tasks = set()
+
+    def start(query):
+        if query not in started:
+            started.add(query)
+            tasks.add(asyncio.ensure_future(both(query)))
+
+    feed = None
+    if isinstance(queries, asyncio.Queue):
+        feed = asyncio.ensure_future(queries.get())
+    else:
+        for query in queries:
+            start(query)
+    try:
+        while tasks or feed is not None:
+            done, _ = await asyncio.wait(tasks | {feed} - {None}, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is feed:
+                    query = feed.result()
+                    feed = None if query is None else asyncio.ensure_future(queries.get())
+                    if query is not None:
+                        start(query)
+                else:
+                    tasks.discard(task)
+                    yield task.result()
+    finally:
+        for task in tasks | {feed} - {None}:
+            task.cancel()
+
+
+async def scrape_many_with(session, queries):
+    return {query: products async for query, products in iter_scrape_many_with(session, queries)}
+
+
+async def scrape_many(queries):
+    """
+    Scrapes Amazon and Flipkart for several queries in a single event loop.
+
+    Every (query, retailer) fetch is started at once, so the wall-clock
+    time is roughly that of the slowest page instead of the sum of all of
+    them. Fetches wait for fetch_slots, which caps them at SCRAPE_CONCURRENCY
+    across every concurrent caller.
+
+    Args:
+        queries (list): The search queries.
+
+    Returns:
+        dict: Each query mapped to its Amazon products followed by its Flipkart products.
+    """
+    return await with_session(scrape_many_with, queries)
+
+
+async def iter_scrape_with(session, search_query, max_items=None, max_pages=1):
+    pending = {
+        asyncio.ensure_future(scrape_source(session, source, search_query)): (source, 1)
+        for source in SCRAPERS
+    }
+    sent = 0
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                source, page = pending.pop(task)
+                try:
+                    products = task.result()
+                except Exception as e:
+                    print(f"Error scraping {source} page {page} for '{search_query}': {e}")
+                    products = []
+
+                if max_items is not None:
+                    products = products[:max_items - sent]
+                if products:
+                    sent += len(products)
+                    yield products
+                if max_items is not None and sent >= max_items:
+                    return
+
+                # An empty page means the retailer has nothing more for this query
+                if products and page < max_pages:
+                    next_task = asyncio.ensure_future(scrape_source(session, source, search_query, page + 1))
+                    pending[next_task] = (source, page + 1)
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def iter_scrape(search_query, max_items=None, max_pages=1):
+    """
+    Yields batches of product dicts as soon as each retailer page is parsed.
+
+    A slow retailer no longer holds back results from the fast one. With
+    max_pages > 1, result pages 2..N of each retailer are fetched as the
+    previous page comes in, until max_items products have been yielded.
+
+    Args:
+        search_query (str): The search query.
+        max_items (int): Stop after this many products, or None for no limit.
+        max_pages (int): Number of result pages to fetch per retailer.
+    """
+    session = scraper.get_session()
+    if session is None:
+        # Not running on the scraper loop (e.g. a one-off script), use a short-lived session
+        async with make_session() as session:
+            async for products in iter_scrape_with(session, search_query, max_items, max_pages):
+                yield products
+        return
+    async for products in iter_scrape_with(session, search_query, max_items, max_pages):
+        yield products
+
+
+async def iter_scrape_many(queries):
+    """
+    Like scrape_many, but yields (query, products) as soon as both retailers
+    have answered for a query, so callers can act on it while the others load.
+
+    Args:
+        queries: The search queries, or an asyncio.Queue of queries ended by
+            None for queries that are still arriving.
+    """
+    session = scraper.get_session()
+    if session is None:
+        async with make_session() as session:
+            async for item in iter_scrape_many_with(session, queries):
+                yield item
+        return
+    async for item in iter_scrape_many_with(session, queries):
+        yield item
 
 
 async def scrape(query):
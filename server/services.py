@@ -0,0 +1,101 @@
+"""
+The app's slow-to-create dependencies, shared by the Flask and ASGI apps.
+"""
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+# How long a Mongo operation waits for a reachable server, the readiness ping included
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", 5000))
+# First delay before retrying a dependency that failed to warm up, doubled up to WARM_UP_RETRY_MAX
+WARM_UP_RETRY = 5
+WARM_UP_RETRY_MAX = 300
+# torch runs HuggingFaceEmbeddings, onnx the exported (int8) model in onnx_embeddings.py
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+
+
+class Services:
+    """
+    Dependencies that are slow to create: the Groq client, MongoDB, the
+    vector index and the embedding model. They are built on a background
+    thread so the app can serve /healthz (and report progress on /readyz)
+    while they warm up. Heavy modules are only imported there.
+    """
+
+    def __init__(self):
+        self.client = None
+        self.mongo_client = None
+        self.users_collection = None
+        self.tags_collection = None
+        self.history_collection = None
+        self.vector_store = None
+        self.embeddings = None
+        self.ready = {"llm": False, "mongo": False, "vector_store": False, "embeddings": False}
+        self.errors = {}
+
+    def start(self):
+        threading.Thread(target=self.warm_up, name="warm-up", daemon=True).start()
+
+    def warm_up(self):
+        initializers = {
+            "llm": self._init_llm,
+            "mongo": self._init_mongo,
+            "vector_store": self._init_vector_store,
+            "embeddings": self._init_embeddings
+        }
+        for name, init_fn in initializers.items():
+            self._init(name, init_fn)
+        # Retry what failed, e.g. a database that is still starting, /readyz reports it meanwhile
+        delay = WARM_UP_RETRY
+        while self.errors:
+            time.sleep(delay)
+            delay = min(delay * 2, WARM_UP_RETRY_MAX)
+            for name in list(self.errors):
+                self._init(name, initializers[name])
+
+    def _init(self, name, init_fn):
+        try:
+            init_fn()
+            self.ready[name] = True
+            self.errors.pop(name, None)
+            print(f"{name} ready")
+        except Exception as e:
+            self.errors[name] = str(e)
+            print(f"Error initializing {name}: {e}")
+
+    def _init_llm(self):
+        from llm_gateway import create_gateway
+        # Groq by default, LLM_PROVIDER=stub answers locally for offline load tests
+        self.client = create_gateway()
+
+    def _init_mongo(self):
+        from pymongo import MongoClient
+        self.mongo_client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=MONGO_TIMEOUT_MS)
+        # MongoClient connects lazily, only report ready once the server answers
+        self.mongo_client.admin.command('ping')
+        db = self.mongo_client['product-recommendation-system']
+        self.users_collection = db['users']
+        self.tags_collection = db['tags']
+        self.history_collection = db['conversation_history']
+
+    def _init_vector_store(self):
+        from vector_store import create_vector_store
+        # Pinecone by default, VECTOR_BACKEND=local for the in-process index
+        self.vector_store = create_vector_store()
+
+    def _init_embeddings(self):
+        from embedding_cache import CachedEmbeddings
+        if EMBEDDING_BACKEND == "onnx":
+            from onnx_embeddings import OnnxEmbeddings
+            model = OnnxEmbeddings()
+        else:
+            from langchain_huggingface import HuggingFaceEmbeddings
+            model = HuggingFaceEmbeddings()
+        self.embeddings = CachedEmbeddings(model)
+
+    def is_ready(self, *names):
+        return all(self.ready[name] for name in (names or self.ready))
@@ -0,0 +1,143 @@
+"""
+Incremental parser for the LLM's recommendation reply while it streams.
+
+The model answers with {"message": "...", "product_tags": ["...", ...]},
+a few tokens at a time. RecommendationStreamParser reads those tokens
+with a small JSON scanner. It hands back the decoded message text as it
+arrives, and each product tag as soon as its closing quote is seen. Only
+the reply's own layout is tracked, everything else is skipped.
+"""
+import json
+
+ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class RecommendationStreamParser:
+    """
+    feed(text) returns the events completed by that text:
+        ("message", text)   newly decoded characters of the message
+        ("tag", tag)        a product tag whose string just closed
+    result() returns the whole reply once the stream has ended.
+    """
+
+    def __init__(self):
+        self.text = []
+        self.message = []
+        self.tags = []
+        # One entry per open object or array: [kind, key it belongs to, key being read, expecting a key]
+        self.stack = []
+        self.done = False
+        self.in_string = False
+        self.role = None
+        self.buffer = []
+        self.escape = None
+        self.high_surrogate = None
+
+    def feed(self, text):
+        self.text.append(text)
+        events = []
+        delta = []
+        for char in text:
+            if self.done:
+                break
+            if self.in_string:
+                self._string_char(char, delta, events)
+            else:
+                self._structure_char(char)
+        if delta:
+            self.message.extend(delta)
+            events.insert(0, ("message", "".join(delta)))
+        return events
+
+    def _structure_char(self, char):
+        if not self.stack:
+            # Anything before the opening brace, like a code fence, is ignored
+            if char == "{":
+                self.stack.append(["{", None, None, True])
+            return
+        top = self.stack[-1]
+        if char in "{[":
+            parent_key = top[2] if top[0] == "{" else None
+            self.stack.append([char, parent_key, None, True])
+        elif char in "}]":
+            self.stack.pop()
+            self.done = not self.stack
+        elif char == ":":
+            top[3] = False
+        elif char == "," and top[0] == "{":
+            top[3] = True
+        elif char == '"':
+            self.in_string = True
+            self.buffer = []
+            if top[0] == "{" and top[3]:
+                self.role = "key"
+            elif top[0] == "{" and len(self.stack) == 1 and top[2] == "message":
+                self.role = "message"
+            elif top[0] == "[" and len(self.stack) == 2 and top[1] == "product_tags":
+                self.role = "tag"
+            else:
+                self.role = None
+
+    def _string_char(self, char, delta, events):
+        if self.escape is None:
+            if char == "\\":
+                self.escape = ""
+                return
+            if char == '"':
+                self._close_string(events)
+                return
+            self._emit(char, delta)
+            return
+
+        if self.escape == "":
+            if char == "u":
+                self.escape = "u"
+            else:
+                self.escape = None
+                self._emit(ESCAPES.get(char, char), delta)
+            return
+
+        self.escape += char
+        if len(self.escape) < 5:
+            return
+        code = int(self.escape[1:], 16)
+        self.escape = None
+        if 0xD800 <= code < 0xDC00:
+            # First half of a surrogate pair, the second \u escape follows
+            self.high_surrogate = code
+            return
+        if 0xDC00 <= code < 0xE000 and self.high_surrogate is not None:
+            code = 0x10000 + ((self.high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+        self.high_surrogate = None
+        self._emit(chr(code), delta)
+
+    def _emit(self, char, delta):
+        if self.role == "message":
+            delta.append(char)
+        elif self.role is not None:
+            self.buffer.append(char)
+
+    def _close_string(self, events):
+        self.in_string = False
+        value = "".join(self.buffer)
+        if self.role == "key":
+            self.stack[-1][2] = value
+        elif self.role == "tag":
+            self.tags.append(value)
+            events.append(("tag", value))
+
+    def result(self):
+        """
+        Returns:
+            dict: The parsed reply, or the message and tags seen so far if it isn't valid JSON.
+        """
+        text = "".join(self.text)
+        start = text.find("{")
+        if start != -1:
+            try:
+                reply, _ = json.JSONDecoder().raw_decode(text[start:])
+                if isinstance(reply, dict):
+                    return reply
+            except ValueError:
+                pass
+        return {"message": "".join(self.message), "product_tags": list(self.tags)}
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import threading
+import pytest
+
+pytest.importorskip("quart")
+pytest.importorskip("quart_cors")
+pytest.importorskip("motor")
+
+import async_handlers
+from asgi_app import create_asgi_app
+from llm_cache import LLMCache
+from llm_gateway import AsyncLLMGateway, StubProvider
+
+
+class Collection:
+    """
+    The part of a Motor collection the recommendation handlers use.
+    """
+
+    def __init__(self):
+        self.updates = []
+
+    async def find_one(self, query, projection=None):
+        return None
+
+    async def update_one(self, query, update, upsert=False):
+        self.updates.append((query, update))
+
+
+@pytest.fixture
+def app(monkeypatch):
+    ingested_on = []
+
+    async def scrape(queue):
+        while (tag := await queue.get()) is not None:
+            yield tag, [{"title": tag, "link": f"https://example.com/{tag}"}]
+
+    def ingest(products, embeddings, vector_store, filters=None):
+        ingested_on.append(threading.current_thread().name)
+        return {"name": products[0]["title"], "url": products[0]["link"]}
+
+    monkeypatch.setattr(async_handlers, "iter_scrape_many", scrape)
+    monkeypatch.setattr(async_handlers, "ingest_results", ingest)
+    monkeypatch.setattr(async_handlers, "llm_cache", LLMCache(max_entries=0))
+
+    app = create_asgi_app(start=False)
+    services = app.extensions['services']
+    services.client = AsyncLLMGateway(StubProvider(first_token_ms=0, token_ms=0))
+    services.tags_collection = Collection()
+    services.history_collection = Collection()
+    services.ready = dict.fromkeys(services.ready, True)
+    app.ingested_on = ingested_on
+    return app
+
+
+def events(body):
+    parsed = []
+    for block in body.strip().split("\n\n"):
+        kind, data = block.split("\n")
+        parsed.append((kind.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return parsed
+
+
+def test_recommend(app):
+    async def post():
+        response = await app.test_client().post('/recommend', json={"query": "running shoes", "email": "a@b.c"})
+        return response.status_code, await response.get_json()
+
+    status, body = asyncio.run(post())
+    assert status == 200
+    assert body["product_tags"]
+    assert body["search_results"] == {tag: {"name": tag, "url": f"https://example.com/{tag}"}
+                                      for tag in body["product_tags"]}
+    assert all(name.startswith("tag-ingest") for name in app.ingested_on)
+    assert len(app.ingested_on) == len(body["product_tags"])
+
+
+def test_recommend_stream(app):
+    async def post():
+        response = await app.test_client().post('/recommend_stream', json={"query": "desk lamp", "email": "a@b.c"})
+        return response.status_code, response.mimetype, (await response.get_data()).decode()
+
+    status, mimetype, body = asyncio.run(post())
+    assert status == 200
+    assert mimetype == "text/event-stream"
+    streamed = events(body)
+    kinds = [kind for kind, _ in streamed]
+    assert kinds[0] == "message" and kinds[-1] == "done"
+    tags = next(data for kind, data in streamed if kind == "product_tags")
+    found = {data["tag"]: data["result"] for kind, data in streamed if kind == "search_result"}
+    assert sorted(found) == sorted(tags)
+    assert streamed[-1][1]["search_results"] == {tag: found[tag] for tag in tags}
+    assert "".join(data["delta"] for kind, data in streamed if kind == "message") == streamed[-1][1]["message"]
+
+
+def test_recommend_rejects_a_missing_query(app):
+    async def post():
+        response = await app.test_client().post('/recommend', json={"email": "a@b.c"})
+        return response.status_code, await response.get_json()
+
+    assert asyncio.run(post()) == (400, {"error": "No query/email provided"})
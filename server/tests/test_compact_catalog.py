@@ -0,0 +1,67 @@
+import numpy as np
+import compact_catalog
+from compact_catalog import compact
+from lexical_index import LexicalIndex
+from result_cache import ResultCache
+from vector_store import LocalStore
+
+NOW = 1_700_000_000
+DAY = 86400
+
+
+def product(vector_id, values, link, content, last_seen=NOW):
+    metadata = {"link": link, "content": content}
+    if last_seen is not None:
+        metadata["last_seen"] = last_seen
+    return {"id": vector_id, "values": values, "metadata": metadata}
+
+
+def catalog():
+    basis = np.eye(8)
+    near = basis[2] + 0.05 * basis[7]
+    return [
+        product("bed-old", basis[0], "https://www.amazon.in/dp/B0ABCDEF12/ref=sr_1_1", "Woofnest Dog Bed",
+                last_seen=NOW - 2 * DAY),
+        product("bed-new", basis[0], "https://www.amazon.in/Woofnest/dp/B0ABCDEF12?th=1", "Woofnest Dog Bed",
+                last_seen=NOW - DAY),
+        product("stale", basis[1], "https://www.amazon.in/dp/B0STALE000", "Old Lamp", last_seen=NOW - 60 * DAY),
+        product("buds", basis[2], "https://www.flipkart.com/sonivo/p/itm1?pid=BUDS1", "Sonivo Wireless Earbuds Black",
+                last_seen=NOW - DAY),
+        product("buds-copy", near, "https://www.flipkart.com/sonivo/p/itm2?pid=BUDS2",
+                "Sonivo Wireless Earbuds Black Edition"),
+        product("case", basis[2] + 0.05 * basis[6], "https://www.flipkart.com/case/p/itm3?pid=CASE1",
+                "Silicone Charging Case Cover"),
+        product("unstamped", basis[3], "https://www.amazon.in/dp/B0NEW00000", "Barkley Bolster Bed", last_seen=None),
+    ]
+
+
+def test_compact_local_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(compact_catalog, "lexical_index", LexicalIndex(path=""))
+    cache = ResultCache(redis_url="")
+    monkeypatch.setattr(compact_catalog, "result_cache", cache)
+    store = LocalStore(path=str(tmp_path), dimension=8, save_interval=3600)
+    store.upsert(catalog())
+    queries = []
+    query_many = store.query_many
+    monkeypatch.setattr(store, "query_many", lambda vectors, top_k: queries.append(len(vectors)) or
+                        query_many(vectors, top_k))
+
+    dry_run = compact(store, page_size=3, now=NOW)
+    assert {key: dry_run[key] for key in ("scanned", "expired", "url_duplicates", "near_duplicates", "stamped")} == {
+        "scanned": 7, "expired": 1, "url_duplicates": 1, "near_duplicates": 1, "stamped": 1
+    }
+    # One neighbour query per page, not per product
+    assert len(queries) == 3
+    assert len(store.fetch([vector["id"] for vector in catalog()])) == 7
+
+    report = compact(store, apply=True, page_size=3, now=NOW)
+    assert report["removed"] == 3
+    examples = {(example["reason"], example["removed"], example["kept"]) for example in report["examples"]}
+    assert examples == {("url_duplicates", "bed-old", "bed-new"), ("near_duplicates", "buds", "buds-copy")}
+    left = {vector_id for page in store.list_ids() for vector_id in page}
+    assert left == {"bed-new", "buds-copy", "case", "unstamped"}
+    assert store.fetch(["unstamped"])["unstamped"]["metadata"]["last_seen"] == NOW
+    assert cache.stats()["invalidations"] == 1
+
+    again = compact(store, apply=True, page_size=3, now=NOW)
+    assert again["removed"] == 0 and again["stamped"] == 0
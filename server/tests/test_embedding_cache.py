@@ -0,0 +1,51 @@
+import sqlite3
+from array import array
+from embedding_cache import CachedEmbeddings
+
+
+class CountingModel:
+    def __init__(self, offset):
+        self.offset = offset
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [[float(len(text)), self.offset] for text in texts]
+
+
+def test_models_share_the_file(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first = CachedEmbeddings(CountingModel(1.0), model_name="a", path=path)
+    first.embed_query("red shoes")
+    second = CachedEmbeddings(CountingModel(2.0), model_name="b", path=path)
+    assert second.embed_query("red shoes") == [9.0, 2.0]
+
+    # Opening the file with model b left model a's vectors in place
+    model = CountingModel(1.0)
+    reopened = CachedEmbeddings(model, model_name="a", path=path)
+    assert reopened.embed_query("red shoes") == [9.0, 1.0]
+    assert model.calls == 0
+
+    reopened.invalidate()
+    again = CachedEmbeddings(CountingModel(2.0), model_name="b", path=path)
+    assert again.embed_query("red shoes") == [9.0, 2.0]
+    assert again.stats()["disk_hits"] == 1
+
+
+def test_migrates_single_model_files(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    seed = CachedEmbeddings(CountingModel(1.0), model_name="a", path="")
+    key = seed._key("red shoes")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+    db.execute("CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)")
+    db.execute("INSERT INTO embeddings VALUES (?, ?)", (key, array("f", [9.0, 1.0]).tobytes()))
+    db.execute("INSERT INTO meta VALUES ('model', 'a')")
+    db.commit()
+    db.close()
+
+    model = CountingModel(1.0)
+    cache = CachedEmbeddings(model, model_name="a", path=path)
+    assert cache.embed_query("red shoes") == [9.0, 1.0]
+    assert model.calls == 0
+    assert cache.db.execute("SELECT model FROM embeddings").fetchall() == [("a",)]
@@ -0,0 +1,100 @@
+import asyncio
+import history_manager
+
+
+def turn(number):
+    return {"query": f"question {number}", "bot_response": f"answer {number}"}
+
+
+class Result:
+    def __init__(self, modified_count):
+        self.modified_count = modified_count
+
+
+class Collection:
+    """
+    One history document, with the projections and updates history_manager uses.
+    """
+
+    def __init__(self, document):
+        self.document = document
+
+    def find_one(self, query, projection):
+        document = dict(self.document)
+        window = projection.get("history")
+        if isinstance(window, dict):
+            document["history"] = document["history"][window["$slice"]:] if window["$slice"] else []
+        return document
+
+    def update_one(self, query, update):
+        allowed = query["summarized_turns"]["$in"]
+        if self.document.get("summarized_turns") not in allowed:
+            return Result(0)
+        self.document.update(update["$set"])
+        return Result(1)
+
+
+class AsyncCollection(Collection):
+    async def find_one(self, query, projection):
+        return Collection.find_one(self, query, projection)
+
+    async def update_one(self, query, update):
+        return Collection.update_one(self, query, update)
+
+
+class Client:
+    def __init__(self):
+        self.prompts = []
+
+    def complete(self, messages, model, **kwargs):
+        self.prompts.append(messages[0]["content"])
+        return " new summary "
+
+
+def test_turns_between_a_lagging_summary_and_the_window_are_left_out():
+    # The summary covers turns 0-1, the window the newest 6 of 10: turns 2 and 3 are in neither
+    history = Collection({"email": "a@b.c", "summary": "likes red", "summarized_turns": 2,
+                          "history": [turn(number) for number in range(10)]})
+    messages = history_manager.conversation_history("a@b.c", history, max_turns=6, budget=10000)
+    assert messages[0]["content"] == "Summary of the earlier conversation: likes red"
+    assert [message["content"] for message in messages[1::2]] == [f"question {number}" for number in range(4, 10)]
+
+    # The next summary catches up with exactly those turns
+    client = Client()
+    assert history_manager.summarize("a@b.c", history, client, max_turns=6, budget=10000)
+    assert "question 2" in client.prompts[0] and "question 3" in client.prompts[0]
+    assert "question 1" not in client.prompts[0] and "question 4" not in client.prompts[0]
+    assert history.document["summary"] == "new summary" and history.document["summarized_turns"] == 4
+
+
+def test_a_summary_written_meanwhile_is_not_overwritten():
+    history = Collection({"email": "a@b.c", "summary": "likes red", "summarized_turns": 2,
+                          "history": [turn(number) for number in range(10)]})
+
+    class Racing(Client):
+        def complete(self, messages, model, **kwargs):
+            history.document.update(summary="from another worker", summarized_turns=4)
+            return super().complete(messages, model, **kwargs)
+
+    assert not history_manager.summarize("a@b.c", history, Racing(), max_turns=6, budget=10000)
+    assert history.document["summary"] == "from another worker"
+
+
+def test_async_summaries_are_kept_until_done():
+    # 10 turns, the default window keeps the newest 6
+    history = AsyncCollection({"email": "a@b.c", "history": [turn(number) for number in range(10)]})
+
+    class AsyncClient(Client):
+        async def complete(self, messages, model, **kwargs):
+            await asyncio.sleep(0)
+            return Client.complete(self, messages, model, **kwargs)
+
+    async def schedule():
+        task = history_manager.schedule_async_summary("a@b.c", history, AsyncClient())
+        assert task in history_manager.summary_tasks
+        await task
+        return task
+
+    task = asyncio.run(schedule())
+    assert task not in history_manager.summary_tasks
+    assert history.document["summarized_turns"] == 4
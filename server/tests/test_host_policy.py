@@ -0,0 +1,44 @@
+import asyncio
+import host_policy
+from host_policy import CircuitBreaker, HALF_OPEN, OPEN, CLOSED
+from scrape_web import fetch_page
+
+
+class HangingSession:
+    def get(self, url, **kwargs):
+        return self
+
+    async def __aenter__(self):
+        await asyncio.sleep(3600)
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def test_aborted_probe_reopens_breaker():
+    breaker = CircuitBreaker(cooldown=0)
+    breaker.state = OPEN
+    assert breaker.allow_request()
+    assert breaker.state == HALF_OPEN and not breaker.allow_request()
+    breaker.record_abort()
+    assert breaker.state == OPEN
+    assert breaker.allow_request()
+
+
+def test_cancelled_probe_does_not_lock_the_host():
+    url = "https://probe.example/s?k=shoes"
+    policy = host_policy.policy_for(url)
+    policy.breaker.state = OPEN
+    policy.breaker.opened_at = 0.0
+
+    async def cancel_probe():
+        task = asyncio.ensure_future(fetch_page(HangingSession(), url))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(cancel_probe())
+    assert not policy.breaker.probing
+    assert policy.allow_request()
+    policy.record_success()
+    assert policy.breaker.state == CLOSED
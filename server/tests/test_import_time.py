@@ -0,0 +1,67 @@
+"""
+Importing app.py has to stay cheap: the model, vector index and Mongo
+client are built in the background, so the import should only cost Flask
+and the scraper modules. The budget is IMPORT_TIME_BUDGET, 1.5 seconds
+by default, and a failure lists the slowest imports.
+"""
+import os
+import subprocess
+import sys
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", 1.5))
+
+MEASURE = (
+    "import time; start = time.perf_counter(); import app; "
+    "print('import seconds', time.perf_counter() - start)"
+)
+
+
+def measure(runs=3):
+    """
+    Returns the best of a few cold imports and the -X importtime report of the last one.
+    """
+    best = None
+    report = ""
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", MEASURE],
+            cwd=SERVER_DIR, capture_output=True, text=True, check=True
+        )
+        # The warm-up thread may print too, so look for our own line
+        line = next(line for line in result.stdout.splitlines() if line.startswith("import seconds"))
+        seconds = float(line.split()[-1])
+        best = seconds if best is None else min(best, seconds)
+        report = result.stderr
+    return best, report
+
+
+def slowest_imports(report, count=10):
+    rows = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.rstrip()[1:]
+        depth = (len(name) - len(name.lstrip())) // 2
+        # Modules app.py imports directly, deeper ones are already in their cumulative time
+        if depth == 1:
+            rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def test_app_imports_within_budget():
+    seconds, report = measure()
+    slowest = "\n".join(f"{cumulative_us / 1e6:6.3f}s  {name}" for cumulative_us, name in slowest_imports(report))
+    assert seconds <= IMPORT_TIME_BUDGET, f"import app took {seconds:.2f}s:\n{slowest}"
+
+
+def test_import_starts_nothing():
+    # Tools and tests import the app, only the server entrypoint starts its threads
+    code = (
+        "import threading, app; imported = threading.active_count(); app.create_app(start=False); "
+        "print('threads', imported, threading.active_count())"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=SERVER_DIR, capture_output=True, text=True, check=True)
+    line = next(line for line in result.stdout.splitlines() if line.startswith("threads"))
+    assert line.split()[1:] == ["1", "1"]
@@ -0,0 +1,70 @@
+from lexical_index import LexicalIndex
+
+TITLES = [
+    "Nike Revolution 6 Running Shoes for Men",
+    "Laptop Stand for Desk",
+    "boAt Rockerz 450 Bluetooth Headphones with Mic",
+    "Cover for iPhone 15",
+    "Water Bottle for Gym 1L",
+    "Yoga Mat for Women",
+    "Backpack for Travel",
+    "Wireless Mouse for Laptop",
+]
+
+
+def catalog():
+    index = LexicalIndex(path="")
+    index.add([{"id": f"p{row}", "metadata": {"content": title}} for row, title in enumerate(TITLES)])
+    return index
+
+
+def test_stopwords_do_not_match():
+    matches = catalog().search("shoes for running", 10)
+    assert [match["id"] for match in matches] == ["p0"]
+
+
+def test_weak_matches_are_dropped():
+    assert catalog().search("gift for him", 10) == []
+
+
+def test_model_numbers_match():
+    assert catalog().search("boat rockerz 450", 3)[0]["id"] == "p2"
+
+
+def shared(path):
+    return LexicalIndex(path=str(path / "lexical_index.json"), refresh_interval=0)
+
+
+def test_processes_see_each_others_changes(tmp_path):
+    app, job = shared(tmp_path), shared(tmp_path)
+    app.add([{"id": f"p{row}", "metadata": {"content": title}} for row, title in enumerate(TITLES)])
+    assert job.search("yoga mat", 1)[0]["id"] == "p5"
+    job.remove(["p5"])
+    job.snapshot()
+    app.add([{"id": "p8", "metadata": {"content": "Yoga Block Foam"}}])
+    # Neither the fold nor the later append brings the removed product back
+    assert [match["id"] for match in app.search("yoga mat", 5)] == ["p8"]
+    assert [match["id"] for match in shared(tmp_path).search("yoga mat", 5)] == ["p8"]
+
+
+def test_updates_prune_postings_without_rebuilding():
+    index = catalog()
+    for version in range(20):
+        index.add([{"id": "p0", "metadata": {"content": f"Nike Revolution {version} Running Shoes"}}])
+    docs, _ = index.postings["nike"]
+    # Only the list of a re-added title's terms is filtered, and before dead entries pile up
+    assert len(docs) <= 2 and index.dead["nike"] * 4 <= len(docs)
+    assert [match["id"] for match in index.search("nike running shoes", 5)] == ["p0"]
+
+
+def test_journal_folds_itself_once_past_the_limit(tmp_path):
+    path = tmp_path / "lexical_index.json"
+    index = LexicalIndex(path=str(path), refresh_interval=0, journal_limit=300)
+    for row, title in enumerate(TITLES):
+        index.add([{"id": f"p{row}", "metadata": {"content": title, "link": f"https://example.com/{row}"}}])
+    assert path.exists()
+    assert (tmp_path / "lexical_index.json.log").stat().st_size < 300
+    # Only IDs and title terms are written, the rest of the metadata lives in the vector store
+    assert "example.com" not in path.read_text() + (tmp_path / "lexical_index.json.log").read_text()
+    assert shared(tmp_path).search("yoga mat", 1)[0]["id"] == "p5"
+    assert len(shared(tmp_path)) == len(TITLES)
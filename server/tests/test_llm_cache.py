@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from llm_cache import LLMCache
+
+REPLY = {"message": "Try these lamps.", "product_tags": ["desk lamp", "led desk lamp"], "search_results": {}}
+
+
+class Embeddings:
+    """
+    Embeds the queries it knows, counting the calls.
+    """
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self.vectors[text]
+
+
+def angled(degrees):
+    radians = np.radians(degrees)
+    return [float(np.cos(radians)), float(np.sin(radians)), 0.0]
+
+
+def cached(embeddings, similarity=0.95):
+    cache = LLMCache(similarity=similarity, redis_url="")
+    cache.lookup("web", "desk lamp", embeddings=embeddings).store(REPLY, 1.5)
+    return cache
+
+
+def test_exact_hit_skips_the_embedding():
+    embeddings = Embeddings({"desk lamp": angled(0)})
+    cache = cached(embeddings)
+    assert embeddings.calls == 1
+
+    found = cache.lookup("web", "  Desk   LAMP ", embeddings=embeddings)
+    assert found.reply == {"message": REPLY["message"], "product_tags": REPLY["product_tags"]}
+    assert embeddings.calls == 1
+    assert cache.exact("web", "desk lamp").reply == found.reply
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1 and stats["seconds_saved"] == 3.0
+
+
+def test_misses():
+    embeddings = Embeddings({"desk lamp": angled(0), "yoga mat": angled(90)})
+    cache = cached(embeddings)
+    assert cache.exact("web", "yoga mat") is None
+    assert cache.lookup("web", "yoga mat", embeddings=embeddings).reply is None
+    # Replies never cross prompts or conversations
+    assert cache.lookup("db", "desk lamp", embeddings=embeddings).reply is None
+    assert cache.lookup("web", "desk lamp", [{"role": "user", "content": "hi"}], embeddings).reply is None
+    assert cache.stats()["misses"] == 4
+
+
+@pytest.mark.parametrize("degrees, hit", [(10, True), (25, False)])
+def test_semantic_threshold(degrees, hit):
+    # cos(10°) = 0.985 and cos(25°) = 0.906 either side of 0.95
+    embeddings = Embeddings({"desk lamp": angled(0), "lamp for desk": angled(degrees)})
+    cache = cached(embeddings, similarity=0.95)
+    found = cache.lookup("web", "lamp for desk", embeddings=embeddings)
+    assert (found.reply is not None) == hit
+    assert cache.stats()["semantic_hits"] == int(hit)
+
+
+def test_similarity_zero_turns_semantic_lookups_off():
+    embeddings = Embeddings({"desk lamp": angled(0), "lamp for desk": angled(1)})
+    cache = cached(embeddings, similarity=0)
+    assert cache.lookup("web", "lamp for desk", embeddings=embeddings).reply is None
+    assert embeddings.calls == 0
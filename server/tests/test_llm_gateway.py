@@ -0,0 +1,92 @@
+import asyncio
+import pytest
+from llm_gateway import AsyncLLMGateway, LLMGateway, LLMTimeout, StubProvider
+
+MESSAGES = [{"role": "user", "content": "The user asked: 'desk lamp'."}]
+
+
+class SlowFirstAttempt(StubProvider):
+    """
+    The first request takes first_token_ms to answer, the ones after it answer at once.
+    """
+
+    def __init__(self, first_token_ms):
+        super().__init__(first_token_ms=0, token_ms=0)
+        self.slow_seconds = first_token_ms / 1000
+        self.requests = 0
+
+    def stream(self, model, messages, timeout, **kwargs):
+        self.requests += 1
+        self.first_token_seconds = self.slow_seconds if self.requests == 1 else 0
+        return super().stream(model, messages, timeout, **kwargs)
+
+    def astream(self, model, messages, timeout, **kwargs):
+        self.requests += 1
+        self.first_token_seconds = self.slow_seconds if self.requests == 1 else 0
+        return super().astream(model, messages, timeout, **kwargs)
+
+
+def hedging(gateway):
+    # Enough fast first tokens for the gateway to hedge after ~10ms
+    gateway.first_token_seconds.extend([0.01] * 20)
+    return gateway
+
+
+def test_deadline_expiry():
+    gateway = LLMGateway(StubProvider(first_token_ms=500), deadline=0.05)
+    with pytest.raises(LLMTimeout):
+        gateway.complete(MESSAGES, model="stub")
+    assert gateway.stats()["timeouts"] == 1
+    # The abandoned attempt gave its slot back
+    assert all(gateway.slots.acquire(blocking=False) for _ in range(8))
+
+
+def test_no_slot_within_the_deadline():
+    gateway = LLMGateway(StubProvider(first_token_ms=0, token_ms=0), max_concurrency=1, deadline=0.05)
+    gateway.slots.acquire()
+    with pytest.raises(LLMTimeout):
+        gateway.complete(MESSAGES, model="stub")
+    assert gateway.stats()["rejected"] == 1
+
+
+def test_hedge_wins_and_the_loser_frees_its_slot():
+    provider = SlowFirstAttempt(first_token_ms=1000)
+    gateway = hedging(LLMGateway(provider, max_concurrency=2, deadline=5, hedge=True))
+    chunks = gateway.stream(MESSAGES, model="stub")
+    first = next(chunks)
+    # The slow first attempt still sleeps, but its slot is already free; the winner holds the other one
+    assert gateway.slots.acquire(blocking=False)
+    assert not gateway.slots.acquire(blocking=False)
+    gateway.slots.release()
+    assert first + "".join(chunks) == StubProvider().reply(MESSAGES)
+    stats = gateway.stats()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+    assert gateway.slots.acquire(blocking=False) and gateway.slots.acquire(blocking=False)
+
+
+def test_async_deadline_expiry():
+    async def call():
+        gateway = AsyncLLMGateway(StubProvider(first_token_ms=500), max_concurrency=1, deadline=0.05)
+        with pytest.raises(LLMTimeout):
+            await gateway.complete(MESSAGES, model="stub")
+        assert not gateway.slots.locked()
+        return gateway.stats()
+
+    assert asyncio.run(call())["timeouts"] == 1
+
+
+def test_async_hedge_wins_and_the_loser_frees_its_slot():
+    async def call():
+        provider = SlowFirstAttempt(first_token_ms=1000)
+        gateway = hedging(AsyncLLMGateway(provider, max_concurrency=2, deadline=5, hedge=True))
+        chunks = gateway.stream(MESSAGES, model="stub")
+        first = await chunks.__anext__()
+        # Freed as soon as the winner's first chunk landed, not once the loser unwound
+        assert gateway.slots._value == 1
+        text = first + "".join([chunk async for chunk in chunks])
+        assert gateway.slots._value == 2
+        return text, gateway.stats()
+
+    text, stats = asyncio.run(call())
+    assert text == StubProvider().reply(MESSAGES)
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
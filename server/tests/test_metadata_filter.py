@@ -0,0 +1,53 @@
+import pytest
+from metadata_filter import build_filter, filter_mask, matches
+from metadata_table import MetadataTable
+
+ROWS = [
+    {"title": "Dog bed", "source": "amazon", "price_value": 1299.0, "rating_value": 4.2, "review_count_value": 12345},
+    {"title": "Dog cot", "source": "flipkart", "price_value": 499.0, "rating_value": 3.9},
+    {"title": "Earbuds", "source": "amazon", "price_value": 2000.0, "review_count_value": 828},
+    {"title": "Neckband", "source": "flipkart", "rating_value": 4.6, "review_count_value": 1200},
+    {"title": "Cushion", "source": "amazon", "price_value": "unknown", "rating_value": 5},
+    {"title": "Mattress"},
+]
+
+FILTERS = [
+    None,
+    {},
+    build_filter(min_price=500, max_price=2000),
+    build_filter(min_rating=4),
+    build_filter(min_price=500, min_rating=4),
+    {"price_value": 499},
+    {"price_value": {"$ne": 1299}},
+    {"price_value": {"$gt": 499, "$lt": 2000}},
+    {"rating_value": {"$in": [3.9, 5]}},
+    {"rating_value": {"$nin": [4.2]}},
+    {"source": "amazon"},
+    {"source": {"$in": ["flipkart"]}},
+    {"source": {"$nin": ["amazon"]}},
+    {"price_value": {"$eq": "unknown"}},
+    {"$and": [{"source": "amazon"}, {"rating_value": {"$gte": 4}}]},
+    {"$or": [{"price_value": {"$lt": 500}}, {"review_count_value": {"$gte": 10000}}]},
+    {"$or": [{"source": "flipkart"}, {"rating_value": 5}], "price_value": {"$lte": 1500}},
+]
+
+
+@pytest.mark.parametrize("metadata_filter", FILTERS, ids=repr)
+def test_filter_mask_agrees_with_matches(metadata_filter):
+    mask = filter_mask(MetadataTable(ROWS), metadata_filter)
+    assert mask.tolist() == [matches(row, metadata_filter) for row in ROWS]
+
+
+def test_build_filter():
+    assert build_filter() is None
+    assert build_filter(min_price="500", max_price=2000, min_rating=4) == {
+        "price_value": {"$gte": 500.0, "$lte": 2000.0},
+        "rating_value": {"$gte": 4.0}
+    }
+
+
+def test_unsupported_operator():
+    with pytest.raises(ValueError):
+        matches(ROWS[0], {"price_value": {"$regex": "1.*"}})
+    with pytest.raises(ValueError):
+        filter_mask(MetadataTable(ROWS), {"price_value": {"$regex": "1.*"}})
@@ -0,0 +1,72 @@
+import uuid
+import numpy as np
+import pytest
+from migrate_product_ids import migrate
+from product_ids import canonical_url, product_id
+from vector_store import LocalStore
+
+DOG_BED = "https://www.amazon.in/dp/B0ABCDEF12"
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://www.amazon.in/Woofnest-Orthopedic-Dog-Bed/dp/B0ABCDEF12/ref=sr_1_3?keywords=dog+bed&qid=1700000000&sr=8-3",
+     DOG_BED),
+    ("https://www.amazon.in/dp/b0abcdef12?th=1&psc=1", DOG_BED),
+    ("https://amazon.in/gp/product/B0ABCDEF12/", DOG_BED),
+    ("https://www.amazon.in/sspa/click?ie=UTF8&spc=abc&url=%2FWoofnest-Dog-Bed%2Fdp%2FB0ABCDEF12%2Fref%3Dsr_1_1_sspa",
+     DOG_BED),
+    ("https://www.flipkart.com/woofnest-dog-bed/p/itm4lzrqmcsydbd?pid=4lzrqmcsydbds86d&lid=LSTX4LZ&marketplace=FLIPKART"
+     "&q=dog+bed&sattr[]=size&st=size", "https://www.flipkart.com/p?pid=4LZRQMCSYDBDS86D"),
+    ("https://shop.example.com/beds/42/?utm_source=mail&color=grey&gclid=x", "https://shop.example.com/beds/42?color=grey"),
+    ("HTTPS://WWW.Shop.Example.com", "https://shop.example.com/"),
+    ("/dp/B0ABCDEF12", ""),
+    ("", ""),
+    (None, ""),
+])
+def test_canonical_url(url, expected):
+    assert canonical_url(url) == expected
+
+
+def test_product_id():
+    assert product_id(DOG_BED + "/ref=sr_1_3?qid=1") == product_id("https://amazon.in/gp/product/B0ABCDEF12")
+    assert product_id(DOG_BED) != product_id("https://www.amazon.in/dp/B0ABCDEF13")
+    # Without a link the normalized title identifies the product
+    assert product_id("", "Woofnest  Dog Bed") == product_id(None, "woofnest dog bed")
+    assert product_id("", "Woofnest Dog Bed") != product_id("", "Sonivo Earbuds")
+
+
+def legacy_vectors():
+    links = [
+        (DOG_BED + "/ref=sr_1_1?keywords=dog+bed", "Woofnest Dog Bed"),
+        ("https://www.amazon.in/Woofnest-Dog-Bed/dp/B0ABCDEF12?th=1", "Woofnest Dog Bed"),
+        ("https://amazon.in/gp/product/B0ABCDEF12", "Woofnest Dog Bed"),
+        ("https://www.flipkart.com/sonivo/p/itm1?pid=EARBUDS123&q=earphones", "Sonivo Earbuds"),
+        ("", "Barkley Bolster Bed"),
+    ]
+    values = np.random.default_rng(0).normal(size=(len(links), 8))
+    return [{"id": str(uuid.uuid4()), "values": values[row].tolist(), "metadata": {"link": link, "content": content}}
+            for row, (link, content) in enumerate(links)]
+
+
+def test_migrate_collapses_duplicates_and_is_idempotent(tmp_path):
+    store = LocalStore(path=str(tmp_path), dimension=8, save_interval=3600)
+    legacy = legacy_vectors()
+    store.upsert(legacy)
+
+    dry_run = migrate(store, page_size=2)
+    assert dry_run == {"scanned": 5, "rekeyed": 3, "duplicates_removed": 2, "unchanged": 0}
+    assert sorted(id for page in store.list_ids() for id in page) == sorted(vector["id"] for vector in legacy)
+
+    assert migrate(store, apply=True, page_size=2) == dry_run
+    expected = {product_id(vector["metadata"]["link"], vector["metadata"]["content"]) for vector in legacy}
+    assert {id for page in store.list_ids() for id in page} == expected
+    fetched = store.fetch([product_id(DOG_BED)])[product_id(DOG_BED)]
+    assert fetched["metadata"]["content"] == "Woofnest Dog Bed"
+    # Stored normalized, the first of the duplicates is the one kept
+    first = np.asarray(legacy[0]["values"])
+    np.testing.assert_allclose(fetched["values"], first / np.linalg.norm(first), rtol=1e-5)
+
+    # A second run finds everything already keyed by product
+    assert migrate(store, apply=True, page_size=2) == {"scanned": 3, "rekeyed": 0, "duplicates_removed": 0,
+                                                        "unchanged": 3}
+    assert {id for page in store.list_ids() for id in page} == expected
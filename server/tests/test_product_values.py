@@ -0,0 +1,48 @@
+import pytest
+from product_values import numeric_fields, parse_price, parse_rating, parse_review_count
+
+
+@pytest.mark.parametrize("price, expected", [
+    ("Rs.1,299.", 1299.0),
+    ("₹1,299", 1299.0),
+    ("Rs.499", 499.0),
+    ("₹1,299.50", 1299.5),
+    ("₹1,299 - ₹1,999", 1299.0),
+    ("Rs.", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_price(price, expected):
+    assert parse_price(price) == expected
+
+
+@pytest.mark.parametrize("rating, expected", [
+    ("4.2 out of 5 stars", 4.2),
+    ("3.9", 3.9),
+    ("5", 5.0),
+    ("0 out of 5 stars", 0.0),
+    ("12,345 ratings", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_rating(rating, expected):
+    assert parse_rating(rating) == expected
+
+
+@pytest.mark.parametrize("review_count, expected", [
+    ("(12,345)", 12345),
+    ("12,345", 12345),
+    ("1.2K", 1200),
+    ("(3.4k)", 3400),
+    ("2M", 2_000_000),
+    ("828", 828),
+    ("", None),
+    (None, None),
+])
+def test_parse_review_count(review_count, expected):
+    assert parse_review_count(review_count) == expected
+
+
+def test_numeric_fields_leave_out_what_does_not_parse():
+    assert numeric_fields("Rs.", "4.5 out of 5 stars", "") == {"rating_value": 4.5}
+    assert numeric_fields("₹799", "", "(1.1K)") == {"price_value": 799.0, "review_count_value": 1100}
@@ -0,0 +1,64 @@
+import time
+import pytest
+import recommendations
+from lexical_index import LexicalIndex
+from result_cache import ResultCache
+
+
+class Embeddings:
+    def embed_documents(self, texts):
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+class VectorStore:
+    """
+    Answers every query with one product, after delays[len(tag)] seconds.
+    """
+
+    def __init__(self, delays):
+        self.delays = delays
+
+    def query(self, vector, top_k, include_metadata=True, filter=None):
+        time.sleep(self.delays[int(vector[0])])
+        return {"matches": [{"id": "p", "score": 0.9, "metadata": {"content": "Product", "link": "https://x.in/p"}}]}
+
+
+@pytest.fixture(autouse=True)
+def caches(monkeypatch):
+    monkeypatch.setattr(recommendations, "result_cache", ResultCache(redis_url=""))
+    monkeypatch.setattr(recommendations, "lexical_index", LexicalIndex(path=""))
+
+
+def test_slow_consumer_keeps_results_that_met_the_deadline():
+    store = VectorStore({1: 0.0, 2: 0.05})
+    found = {}
+    for tag, results in recommendations.iter_items_many(["a", "bb"], 1, Embeddings(), store, deadline=0.2):
+        found[tag] = results
+        # The caller outlives the deadline, the query for "bb" was done well before it
+        time.sleep(0.3)
+    assert [result["url"] for result in found["bb"]] == ["https://x.in/p"]
+
+
+def test_queries_past_the_deadline_come_back_empty():
+    store = VectorStore({1: 0.0, 2: 0.5})
+    found = dict(recommendations.iter_items_many(["a", "bb"], 1, Embeddings(), store, deadline=0.1))
+    assert found["a"] and found["bb"] == []
+
+
+def test_bm25_hits_take_metadata_from_the_store_and_are_filtered(monkeypatch):
+    index = LexicalIndex(path="")
+    titles = {"cheap": "boAt Rockerz 450", "dear": "boAt Rockerz 450 Pro", "mat": "Yoga Mat", "lamp": "Desk Lamp",
+              "bottle": "Water Bottle", "mouse": "Wireless Mouse"}
+    index.add([{"id": vector_id, "metadata": {"content": title}} for vector_id, title in titles.items()])
+    monkeypatch.setattr(recommendations, "lexical_index", index)
+
+    class Store:
+        def fetch(self, ids):
+            prices = {"cheap": 1499.0, "dear": 2999.0}
+            return {vector_id: {"id": vector_id, "values": [],
+                                "metadata": {"content": vector_id, "link": f"https://x.in/{vector_id}",
+                                             "price_value": prices[vector_id]}}
+                    for vector_id in ids}
+
+    results = recommendations.hybridMatches("rockerz 450", {"matches": []}, 3, Store(), {"price_value": {"$lte": 2000}})
+    assert [result["url"] for result in results] == ["https://x.in/cheap"]
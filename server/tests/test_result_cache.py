@@ -0,0 +1,61 @@
+import hashlib
+import numpy as np
+import pytest
+import recommendations
+from lexical_index import LexicalIndex
+from result_cache import ResultCache
+from vector_store import LocalStore
+
+PRODUCTS = [
+    {"title": "Nike Revolution 6 Running Shoes", "link": "https://www.amazon.in/dp/B09NMGF1ZL", "price": "₹2,999",
+     "rating": "4.2 out of 5 stars", "review_count": "1,024"},
+    {"title": "Puma Softride Running Shoes", "link": "https://www.flipkart.com/p/itm123", "price": "₹3,499",
+     "rating": "4.0", "review_count": "512"},
+]
+
+
+class Embeddings:
+    def embed_query(self, text):
+        seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+        return np.random.default_rng(seed).normal(size=8).tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    cache = ResultCache(redis_url="")
+    monkeypatch.setattr(recommendations, "result_cache", cache)
+    monkeypatch.setattr(recommendations, "lexical_index", LexicalIndex(path=""))
+    store = LocalStore(path=str(tmp_path), dimension=8, save_interval=3600)
+    recommendations.addDocuments(PRODUCTS, Embeddings(), store)
+    return cache, store
+
+
+def test_reingesting_unchanged_products_keeps_cached_results(catalog, monkeypatch):
+    cache, store = catalog
+    results = recommendations.findItems(PRODUCTS[0]["title"], 1, Embeddings(), store)
+    assert results[0]["url"] == PRODUCTS[0]["link"]
+    generation = cache.generation()
+
+    # A later scrape of the same products only refreshes last_seen
+    monkeypatch.setattr(recommendations.time, "time", lambda: 4102444800)
+    recommendations.addDocuments(PRODUCTS, Embeddings(), store)
+    assert cache.generation() == generation
+    assert cache.get(PRODUCTS[0]["title"], 1, generation) == results
+    assert cache.stats()["invalidations"] == 1
+
+
+@pytest.mark.parametrize("product", [
+    {**PRODUCTS[0], "price": "₹2,499"},
+    {"title": "Adidas Duramo Running Shoes", "link": "https://www.amazon.in/dp/B0C1234567"},
+])
+def test_new_or_changed_products_retire_cached_results(catalog, product):
+    cache, store = catalog
+    recommendations.findItems(PRODUCTS[0]["title"], 1, Embeddings(), store)
+    generation = cache.generation()
+
+    recommendations.addDocuments([product], Embeddings(), store)
+    assert cache.generation() == generation + 1
+    assert cache.get(PRODUCTS[0]["title"], 1, cache.generation()) is None
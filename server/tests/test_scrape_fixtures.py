@@ -0,0 +1,42 @@
+import glob
+import json
+import os
+import pytest
+
+pytest.importorskip("bs4")
+pytest.importorskip("lxml")
+
+import product_parser
+import scrape_web
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "fixtures")
+PAGES = sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.html")))
+
+
+def load(path):
+    source = "amazon" if os.path.basename(path).startswith("amazon") else "flipkart"
+    with open(path, encoding="utf-8") as f:
+        webpage = f.read()
+    with open(os.path.splitext(path)[0] + ".json", encoding="utf-8") as f:
+        return source, webpage, json.load(f)
+
+
+@pytest.mark.parametrize("path", PAGES, ids=os.path.basename)
+@pytest.mark.parametrize("strain", [True, False])
+def test_soup_extractor_matches_golden(path, strain):
+    source, webpage, expected = load(path)
+    assert getattr(scrape_web, f"parse_{source}_soup")(webpage, strain=strain) == expected
+
+
+@pytest.mark.parametrize("path", PAGES, ids=os.path.basename)
+def test_lxml_extractor_matches_golden(path):
+    source, webpage, expected = load(path)
+    assert getattr(product_parser, f"parse_{source}")(webpage) == expected
+
+
+def test_fixtures_cover_both_flipkart_layouts():
+    assert len(PAGES) == 4
+    _, webpage, _ = load(os.path.join(FIXTURES_DIR, "flipkart_dog_bed.html"))
+    assert "slAVV4" in webpage and "_1sdMkc" not in webpage
+    _, webpage, _ = load(os.path.join(FIXTURES_DIR, "flipkart_earphones.html"))
+    assert "_1sdMkc" in webpage and "slAVV4" not in webpage
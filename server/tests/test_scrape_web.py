@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import uuid
+from urllib.parse import parse_qs, urlsplit
+import host_policy
+import scrape_cache
+import scrape_web
+
+AMAZON_URL = "https://amazon.test/s?k={}"
+FLIPKART_URL = "https://flipkart.test/search?q={}"
+
+
+class Session:
+    """
+    Stands in for an aiohttp session, answering every search with an empty
+    results page after delay seconds. Queries in fail_once get a 503 first.
+    """
+
+    def __init__(self, delay=0.02, fail_once=()):
+        self.delay = delay
+        self.fail_once = set(fail_once)
+        self.requests = []
+        self.in_flight = 0
+        self.peak = 0
+
+    def get(self, url, **kwargs):
+        return Response(self, url)
+
+    async def close(self):
+        pass
+
+
+class Response:
+    headers = {"Retry-After": "0.1"}
+
+    def __init__(self, session, url):
+        self.session = session
+        self.query = next(iter(parse_qs(urlsplit(url).query).values()))[0]
+        self.status = 200
+
+    async def __aenter__(self):
+        session = self.session
+        session.requests.append(self.query)
+        if self.query in session.fail_once:
+            session.fail_once.discard(self.query)
+            self.status = 503
+        session.in_flight += 1
+        session.peak = max(session.peak, session.in_flight)
+        await asyncio.sleep(session.delay)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.session.in_flight -= 1
+        return False
+
+    async def text(self):
+        return "<html><body></body></html>"
+
+
+def fake_retailers(monkeypatch):
+    monkeypatch.setattr(scrape_web, "AMAZON_SEARCH_URL", AMAZON_URL)
+    monkeypatch.setattr(scrape_web, "FLIPKART_SEARCH_URL", FLIPKART_URL)
+    for url in (AMAZON_URL, FLIPKART_URL):
+        policy = host_policy.policy_for(url)
+        monkeypatch.setattr(policy, "bucket", host_policy.TokenBucket(rate=1e6, burst=1e6))
+        monkeypatch.setattr(policy, "breaker", host_policy.CircuitBreaker())
+
+
+def test_fetch_cap_is_shared_between_callers(monkeypatch):
+    session = Session()
+    fake_retailers(monkeypatch)
+    monkeypatch.setattr(scrape_web, "SCRAPE_CONCURRENCY", 3)
+    monkeypatch.setattr(scrape_web, "make_session", lambda: session)
+    requests = [[f"{uuid.uuid4()} {tag}" for tag in range(4)] for _ in range(3)]
+
+    async def concurrent_requests():
+        return await asyncio.gather(*(scrape_web.scrape_many(queries) for queries in requests))
+
+    scraper = scrape_web.scraper
+    scraper.start()
+    try:
+        results = scraper.run(concurrent_requests(), timeout=10)
+    finally:
+        scraper.stop()
+    assert [len(result) for result in results] == [4, 4, 4]
+    assert len(session.requests) == 24
+    assert session.peak == 3
+
+
+def test_backoff_sleep_frees_the_slot(monkeypatch):
+    first, second = str(uuid.uuid4()), str(uuid.uuid4())
+    session = Session(fail_once=[first])
+    fake_retailers(monkeypatch)
+    monkeypatch.setattr(scrape_web, "SCRAPE_CONCURRENCY", 1)
+
+    async def scrape():
+        await asyncio.gather(scrape_web.scrape_source(session, "amazon", first),
+                             scrape_web.scrape_source(session, "amazon", second))
+
+    asyncio.run(scrape())
+    # The second query is fetched while the first waits to retry
+    assert session.requests == [first, second, first]
+    assert session.peak == 1
+
+
+def test_cache_writes_run_off_the_loop(tmp_path, monkeypatch):
+    written_on = []
+    cache = scrape_cache.ScrapeCache(path=str(tmp_path / "scrape_cache.db"))
+    set_entry = cache.set
+
+    def record_set(key, products):
+        written_on.append(threading.get_ident())
+        set_entry(key, products)
+
+    async def fetch(session, query, page=1):
+        return [{"title": query, "link": f"https://example.com/{query}"}]
+
+    monkeypatch.setattr(cache, "set", record_set)
+    monkeypatch.setattr(scrape_web, "scrape_cache", cache)
+    monkeypatch.setitem(scrape_web.SCRAPERS, "amazon", fetch)
+
+    async def scrape():
+        products = await scrape_web.scrape_source(Session(), "amazon", "dog bed")
+        return threading.get_ident(), products
+
+    loop_thread, products = asyncio.run(scrape())
+    assert products == [{"title": "dog bed", "link": "https://example.com/dog bed"}]
+    assert written_on and loop_thread not in written_on
+    assert scrape_cache.ScrapeCache(path=str(tmp_path / "scrape_cache.db")).get(
+        scrape_cache.cache_key("dog bed", "amazon"))[0] == products
@@ -0,0 +1,67 @@
+import json
+import pytest
+from stream_parser import RecommendationStreamParser
+
+MESSAGE = 'Try a "desk lamp" \\ or two\nfor reading, café lights, or 🙂 fairy lights.'
+TAGS = ["desk lamp", 'lamp with "warm" light', "fairy lights 🙂"]
+
+
+def parse(chunks):
+    parser = RecommendationStreamParser()
+    deltas, tags = [], []
+    for chunk in chunks:
+        for kind, value in parser.feed(chunk):
+            (deltas if kind == "message" else tags).append(value)
+    return "".join(deltas), tags, parser.result()
+
+
+def splits(text):
+    """
+    The text cut once at every position, then in chunks of every size up to 7.
+    """
+    for cut in range(len(text) + 1):
+        yield [text[:cut], text[cut:]]
+    for size in range(1, 8):
+        yield [text[start:start + size] for start in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("reply", [
+    {"message": MESSAGE, "product_tags": TAGS},
+    {"product_tags": TAGS, "message": MESSAGE},
+])
+@pytest.mark.parametrize("ascii_only", [False, True])
+def test_any_chunking_gives_the_same_message_and_tags(reply, ascii_only):
+    # ensure_ascii writes \u escapes and surrogate pairs, so cuts also land inside them
+    text = json.dumps(reply, ensure_ascii=ascii_only)
+    for chunks in splits(text):
+        message, tags, result = parse(chunks)
+        assert message == MESSAGE, chunks
+        assert tags == TAGS, chunks
+        assert result == reply
+
+
+def test_tags_are_handed_back_when_their_string_closes():
+    parser = RecommendationStreamParser()
+    assert parser.feed('{"product_tags": ["desk la') == []
+    assert parser.feed('mp", "fairy') == [("tag", "desk lamp")]
+    assert parser.feed(' lights"') == [("tag", "fairy lights")]
+
+
+def test_reply_without_tags():
+    message, tags, result = parse(['```json\n{"mess', 'age": "No products ', 'needed."}\n```'])
+    assert message == "No products needed."
+    assert tags == []
+    assert result == {"message": "No products needed."}
+
+
+def test_nested_keys_are_not_the_reply():
+    text = json.dumps({"meta": {"message": "inner", "product_tags": ["inner tag"]},
+                       "message": "outer", "product_tags": ["outer tag"]})
+    message, tags, _ = parse(list(text))
+    assert message == "outer"
+    assert tags == ["outer tag"]
+
+
+def test_truncated_reply_keeps_what_was_seen():
+    message, tags, result = parse(['{"message": "Here you go", "product_tags": ["desk lamp", "fairy li'])
+    assert result == {"message": "Here you go", "product_tags": ["desk lamp"]}
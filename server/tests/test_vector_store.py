@@ -0,0 +1,141 @@
+import json
+import threading
+import numpy as np
+import pytest
+import vector_store
+from vector_store import STORAGE_MODES, LocalStore, encode_pq
+
+
+def vectors(count, dimension, seed=0):
+    values = np.random.default_rng(seed).normal(size=(count, dimension))
+    return [{"id": f"p{row}", "values": values[row].tolist(), "metadata": {"title": f"item {row}"}}
+            for row in range(count)]
+
+
+@pytest.mark.parametrize("storage", STORAGE_MODES)
+def test_save_then_reload(tmp_path, storage):
+    items = vectors(5, 8)
+    store = LocalStore(path=str(tmp_path), dimension=8, storage=storage, save_interval=3600)
+    store.upsert(items)
+    store.save()
+
+    reloaded = LocalStore(path=str(tmp_path), dimension=8, storage=storage, save_interval=3600)
+    assert reloaded.size == 5
+    match = reloaded.query(items[3]["values"], top_k=1)["matches"][0]
+    assert match["id"] == "p3"
+    assert match["metadata"]["title"] == "item 3"
+    assert match["score"] == pytest.approx(1.0, abs=1e-2)
+
+
+@pytest.mark.parametrize("storage", STORAGE_MODES)
+def test_upsert_while_saving(tmp_path, storage):
+    items = vectors(6, 8)
+    store = LocalStore(path=str(tmp_path), dimension=8, storage=storage, save_interval=3600)
+    store.upsert(items[:4])
+
+    writing, release = threading.Event(), threading.Event()
+    write = store._write
+
+    def slow_write(snapshot):
+        writing.set()
+        release.wait(5)
+        write(snapshot)
+
+    store._write = slow_write
+    saver = threading.Thread(target=store.save)
+    saver.start()
+    assert writing.wait(5)
+    # The lock is free while the files are written
+    store.upsert(items[4:])
+    assert store.query(items[5]["values"], top_k=1)["matches"][0]["id"] == "p5"
+    release.set()
+    saver.join()
+
+    # The save wrote the rows it snapshotted, the later ones wait for the next save
+    with open(tmp_path / "items.json", encoding="utf-8") as f:
+        assert json.load(f)["ids"] == ["p0", "p1", "p2", "p3"]
+    assert store.dirty
+    store._write = write
+    store.save()
+    assert LocalStore(path=str(tmp_path), dimension=8, storage=storage, save_interval=3600).size == 6
+
+
+def test_pq_trains_outside_the_lock(tmp_path, monkeypatch):
+    items = vectors(300, 8)
+    training, release = threading.Event(), threading.Event()
+    train = vector_store.train_pq
+
+    def slow_train(sample, subspaces):
+        training.set()
+        release.wait(5)
+        return train(sample, subspaces, iterations=2)
+
+    monkeypatch.setattr(vector_store, "train_pq", slow_train)
+    store = LocalStore(path=str(tmp_path), dimension=8, storage="pq", pq_subspaces=4, pq_train_size=256,
+                       save_interval=3600)
+    store.upsert(items[:256])
+    trainer = store.training
+    assert training.wait(5)
+    # Upserts and queries go on against the exact vectors meanwhile
+    store.upsert(items[256:])
+    assert store.query(items[299]["values"], top_k=1)["matches"][0]["id"] == "p299"
+    assert store.codebooks is None
+    release.set()
+    trainer.join(5)
+
+    assert store.codebooks is not None
+    # Rows stored during training are encoded too
+    np.testing.assert_array_equal(store.vectors[:store.size], encode_pq(store.exact.view(), store.codebooks))
+
+
+def test_compaction_keeps_saved_files_aligned(tmp_path):
+    items = vectors(8, 8)
+    store = LocalStore(path=str(tmp_path), dimension=8, storage="float16", save_interval=3600)
+    store.upsert(items)
+    store.save()
+    store.delete(["p0", "p1", "p2", "p3"])
+
+    replace = store._replace
+
+    def failed_replace(files):
+        raise OSError("disk full")
+
+    store._replace = failed_replace
+    with pytest.raises(OSError):
+        store.save()
+    # The compacted exact.f32 isn't swapped in without the items.json that matches it
+    saved = LocalStore(path=str(tmp_path), dimension=8, storage="float16", save_interval=3600)
+    assert saved.size == 8
+    assert saved.query(items[5]["values"], top_k=1)["matches"][0]["score"] == pytest.approx(1.0, abs=1e-2)
+    saved.exact.close()
+
+    store._replace = replace
+    store.upsert(vectors(9, 8)[8:])
+    store.save()
+    reloaded = LocalStore(path=str(tmp_path), dimension=8, storage="float16", save_interval=3600)
+    assert reloaded.size == 5
+    for item in items[4:] + vectors(9, 8)[8:]:
+        match = reloaded.query(item["values"], top_k=1)["matches"][0]
+        assert match["id"] == item["id"]
+        assert match["score"] == pytest.approx(1.0, abs=1e-2)
+
+
+@pytest.mark.parametrize("storage, hnsw_threshold", [(storage, 50000) for storage in STORAGE_MODES] + [("float32", 100)])
+def test_query_many_matches_query(tmp_path, storage, hnsw_threshold):
+    if hnsw_threshold == 100:
+        pytest.importorskip("hnswlib")
+    items = vectors(300, 8)
+    store = LocalStore(path=str(tmp_path), dimension=8, storage=storage, hnsw_threshold=hnsw_threshold,
+                       pq_subspaces=4, pq_train_size=256, save_interval=3600)
+    store.upsert(items)
+    if store.training is not None:
+        store.training.join(30)
+    store.delete(["p1", "p2"])
+    queries = [item["values"] for item in items[:20]]
+    batched = store.query_many(queries, top_k=5)
+    assert len(batched) == 20
+    for query, result in zip(queries, batched):
+        expected = store.query(query, top_k=5)["matches"]
+        assert [match["id"] for match in result["matches"]] == [match["id"] for match in expected]
+        assert [match["score"] for match in result["matches"]] == pytest.approx([match["score"] for match in expected],
+                                                                                abs=1e-5)
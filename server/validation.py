@@ -0,0 +1,101 @@
+"""
+Request body checks shared by the Flask handlers and the ASGI ones in
+async_handlers.py, so both apps accept and reject the same requests.
+
+Each read_* function takes the parsed JSON body and returns a pair: the
+fields it needs and None, or None and the error body to answer with 400.
+"""
+from metadata_filter import build_filter
+
+FILTER_ERROR = {"error": "min_price, max_price and min_rating must be numbers"}
+
+
+def filters_from(data):
+    """
+    Reads the optional min_price, max_price and min_rating bounds of a request.
+
+    Returns:
+        dict: The metadata filter for the index, or None without bounds.
+
+    Raises:
+        ValueError: If a bound is not a number.
+    """
+    bounds = [data.get(name) for name in ('min_price', 'max_price', 'min_rating')]
+    return build_filter(*[None if bound in (None, "") else bound for bound in bounds])
+
+
+def read_registration(data):
+    user = data.get('user')
+    if not user:
+        return None, {"message": "No user data provided"}
+    name = user.get('name')
+    email = user.get('email')
+    password = user.get('password')
+    if not (name and email and password):
+        return None, {"message": "All fields are required"}
+    return (name, email, password), None
+
+
+def read_credentials(data):
+    email = data.get('email')
+    password = data.get('password')
+    if not (email and password):
+        return None, {"message": "Email and password are required"}
+    return (email, password), None
+
+
+def read_email(data):
+    email = data.get('email')
+    if not email:
+        return None, {"message": "Email is required"}
+    return email, None
+
+
+def read_favourite(data):
+    email = data.get('email')
+    product = data.get('product')
+    if not (email and product):
+        return None, {"message": "Email and product are required"}
+    return (email, product), None
+
+
+def read_removal(data):
+    email = data.get('email')
+    # The product's URL identifies it in the list
+    product_url = data.get('product_url')
+    if not (email and product_url):
+        return None, {"message": "Email and product URL are required"}
+    return (email, product_url), None
+
+
+def read_query(data):
+    """
+    Reads the body of the recommend endpoints.
+
+    Returns:
+        tuple: ((user query, email, filters), None), or (None, error body).
+    """
+    user_query = data.get('query', '')
+    email = data.get('email', '')
+    if not (user_query and email):
+        return None, {"error": "No query/email provided"}
+    try:
+        return (user_query, email, filters_from(data)), None
+    except (TypeError, ValueError):
+        return None, FILTER_ERROR
+
+
+def read_recommendation_request(data):
+    """
+    Reads the body of /get_recommendations.
+
+    Returns:
+        tuple: ((email, filters), None), or (None, error body).
+    """
+    email, error = read_email(data)
+    if error:
+        return None, error
+    try:
+        return (email, filters_from(data)), None
+    except (TypeError, ValueError):
+        return None, FILTER_ERROR
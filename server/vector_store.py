@@ -0,0 +1,773 @@
+"""
+Vector store backends behind one small interface.
+
+PineconeStore wraps the serverless Pinecone index the app has always used.
+LocalStore keeps the catalog in process: exact NumPy search for small
+catalogs and an HNSW graph (hnswlib) once it grows past HNSW_THRESHOLD,
+persisted to a directory on disk. Both score with cosine similarity and
+return matches in the same shape, so the backend is picked by config:
+
+    VECTOR_BACKEND=pinecone|local
+
+LocalStore can also keep float16 or product-quantized vectors in memory,
+with the exact float32 ones on disk for re-ranking:
+
+    LOCAL_VECTOR_STORAGE=float32|float16|pq
+"""
+import atexit
+import json
+import os
+import threading
+import time
+import numpy as np
+from metadata_table import MetadataTable
+from metadata_filter import filter_mask
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+INDEX_NAME = os.getenv("PINECONE_INDEX", "products")
+DIMENSION = 768
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "local_index")
+HNSW_THRESHOLD = int(os.getenv("HNSW_THRESHOLD", 50000))
+# Seconds between automatic saves of the local index
+LOCAL_SAVE_INTERVAL = int(os.getenv("LOCAL_SAVE_INTERVAL", 30))
+# float32, float16 or pq, see LocalStore
+LOCAL_VECTOR_STORAGE = os.getenv("LOCAL_VECTOR_STORAGE", "float32")
+STORAGE_MODES = ("float32", "float16", "pq")
+# Bytes per vector with pq storage, must divide the dimension
+PQ_SUBSPACES = int(os.getenv("PQ_SUBSPACES", 96))
+# PQ codebooks are trained once this many vectors are stored, until then the exact vectors are scanned
+PQ_TRAIN_SIZE = int(os.getenv("PQ_TRAIN_SIZE", 10000))
+PQ_TRAIN_SAMPLE = 20000
+PQ_ITERATIONS = 12
+# Shortlist from compact storage that is re-ranked against the float32 vectors
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 100))
+# Rows scored at a time, bounds the temporaries of a scan
+CHUNK_ROWS = 16384
+# Scores held at once when query_many scans a batch, 16 MB of float32
+SCORE_BATCH = 4 * 1024 * 1024
+
+
+class VectorStore:
+    """
+    The calls the app makes on a vector index, mirroring Pinecone's Index API.
+    """
+
+    def upsert(self, vectors):
+        """Inserts or overwrites [{"id", "values", "metadata"}, ...]."""
+        raise NotImplementedError
+
+    def query(self, vector, top_k, include_metadata=True, filter=None):
+        """
+        Returns {"matches": [{"id", "score", "metadata"}, ...]} sorted by cosine score.
+        filter is a Pinecone-style metadata filter applied before ranking.
+        """
+        raise NotImplementedError
+
+    def query_many(self, vectors, top_k, include_metadata=True, filter=None):
+        """
+        Returns the results of query for each of vectors, in order. Stores
+        that can score a batch in one pass override it.
+        """
+        return [self.query(vector, top_k, include_metadata, filter) for vector in vectors]
+
+    def fetch(self, ids):
+        """Returns {id: {"id", "values", "metadata"}} for the ids that exist."""
+        raise NotImplementedError
+
+    def delete(self, ids):
+        raise NotImplementedError
+
+    def list_ids(self, page_size=100):
+        """Yields the stored ids in pages of at most page_size."""
+        raise NotImplementedError
+
+
+class PineconeStore(VectorStore):
+    def __init__(self, api_key, index_name=INDEX_NAME, dimension=DIMENSION):
+        from pinecone import Pinecone, ServerlessSpec
+
+        pc = Pinecone(api_key=api_key)
+        # Define and initialize the Pinecone index
+        if not pc.has_index(index_name):
+            pc.create_index(
+                name=index_name,
+                dimension=dimension,
+                metric="cosine",
+                spec=ServerlessSpec(
+                    cloud='aws',
+                    region='us-east-1'
+                )
+            )
+        while not pc.describe_index(index_name).status['ready']:
+            time.sleep(1)
+        self.index = pc.Index(index_name)
+
+    def upsert(self, vectors):
+        self.index.upsert(vectors=vectors)
+
+    def query(self, vector, top_k, include_metadata=True, filter=None):
+        response = self.index.query(vector=vector, top_k=top_k, include_metadata=include_metadata, filter=filter)
+        return {
+            "matches": [
+                {"id": match["id"], "score": match["score"], "metadata": match.get("metadata") or {}}
+                for match in response["matches"]
+            ]
+        }
+
+    def fetch(self, ids):
+        vectors = self.index.fetch(ids=list(ids)).vectors
+        return {
+            vector_id: {"id": vector_id, "values": list(vector.values), "metadata": vector.metadata or {}}
+            for vector_id, vector in vectors.items()
+        }
+
+    def delete(self, ids):
+        self.index.delete(ids=list(ids))
+
+    def list_ids(self, page_size=100):
+        for ids in self.index.list(limit=page_size):
+            yield list(ids)
+
+
+def nearest_centroids(vectors, centroids):
+    distances = (centroids ** 2).sum(axis=1) - 2 * vectors @ centroids.T
+    return distances.argmin(axis=1)
+
+
+def train_pq(vectors, subspaces, iterations=PQ_ITERATIONS, seed=0):
+    """
+    Learns one 256-centroid k-means codebook per subspace.
+
+    Returns:
+        np.ndarray: Codebooks shaped (subspaces, 256, dimension // subspaces).
+    """
+    rng = np.random.default_rng(seed)
+    dimension = vectors.shape[1]
+    width = dimension // subspaces
+    codebooks = np.empty((subspaces, 256, width), dtype=np.float32)
+    for m in range(subspaces):
+        x = np.ascontiguousarray(vectors[:, m * width:(m + 1) * width], dtype=np.float32)
+        centroids = x[rng.choice(len(x), 256, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = nearest_centroids(x, centroids)
+            counts = np.bincount(assignment, minlength=256)
+            for d in range(width):
+                sums = np.bincount(assignment, weights=x[:, d], minlength=256)
+                centroids[counts > 0, d] = sums[counts > 0] / counts[counts > 0]
+            # Re-seed empty clusters so no code is wasted
+            empty = np.flatnonzero(counts == 0)
+            if len(empty):
+                centroids[empty] = x[rng.choice(len(x), len(empty), replace=False)]
+        codebooks[m] = centroids
+    return codebooks
+
+
+def encode_pq(vectors, codebooks):
+    subspaces, _, width = codebooks.shape
+    codes = np.empty((len(vectors), subspaces), dtype=np.uint8)
+    for m in range(subspaces):
+        codes[:, m] = nearest_centroids(np.asarray(vectors[:, m * width:(m + 1) * width], dtype=np.float32),
+                                        codebooks[m])
+    return codes
+
+
+def adc_scores(query, codebooks, codes):
+    """
+    Asymmetric distance computation: the query stays exact, each code is
+    replaced by the query's dot product with its centroid, looked up in a
+    (subspaces, 256) table built once per query.
+    """
+    subspaces, _, width = codebooks.shape
+    table = np.einsum("mkd,md->mk", codebooks, query.reshape(subspaces, width))
+    scores = np.zeros(len(codes), dtype=np.float32)
+    for m in range(subspaces):
+        scores += table[m][codes[:, m]]
+    return scores
+
+
+class ExactVectors:
+    """
+    Full-precision float32 rows appended to a raw file and read back through
+    a memory map, so compact storage only keeps its codes in RAM. They are
+    used to re-rank candidates, for fetch and to retrain PQ.
+    """
+
+    def __init__(self, path, dimension, rows=None):
+        self.path = path
+        # Where the rows are read from and appended to: path, or its compacted rewrite until a save swaps it in
+        self.current = path
+        self.dimension = dimension
+        self.row_bytes = 4 * dimension
+        self.file = open(path, "ab")
+        available = os.path.getsize(path) // self.row_bytes
+        self.rows = available if rows is None else min(rows, available)
+        # Rows written after the last save, or a torn write, aren't in items.json
+        self.file.truncate(self.rows * self.row_bytes)
+        self.map = None
+
+    def append(self, values):
+        self.file.write(np.ascontiguousarray(values, dtype=np.float32).tobytes())
+        self.file.flush()
+        self.rows += len(values)
+        self.map = None
+
+    def view(self):
+        if self.map is None:
+            if self.rows == 0:
+                return np.zeros((0, self.dimension), dtype=np.float32)
+            self.map = np.memmap(self.current, dtype=np.float32, mode="r", shape=(self.rows, self.dimension))
+        return self.map
+
+    def take(self, rows):
+        """
+        Keeps only the given rows, in that order, in a rewrite of the file.
+        path is left as it is until swap(), so it stays aligned with the
+        saved items.json.
+        """
+        view = self.view()
+        tmp_path = self.path + ".tmp"
+        # Written aside first, the current file may be an earlier rewrite that was never swapped in
+        next_path = tmp_path + ".next"
+        with open(next_path, "wb") as f:
+            for start in range(0, len(rows), CHUNK_ROWS):
+                f.write(np.ascontiguousarray(view[rows[start:start + CHUNK_ROWS]]).tobytes())
+        self.map = None
+        self.file.close()
+        os.replace(next_path, tmp_path)
+        self.current = tmp_path
+        self.file = open(tmp_path, "ab")
+        self.rows = len(rows)
+
+    def rewritten(self):
+        """
+        Returns:
+            str: The rewrite to swap in on the next save, None if there is none.
+        """
+        return self.current if self.current != self.path else None
+
+    def swap(self):
+        os.replace(self.current, self.path)
+        self.current = self.path
+        self.map = None
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.map = None
+        self.file.close()
+
+
+class LocalStore(VectorStore):
+    """
+    In-process cosine index persisted under path.
+
+    Vectors are L2-normalized on insert so cosine similarity is a dot
+    product. Deleted or overwritten rows are tombstoned and reclaimed when
+    the index is saved or loaded. Metadata lives in a MetadataTable.
+
+    storage picks how vectors are held in memory:
+        float32  exact, switches to HNSW past hnsw_threshold
+        float16  half the memory, slower scans (NumPy upcasts each chunk)
+        pq       pq_subspaces bytes per vector, scored by ADC
+    The compact modes keep the float32 vectors on disk in exact.f32 and
+    re-rank the best rerank_candidates against them. They always scan,
+    since HNSW would hold another float32 copy in memory. PQ codebooks are
+    trained on a background thread once pq_train_size vectors are stored.
+
+    Upserts save at most every save_interval seconds on a background
+    thread; the files are written outside the lock from a snapshot. Only
+    one process may write to path: each process holds its own copy of the
+    index and saves it over the others', so multi-worker servers should
+    use Pinecone or route writes through a single process.
+    """
+
+    def __init__(self, path=LOCAL_INDEX_PATH, dimension=DIMENSION, hnsw_threshold=HNSW_THRESHOLD,
+                 save_interval=LOCAL_SAVE_INTERVAL, storage=LOCAL_VECTOR_STORAGE, pq_subspaces=PQ_SUBSPACES,
+                 pq_train_size=PQ_TRAIN_SIZE, rerank_candidates=RERANK_CANDIDATES):
+        if storage not in STORAGE_MODES:
+            raise ValueError(f"Unknown vector storage: {storage}")
+        self.path = path
+        self.dimension = dimension
+        self.storage = storage
+        self.hnsw_threshold = hnsw_threshold if storage == "float32" else float("inf")
+        self.save_interval = save_interval
+        self.pq_subspaces = pq_subspaces
+        # k-means needs at least one vector per centroid
+        self.pq_train_size = max(pq_train_size, 256)
+        self.rerank_candidates = rerank_candidates
+        self.lock = threading.RLock()
+        # Serializes saves, taken before self.lock
+        self.save_lock = threading.Lock()
+        self.saving = False
+        # The thread training PQ codebooks, see _train_pq_in_background
+        self.training = None
+        self.codebooks = None
+        self.exact = None
+        self.vectors = self._empty(0)
+        self.alive = np.zeros(0, dtype=bool)
+        self.ids = []
+        self.metadata = MetadataTable()
+        self.rows = {}
+        self.size = 0
+        self.hnsw = None
+        self.dirty = False
+        self.saved_at = time.monotonic()
+        self.load()
+        if storage != "float32" and self.exact is None:
+            os.makedirs(path, exist_ok=True)
+            self.exact = ExactVectors(os.path.join(path, "exact.f32"), self.dimension, rows=0)
+        atexit.register(self.save)
+
+    # Storage
+
+    def _empty(self, capacity):
+        if self.storage == "pq":
+            return np.zeros((capacity, self.pq_subspaces), dtype=np.uint8)
+        dtype = np.float16 if self.storage == "float16" else np.float32
+        return np.zeros((capacity, self.dimension), dtype=dtype)
+
+    def _grow(self, needed):
+        capacity = len(self.vectors)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+        grown = self._empty(capacity)
+        grown[:self.size] = self.vectors[:self.size]
+        self.vectors = grown
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self.size] = self.alive[:self.size]
+        self.alive = alive
+        if self.hnsw is not None:
+            self.hnsw.resize_index(capacity)
+
+    def _normalize(self, values):
+        values = np.asarray(values, dtype=np.float32)
+        norms = np.linalg.norm(values, axis=-1, keepdims=True)
+        return values / np.maximum(norms, 1e-12)
+
+    def _store(self, start, values):
+        if self.exact is not None:
+            self.exact.append(values)
+        if self.storage != "pq":
+            self.vectors[start:start + len(values)] = values
+        elif self.codebooks is not None:
+            self.vectors[start:start + len(values)] = encode_pq(values, self.codebooks)
+
+    def upsert(self, vectors):
+        if not vectors:
+            return
+        # The last copy of an id in a batch wins, like repeated upserts
+        vectors = list({vector["id"]: vector for vector in vectors}.values())
+        with self.lock:
+            values = self._normalize([vector["values"] for vector in vectors])
+            self._grow(self.size + len(vectors))
+            start = self.size
+            self._store(start, values)
+            for offset, vector in enumerate(vectors):
+                row = start + offset
+                old_row = self.rows.get(vector["id"])
+                if old_row is not None:
+                    self._tombstone(old_row)
+                self.alive[row] = True
+                self.ids.append(vector["id"])
+                self.metadata.append(vector.get("metadata"))
+                self.rows[vector["id"]] = row
+            self.size += len(vectors)
+
+            if self.hnsw is not None:
+                self.hnsw.add_items(values, np.arange(start, self.size))
+            elif len(self.rows) >= self.hnsw_threshold:
+                self._build_hnsw()
+            if (self.storage == "pq" and self.codebooks is None and self.training is None
+                    and len(self.rows) >= self.pq_train_size):
+                self.training = threading.Thread(target=self._train_pq_in_background, args=(self._pq_sample(),),
+                                                 name="local-index-pq", daemon=True)
+                self.training.start()
+            self.dirty = True
+            if time.monotonic() - self.saved_at > self.save_interval and not self.saving:
+                self.saving = True
+                threading.Thread(target=self._save_in_background, name="local-index-save", daemon=True).start()
+
+    def _tombstone(self, row):
+        # The metadata row stays in the table until the next compaction
+        self.alive[row] = False
+        self.ids[row] = None
+        if self.hnsw is not None:
+            self.hnsw.mark_deleted(row)
+
+    def tombstones(self):
+        return self.size - len(self.rows)
+
+    def delete(self, ids):
+        with self.lock:
+            for vector_id in ids:
+                row = self.rows.pop(vector_id, None)
+                if row is not None:
+                    self._tombstone(row)
+                    self.dirty = True
+
+    def _exact_vectors(self):
+        return self.vectors if self.exact is None else self.exact.view()
+
+    def fetch(self, ids):
+        with self.lock:
+            exact = self._exact_vectors()
+            result = {}
+            for vector_id in ids:
+                row = self.rows.get(vector_id)
+                if row is not None:
+                    result[vector_id] = {
+                        "id": vector_id,
+                        "values": np.asarray(exact[row], dtype=np.float32).tolist(),
+                        "metadata": self.metadata.get(row)
+                    }
+            return result
+
+    def list_ids(self, page_size=100):
+        with self.lock:
+            ids = [vector_id for vector_id in self.ids[:self.size] if vector_id is not None]
+        for i in range(0, len(ids), page_size):
+            yield ids[i:i + page_size]
+
+    def _pq_sample(self):
+        live_rows = np.array(sorted(self.rows.values()), dtype=np.int64)
+        sample = np.random.default_rng(0).choice(live_rows, min(len(live_rows), PQ_TRAIN_SAMPLE), replace=False)
+        return np.array(self.exact.view()[np.sort(sample)])
+
+    def _train_pq(self):
+        self._use_codebooks(train_pq(self._pq_sample(), self.pq_subspaces))
+
+    def _train_pq_in_background(self, sample):
+        """
+        Trains on a sample copied under the lock, so upserts and queries go on
+        meanwhile against the exact vectors, then encodes every row stored by then.
+        """
+        try:
+            codebooks = train_pq(sample, self.pq_subspaces)
+            with self.lock:
+                self._use_codebooks(codebooks)
+        except Exception as e:
+            print(f"PQ training failed: {e}")
+        finally:
+            self.training = None
+
+    def _use_codebooks(self, codebooks):
+        self.codebooks = codebooks
+        exact = self.exact.view()
+        for start in range(0, self.size, CHUNK_ROWS):
+            end = min(start + CHUNK_ROWS, self.size)
+            self.vectors[start:end] = encode_pq(exact[start:end], self.codebooks)
+        self.dirty = True
+
+    # Search
+
+    def _build_hnsw(self):
+        try:
+            import hnswlib
+        except ImportError:
+            # Without hnswlib large catalogs are still searched exactly, just slower
+            return
+        hnsw = hnswlib.Index(space="cosine", dim=self.dimension)
+        hnsw.init_index(max_elements=len(self.vectors), ef_construction=200, M=16)
+        hnsw.set_ef(128)
+        live_rows = np.array(sorted(self.rows.values()), dtype=np.int64)
+        if len(live_rows):
+            hnsw.add_items(self.vectors[live_rows], live_rows)
+        self.hnsw = hnsw
+
+    def _approximate_scores(self, query):
+        pq = self.storage == "pq" and self.codebooks is not None
+        # Until PQ is trained the catalog is small enough to scan the exact vectors
+        source = self.vectors if self.storage == "float16" or pq else self._exact_vectors()
+        scores = np.empty(self.size, dtype=np.float32)
+        for start in range(0, self.size, CHUNK_ROWS):
+            end = min(start + CHUNK_ROWS, self.size)
+            if pq:
+                scores[start:end] = adc_scores(query, self.codebooks, self.vectors[start:end])
+            else:
+                scores[start:end] = np.asarray(source[start:end], dtype=np.float32) @ query
+        return scores
+
+    def _best(self, scores, top_k, allowed):
+        # Tombstoned and filtered out rows never win
+        scores[~allowed] = -np.inf
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        return candidates[np.argsort(-scores[candidates])]
+
+    def _search_hnsw(self, query, top_k, allowed):
+        if allowed is None:
+            labels, distances = self.hnsw.knn_query(query, k=top_k)
+        else:
+            try:
+                labels, distances = self.hnsw.knn_query(query, k=top_k, filter=lambda row: bool(allowed[row]))
+            except (TypeError, RuntimeError):
+                # Older hnswlib without filters, or fewer matches in the graph than asked for
+                return None
+        return labels[0].tolist(), (1 - distances[0]).tolist()
+
+    def _search(self, query, top_k, metadata_filter=None):
+        allowed = self.alive[:self.size]
+        if metadata_filter:
+            allowed = allowed & filter_mask(self.metadata, metadata_filter)
+            live = int(allowed.sum())
+        else:
+            live = len(self.rows)
+        if live == 0:
+            return [], []
+        top_k = min(top_k, live)
+        if self.hnsw is not None:
+            found = self._search_hnsw(query, top_k, allowed if metadata_filter else None)
+            if found is not None:
+                return found
+
+        if self.exact is None:
+            scores = self.vectors[:self.size] @ query
+            candidates = self._best(scores, top_k, allowed)
+            return candidates.tolist(), scores[candidates].tolist()
+
+        # Compact storage: shortlist by approximate score, then re-rank exactly
+        candidates = self._best(self._approximate_scores(query), min(max(top_k, self.rerank_candidates), live),
+                                allowed)
+        candidates = np.sort(candidates)  # sequential reads from the memory map
+        exact_scores = np.asarray(self.exact.view()[candidates]) @ query
+        order = np.argsort(-exact_scores)[:top_k]
+        return candidates[order].tolist(), exact_scores[order].tolist()
+
+    def _search_many(self, queries, top_k):
+        """
+        _search for a batch of unfiltered queries. The HNSW graph and the
+        float32 scan answer the whole batch in one pass over the index, the
+        compact modes re-rank each query on its own.
+        """
+        live = len(self.rows)
+        if live == 0:
+            return [([], [])] * len(queries)
+        top_k = min(top_k, live)
+        if self.hnsw is not None:
+            labels, distances = self.hnsw.knn_query(queries, k=top_k)
+            return [(row_labels.tolist(), (1 - row_distances).tolist())
+                    for row_labels, row_distances in zip(labels, distances)]
+        if self.exact is not None:
+            return [self._search(query, top_k) for query in queries]
+
+        allowed = self.alive[:self.size]
+        found = []
+        # Queries scored per pass, bounds the score matrix to SCORE_BATCH floats
+        group = max(1, SCORE_BATCH // max(self.size, 1))
+        for start in range(0, len(queries), group):
+            for scores in queries[start:start + group] @ self.vectors[:self.size].T:
+                candidates = self._best(scores, top_k, allowed)
+                found.append((candidates.tolist(), scores[candidates].tolist()))
+        return found
+
+    def _matches(self, rows, scores, include_metadata):
+        return {
+            "matches": [
+                {
+                    "id": self.ids[row],
+                    "score": float(score),
+                    "metadata": self.metadata.get(row) if include_metadata else {}
+                }
+                for row, score in zip(rows, scores)
+            ]
+        }
+
+    def query(self, vector, top_k, include_metadata=True, filter=None):
+        query = self._normalize(vector)
+        with self.lock:
+            return self._matches(*self._search(query, top_k, filter), include_metadata)
+
+    def query_many(self, vectors, top_k, include_metadata=True, filter=None):
+        if filter or not len(vectors):
+            return super().query_many(vectors, top_k, include_metadata, filter)
+        queries = self._normalize(np.asarray(vectors, dtype=np.float32).reshape(len(vectors), self.dimension))
+        with self.lock:
+            return [self._matches(rows, scores, include_metadata) for rows, scores in self._search_many(queries, top_k)]
+
+    def memory_bytes(self):
+        """
+        Bytes held in memory by vectors, codes and metadata, ids excluded.
+        """
+        with self.lock:
+            codebooks = self.codebooks.nbytes if self.codebooks is not None else 0
+            return self.vectors[:self.size].nbytes + codebooks + self.metadata.nbytes()
+
+    # Persistence
+
+    def _reset(self, stored, ids, metadata):
+        self.vectors = self._empty(0)
+        self.alive = np.zeros(0, dtype=bool)
+        self.size = 0
+        self.hnsw = None
+        self._grow(len(ids))
+        if stored is not None:
+            self.vectors[:len(ids)] = stored
+        self.alive[:len(ids)] = [vector_id is not None for vector_id in ids]
+        self.ids = ids
+        self.metadata = metadata
+        self.rows = {vector_id: row for row, vector_id in enumerate(ids) if vector_id is not None}
+        self.size = len(ids)
+        if len(self.rows) >= self.hnsw_threshold:
+            self._build_hnsw()
+
+    def _compact(self):
+        live_rows = sorted(self.rows.values())
+        if self.exact is not None:
+            self.exact.take(live_rows)
+        self._reset(
+            self.vectors[live_rows],
+            [self.ids[row] for row in live_rows],
+            self.metadata.take(live_rows)
+        )
+
+    def _replace(self, files):
+        # Replace the files only once they are all fully written, items.json last
+        for name, tmp_path in files:
+            if name == "exact.f32":
+                # Queries read the rewrite by its name until it is swapped in
+                with self.lock:
+                    self.exact.swap()
+            else:
+                os.replace(tmp_path, os.path.join(self.path, name))
+
+    def _save_in_background(self):
+        try:
+            self.save()
+        finally:
+            self.saving = False
+
+    def _snapshot(self):
+        """
+        Copies what save() writes, so the files can be written without holding the lock.
+        Stored rows are never modified in place except by PQ training, so only codes are copied.
+        """
+        snapshot = {"dimension": self.dimension, "storage": self.storage, "arrays": [], "exact": None}
+        if self.exact is None:
+            rows = sorted(self.rows.values())
+            # Fancy indexing copies, but only later, outside the lock
+            snapshot["vectors"] = (self.vectors, rows)
+        else:
+            # Tombstones are kept so rows stay aligned with exact.f32
+            rows = range(self.size)
+            snapshot["vectors"] = None
+            snapshot["exact"] = self.exact.rewritten()
+            self.exact.file.flush()
+            if self.codebooks is not None:
+                snapshot["arrays"] = [("codebooks.npy", self.codebooks), ("codes.npy", self.vectors[:self.size].copy())]
+        snapshot["rows"] = rows
+        snapshot["ids"] = [self.ids[row] for row in rows]
+        snapshot["metadata"] = self.metadata.copy()
+        return snapshot
+
+    def _write(self, snapshot):
+        os.makedirs(self.path, exist_ok=True)
+        items_tmp = os.path.join(self.path, "items.tmp.json")
+        files = []
+        if snapshot["vectors"] is not None:
+            vectors, rows = snapshot["vectors"]
+            vectors_tmp = os.path.join(self.path, "vectors.tmp.npy")
+            np.save(vectors_tmp, vectors[rows])
+            files.append(("vectors.npy", vectors_tmp))
+        else:
+            self.exact.sync()
+            if snapshot["exact"] is not None:
+                files.append(("exact.f32", snapshot["exact"]))
+        for name, array in snapshot["arrays"]:
+            tmp_path = os.path.join(self.path, name.replace(".npy", ".tmp.npy"))
+            np.save(tmp_path, array)
+            files.append((name, tmp_path))
+        metadata = snapshot["metadata"]
+        with open(items_tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "dimension": snapshot["dimension"],
+                "storage": snapshot["storage"],
+                "ids": snapshot["ids"],
+                "metadata": [metadata.get(row) if vector_id is not None else None
+                             for row, vector_id in zip(snapshot["rows"], snapshot["ids"])]
+            }, f)
+        files.append(("items.json", items_tmp))
+        self._replace(files)
+
+    def save(self):
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                # Reclaim tombstoned rows once they are a quarter of the index
+                if self.tombstones() * 4 > self.size:
+                    self._compact()
+                snapshot = self._snapshot()
+                self.dirty = False
+            try:
+                self._write(snapshot)
+            except BaseException:
+                self.dirty = True
+                raise
+            self.saved_at = time.monotonic()
+
+    def load(self):
+        items_path = os.path.join(self.path, "items.json")
+        if not os.path.exists(items_path):
+            return
+        with open(items_path, encoding="utf-8") as f:
+            items = json.load(f)
+        with self.lock:
+            self.dimension = items["dimension"]
+            ids = items["ids"]
+            metadata = MetadataTable(items["metadata"])
+            saved_storage = items.get("storage", "float32")
+            if saved_storage == "float32":
+                source = np.load(os.path.join(self.path, "vectors.npy"), mmap_mode="r")
+            else:
+                exact = ExactVectors(os.path.join(self.path, "exact.f32"), self.dimension, rows=len(ids))
+                if exact.rows < len(ids):
+                    print(f"Local index is missing {len(ids) - exact.rows} vectors, dropping them")
+                    ids = ids[:exact.rows]
+                    metadata = metadata.take(range(exact.rows))
+                source = exact.view()
+
+            if self.storage == "float32":
+                live_rows = [row for row, vector_id in enumerate(ids) if vector_id is not None]
+                self._reset(np.asarray(source[live_rows]), [ids[row] for row in live_rows],
+                            metadata.take(live_rows))
+                if saved_storage != "float32":
+                    exact.close()
+                return
+
+            if saved_storage == "float32":
+                # Switching an exact index to compact storage, write its exact.f32 first
+                exact = ExactVectors(os.path.join(self.path, "exact.f32"), self.dimension, rows=0)
+                for start in range(0, len(ids), CHUNK_ROWS):
+                    exact.append(source[start:start + CHUNK_ROWS])
+            self.exact = exact
+            self._reset(None, ids, metadata)
+            self._load_compact(saved_storage)
+
+    def _load_compact(self, saved_storage):
+        exact = self.exact.view()
+        if self.storage == "float16":
+            for start in range(0, self.size, CHUNK_ROWS):
+                # vectors has spare capacity past size, bound both sides
+                end = min(start + CHUNK_ROWS, self.size)
+                self.vectors[start:end] = exact[start:end]
+            return
+        codebooks_path = os.path.join(self.path, "codebooks.npy")
+        if saved_storage == "pq" and os.path.exists(codebooks_path):
+            codebooks = np.load(codebooks_path)
+            codes = np.load(os.path.join(self.path, "codes.npy"), mmap_mode="r")
+            if codebooks.shape[0] == self.pq_subspaces and len(codes) >= self.size:
+                self.codebooks = codebooks
+                self.vectors[:self.size] = codes[:self.size]
+                return
+        if len(self.rows) >= self.pq_train_size:
+            self._train_pq()
+
+
+def create_vector_store(backend=VECTOR_BACKEND):
+    if backend == "local":
+        return LocalStore()
+    if backend == "pinecone":
+        return PineconeStore(api_key=os.getenv("PINECONE_API_KEY"))
+    raise ValueError(f"Unknown vector backend: {backend}")